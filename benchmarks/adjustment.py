@@ -0,0 +1,96 @@
+import numpy as np
+
+from bias_adjustment import BiasAdjustment
+
+from .data import generate_test_data
+
+METHODS = ["qm", "dqm.rel", "dqm.abs", "qdm.rel", "qdm.abs"]
+DIST_TYPES = ["hist", "gamma", "norm", "lognorm"]
+
+
+class Adjust:
+    """Fit and adjust a single series, for every method and dist_type"""
+
+    params = (METHODS, DIST_TYPES, [10**3, 10**4, 10**5, 10**6, 10**7])
+    param_names = ["method", "dist_type", "size"]
+    timeout = 600
+
+    def setup(self, method, dist_type, size):
+        if dist_type != "hist" and size > 10**6:
+            # scipy MLE fits take minutes at this size
+            raise NotImplementedError
+        self.data = generate_test_data(size)
+
+    def time_adjust(self, method, dist_type, size):
+        BiasAdjustment(self.data["obs"], self.data["modh"]).adjust(
+            self.data["modf"], method=method, dist_type=dist_type
+        )
+
+    def peakmem_adjust(self, method, dist_type, size):
+        BiasAdjustment(self.data["obs"], self.data["modh"]).adjust(
+            self.data["modf"], method=method, dist_type=dist_type
+        )
+
+
+class AdjustOverhead:
+    """Adjust a short series with cached fits: the per-call overhead"""
+
+    params = METHODS
+    param_names = ["method"]
+
+    def setup(self, method):
+        data = generate_test_data(100)
+        self.ba = BiasAdjustment(data["obs"], data["modh"], seed=1)
+        self.data = data["modf"]
+        self.ba.adjust(self.data, method=method, dist_type="empirical")
+
+    def time_adjust(self, method):
+        self.ba.adjust(self.data, method=method, dist_type="empirical")
+
+
+class AdjustGrid:
+    """Fit and adjust (time, cells) grids of daily series"""
+
+    params = (METHODS, [10, 100, 1000])
+    param_names = ["method", "n_cells"]
+    timeout = 600
+
+    def setup(self, method, n_cells):
+        self.data = generate_test_data(3650, n_cells)
+
+    def time_adjust(self, method, n_cells):
+        BiasAdjustment(self.data["obs"], self.data["modh"]).adjust(
+            self.data["modf"], method=method
+        )
+
+    def peakmem_adjust(self, method, n_cells):
+        BiasAdjustment(self.data["obs"], self.data["modh"]).adjust(
+            self.data["modf"], method=method
+        )
+
+
+class Transfer:
+    """Apply fitted transfer functions, without fitting"""
+
+    params = (["hist", "gamma"], [10**5, 10**7])
+    param_names = ["dist_type", "size"]
+    timeout = 300
+
+    def setup(self, dist_type, size):
+        data = generate_test_data(10**4)
+        self.transfer = BiasAdjustment(data["obs"], data["modh"]).transfer(dist_type)
+        self.table = self.transfer.compile()
+        self.chunk = generate_test_data(size)["modf"]
+        self.out = np.empty(size, dtype=np.float32)
+
+    def time_transform(self, dist_type, size):
+        self.transfer.transform(self.chunk)
+
+    def time_transform_out(self, dist_type, size):
+        self.transfer.transform(self.chunk, out=self.out)
+
+    def peakmem_transform_out(self, dist_type, size):
+        self.transfer.transform(self.chunk, out=self.out)
+
+    def time_transform_table(self, dist_type, size):
+        self.table.transform(self.chunk, out=self.out)
@@ -0,0 +1,20 @@
+from scipy.stats import gamma
+
+from bias_adjustment.distributions import Distributions
+
+
+class FitGammaGrid:
+    """Per-cell scipy MLE ("gamma") against batched fits ("gamma.fast")"""
+
+    params = (["gamma", "gamma.fast"], [100, 10_000])
+    param_names = ["dist_type", "n_series"]
+    timeout = 600
+
+    def setup(self, dist_type, n_series):
+        if dist_type == "gamma" and n_series > 100:
+            # hours of scipy fits; extrapolate from 100 series
+            raise NotImplementedError
+        self.data = gamma.rvs(4, scale=7.5, size=(3650, n_series), random_state=1)
+
+    def time_fit(self, dist_type, n_series):
+        Distributions(self.data).fit(dist_type)
@@ -0,0 +1,17 @@
+from scipy.stats import gamma
+
+# gamma parameters of the synthetic series of docs/sample/fig2_canon2015.py
+PARAMS = {
+    "obs": {"k": 4, "scale": 7.5},
+    "modh": {"k": 8.15, "scale": 3.68},
+    "modf": {"k": 16, "scale": 2.63},
+}
+
+
+def generate_test_data(size=1000, n_cells=None, random_state=1):
+    """Synthetic obs, modh and modf series shaped (size,) or (size, n_cells)"""
+    shape = size if n_cells is None else (size, n_cells)
+    return {
+        name: gamma.rvs(p["k"], scale=p["scale"], size=shape, random_state=random_state)
+        for name, p in PARAMS.items()
+    }
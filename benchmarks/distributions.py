@@ -0,0 +1,63 @@
+import numpy as np
+from scipy.stats import gamma
+
+from bias_adjustment.distributions import Distributions
+
+from .data import generate_test_data
+
+
+class FitEmpirical:
+    """Compare the "hist" and "empirical" distribution engines"""
+
+    params = (["hist", "empirical"], [10**4, 10**5, 10**6, 10**7])
+    param_names = ["dist_type", "size"]
+    timeout = 300
+
+    def setup(self, dist_type, size):
+        self.data = gamma.rvs(4, scale=7.5, size=size, random_state=1)
+        self.dist = Distributions(self.data).fit(dist_type)
+        self.q = np.linspace(0, 0.9999, size)
+
+    def time_fit(self, dist_type, size):
+        Distributions(self.data).fit(dist_type)
+
+    def time_cdf(self, dist_type, size):
+        self.dist.cdf(self.data)
+
+    def time_ppf(self, dist_type, size):
+        self.dist.ppf(self.q)
+
+
+class Fit:
+    """Fit every dist_type on series of increasing length"""
+
+    params = (["hist", "gamma", "norm", "lognorm"], [10**3, 10**4, 10**5, 10**6, 10**7])
+    param_names = ["dist_type", "size"]
+    timeout = 600
+
+    def setup(self, dist_type, size):
+        if dist_type != "hist" and size > 10**6:
+            # scipy MLE fits take minutes at this size
+            raise NotImplementedError
+        self.data = generate_test_data(size)["obs"]
+
+    def time_fit(self, dist_type, size):
+        Distributions(self.data).fit(dist_type)
+
+    def peakmem_fit(self, dist_type, size):
+        Distributions(self.data).fit(dist_type)
+
+
+class BestFit:
+    """Rank candidate distributions, with and without screening"""
+
+    params = ([10**3, 10**4, 10**5], [None, 1000])
+    param_names = ["size", "screen_size"]
+    timeout = 600
+
+    def setup(self, size, screen_size):
+        self.data = generate_test_data(size)["obs"]
+        self.candidates = ["gamma", "norm", "lognorm", "weibull_min", "expon"]
+
+    def time_best_fit(self, size, screen_size):
+        Distributions(self.data).best_fit(self.candidates, screen_size=screen_size)
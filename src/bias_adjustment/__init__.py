@@ -1,6 +1,13 @@
-# read version from installed package
-from importlib.metadata import version
 from bias_adjustment.bias_adjustment import BiasAdjustment
+from bias_adjustment.grouping import GroupedAdjustment
 
-__version__ = version("bias_adjustment")
-__all__ = [BiasAdjustment]
+__all__ = [BiasAdjustment, GroupedAdjustment]
+
+
+def __getattr__(name: str):
+    # read version from installed package, on first use only
+    if name == "__version__":
+        from importlib.metadata import version
+
+        return version("bias_adjustment")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,3 @@
+from bias_adjustment.cli import main
+
+raise SystemExit(main())
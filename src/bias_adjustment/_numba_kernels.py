@@ -0,0 +1,207 @@
+"""numba gufuncs of `bias_adjustment.kernels`, imported on first use
+
+The kernels are module-level and non-recursive, so that `cache=True`
+reloads them from disk instead of compiling them in every process.
+"""
+
+import numba as nb
+import numpy as np
+from numba import float64 as f8
+from numba import void
+
+# pending entries of the pairwise summation: 2 per halving of the length
+_STACK_SIZE = 192
+
+
+@nb.njit(cache=True)
+def has_nan(arr):
+    for v in arr:
+        if np.isnan(v):
+            return True
+    return False
+
+
+@nb.njit(cache=True)
+def interp(x, xp, fp, left, right):
+    """`np.interp` of a single value, same arithmetic"""
+    n = len(xp)
+    if np.isnan(x):
+        return x
+    if x < xp[0]:
+        return left
+    if x > xp[n - 1]:
+        return right
+    # last j with xp[j] <= x
+    lo, hi = 0, n
+    while hi - lo > 1:
+        mid = (lo + hi) >> 1
+        if xp[mid] <= x:
+            lo = mid
+        else:
+            hi = mid
+    if lo == n - 1 or xp[lo] == x:
+        return fp[lo]
+    slope = (fp[lo + 1] - fp[lo]) / (xp[lo + 1] - xp[lo])
+    res = slope * (x - xp[lo]) + fp[lo]
+    if np.isnan(res):
+        res = slope * (x - xp[lo + 1]) + fp[lo + 1]
+        if np.isnan(res) and fp[lo] == fp[lo + 1]:
+            res = fp[lo]
+    return res
+
+
+@nb.njit(cache=True)
+def _block_sum(a, start, n):
+    """`np.sum` of at most 128 values, same rounding"""
+    if n < 8:
+        res = 0.0
+        for i in range(start, start + n):
+            res += a[i]
+        return res
+    r = a[start : start + 8].copy()
+    i = 8
+    while i < n - n % 8:
+        for j in range(8):
+            r[j] += a[start + i + j]
+        i += 8
+    res = ((r[0] + r[1]) + (r[2] + r[3])) + ((r[4] + r[5]) + (r[6] + r[7]))
+    for j in range(start + i, start + n):
+        res += a[j]
+    return res
+
+
+@nb.njit(cache=True)
+def pairwise_sum(a):
+    """`np.sum` of `a`, same rounding (numpy's pairwise summation)
+
+    numpy splits the values in halves, rounded down to a multiple of 8,
+    until at most 128 remain; the halves are walked here with a stack.
+    """
+    starts = np.empty(_STACK_SIZE, dtype=np.int64)
+    sizes = np.empty(_STACK_SIZE, dtype=np.int64)
+    # a negative size marks a split whose halves are summed: add them
+    starts[0], sizes[0], top = 0, len(a), 1
+    sums = np.empty(_STACK_SIZE)
+    n_sums = 0
+    while top:
+        top -= 1
+        start, n = starts[top], sizes[top]
+        if n < 0:
+            n_sums -= 1
+            sums[n_sums - 1] += sums[n_sums]
+        elif n <= 128:
+            sums[n_sums] = _block_sum(a, start, n)
+            n_sums += 1
+        else:
+            half = n // 2
+            half -= half % 8
+            starts[top], sizes[top] = start, -1
+            starts[top + 1], sizes[top + 1] = start + half, n - half
+            starts[top + 2], sizes[top + 2] = start, half
+            top += 3
+    return sums[0]
+
+
+@nb.guvectorize(
+    [void(f8[:], f8[:], f8[:], f8[:])],
+    "(t),(m)->(m),(m)",
+    nopython=True,
+    cache=True,
+)
+def hist_table(data, grid, edges, cum):
+    # `grid` only sizes the outputs
+    bins = len(grid) - 1
+    first, last, n = np.inf, -np.inf, 0
+    for v in data:
+        if not np.isnan(v):
+            first = min(first, v)
+            last = max(last, v)
+            n += 1
+    if n == 0:
+        edges[:] = np.nan
+        cum[:] = np.nan
+        return
+    if first == last:
+        first -= 0.5
+        last += 0.5
+    # same edges as `np.linspace`
+    step = (last - first) / bins
+    for i in range(bins):
+        edges[i] = i * step + first
+    edges[bins] = last
+
+    # same bins as `np.histogram`
+    counts = np.zeros(bins)
+    norm = bins / (last - first)
+    for v in data:
+        if np.isnan(v):
+            continue
+        i = min(int((v - first) * norm), bins - 1)
+        if v < edges[i]:
+            i -= 1
+        elif v >= edges[i + 1] and i != bins - 1:
+            i += 1
+        counts[i] += 1.0
+
+    # same arithmetic as `_hist_table`
+    pdf = np.empty(bins)
+    for i in range(bins):
+        width = edges[i + 1] - edges[i]
+        pdf[i] = counts[i] / width / n / width
+        counts[i] = pdf[i] * width
+    total = pairwise_sum(counts)
+    cum[0] = 0.0
+    for i in range(bins):
+        cum[i + 1] = cum[i] + pdf[i] / total * (edges[i + 1] - edges[i])
+
+
+@nb.guvectorize(
+    [void(f8[:], f8[:], f8[:], f8[:], f8[:], f8, f8[:])],
+    "(t),(m),(m),(n),(n),()->(t)",
+    nopython=True,
+    cache=True,
+)
+def qm(data, m_values, m_probs, o_values, o_probs, max_cdf, out):
+    if has_nan(m_values) or has_nan(m_probs) or has_nan(o_values) or has_nan(o_probs):
+        out[:] = np.nan
+        return
+    o_lo, o_hi = o_values[0], o_values[-1]
+    for i in range(len(data)):
+        if np.isnan(data[i]):
+            out[i] = np.nan
+            continue
+        q = min(interp(data[i], m_values, m_probs, 0.0, 1.0), max_cdf)
+        out[i] = interp(q, o_probs, o_values, o_lo, o_hi)
+
+
+@nb.guvectorize(
+    [void(f8[:], f8[:], f8[:], f8[:], f8[:], f8[:], f8[:], f8, f8[:], f8[:])],
+    "(t),(a),(a),(m),(m),(n),(n),()->(t),(t)",
+    nopython=True,
+    cache=True,
+)
+def qdm(
+    data, f_values, f_probs, o_values, o_probs, h_values, h_probs, max_cdf, rel, abs_
+):
+    if (
+        has_nan(f_values)
+        or has_nan(f_probs)
+        or has_nan(o_values)
+        or has_nan(o_probs)
+        or has_nan(h_values)
+        or has_nan(h_probs)
+    ):
+        rel[:] = np.nan
+        abs_[:] = np.nan
+        return
+    o_lo, o_hi, h_lo, h_hi = o_values[0], o_values[-1], h_values[0], h_values[-1]
+    for i in range(len(data)):
+        x = data[i]
+        if np.isnan(x):
+            rel[i] = abs_[i] = np.nan
+            continue
+        q = min(interp(x, f_values, f_probs, 0.0, 1.0), max_cdf)
+        o_ppf = interp(q, o_probs, o_values, o_lo, o_hi)
+        h_ppf = interp(q, h_probs, h_values, h_lo, h_hi)
+        rel[i] = o_ppf * (x / h_ppf)
+        abs_[i] = o_ppf + x - h_ppf
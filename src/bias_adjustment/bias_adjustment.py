@@ -1,12 +1,29 @@
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
 
-from bias_adjustment.const import MAX_CDF, TRACE_VAL
+import numpy as np
+
+from bias_adjustment.const import BINS, CACHE_SIZE, MAX_CDF, TRACE_VAL
+from bias_adjustment.distributions.batched import MaskedDistribution, TableDistribution
+from bias_adjustment.parallel import adjust_many
+from bias_adjustment.profiling import timed
 from bias_adjustment.quantile_mapping import (
     DetrendedQuantileMapping,
     QuantileDeltaMapping,
     QuantileMapping,
+    QuantileTransfer,
+)
+from bias_adjustment.quantile_mapping.tails import TAILS, Tail
+from bias_adjustment.utils import (
+    FloatNDArray,
+    adapt_freq,
+    from_time_major,
+    grid_shape,
+    is_float_ndarray,
+    to_time_major,
+    valid_cells,
 )
-from bias_adjustment.utils import FloatNDArray, is_float_ndarray
 
 
 def _get_ba_mode(method: str):
@@ -22,17 +39,37 @@ class BiasAdjustment:
     mod: FloatNDArray
     max_cdf: float = MAX_CDF
     trace_val: float = TRACE_VAL
+    cache_size: int = CACHE_SIZE
+    axis: int = 0
+    seed: Any = field(default=None, repr=False)
+    adapt_freq: bool = False
+    mask: np.ndarray = field(default=None, repr=False)
+    tail: str = "clip"
+    _cache: OrderedDict = field(default_factory=OrderedDict, init=False, repr=False)
+    _rng: np.random.Generator = field(init=False, repr=False)
+    _mask: np.ndarray = field(default=None, init=False, repr=False)
 
+    @timed("validate")
     def __post_init__(self):
+        if not isinstance(self.axis, int):
+            raise TypeError("`axis` must be an integer.")
+
         for name in ["obs", "mod"]:
             attr = getattr(self, name)
-            if not is_float_ndarray(attr):
+            if not is_float_ndarray(attr) or attr.ndim == 0:
                 raise TypeError(f"`{name}` is not a numpy array.")
+            if not -attr.ndim <= self.axis < attr.ndim:
+                raise ValueError(f"`axis` is out of bounds for `{name}`.")
             min_len = 10
-            if len(attr) < min_len:
+            if attr.shape[self.axis] < min_len:
                 raise ValueError(f"Length of `{name}` must be greater than {min_len}.")
 
-        for name in ["max_cdf"]:
+        if grid_shape(self.obs, self.axis) != grid_shape(self.mod, self.axis):
+            raise ValueError(
+                "`obs` and `mod` must have the same shape except along `axis`."
+            )
+
+        for name in ["max_cdf", "trace_val"]:
             attr = getattr(self, name)
             if not isinstance(attr, float):
                 raise TypeError(f"`{name}` is not a float.")
@@ -40,37 +77,402 @@ class BiasAdjustment:
                 if attr < 0.5 or attr >= 1:
                     raise ValueError((f"`{name}` should be [0.5, 1)."))
 
+        for name in ["cache_size"]:
+            attr = getattr(self, name)
+            if not isinstance(attr, int):
+                raise TypeError(f"`{name}` is not an integer.")
+            if attr < 1:
+                raise ValueError(f"`{name}` must be at least 1.")
+
+        if self.mask is not None:
+            if not (isinstance(self.mask, np.ndarray) and self.mask.dtype == bool):
+                raise TypeError("`mask` is not a boolean numpy array.")
+            if self.obs.ndim == 1 or self.mask.shape != grid_shape(self.obs, self.axis):
+                raise ValueError("`mask` must have the shape of the grid.")
+        if self.tail not in TAILS:
+            raise ValueError(f"`tail` must be one of {TAILS}.")
+        if self.obs.ndim > 1:
+            # cells that are masked, or too sparse to fit, are skipped
+            self._mask = valid_cells(self.obs, self.mod, axis=self.axis, mask=self.mask)
+
+        self._rng = np.random.default_rng(self.seed)
+
+    def _check_data(self, data: FloatNDArray, min_len: int = 10):
+        """Validate data to adjust, once, before the unchecked computations"""
+        if not is_float_ndarray(data) or data.ndim == 0:
+            raise TypeError("`data` is not a numpy array.")
+        if not -data.ndim <= self.axis < data.ndim:
+            raise ValueError("`axis` is out of bounds for `data`.")
+        if data.shape[self.axis] < min_len:
+            raise ValueError(f"Length of `data` must be greater than {min_len}.")
+        if grid_shape(data, self.axis) != grid_shape(self.obs, self.axis):
+            raise ValueError(
+                "`obs`, `mod` and `data` must have the same shape except along `axis`."
+            )
+
+    def fit(self, dist_type="hist", ignore_trace: bool = False, bins: int = BINS):
+        """Fit the obs and mod distributions, reusing cached fits
+
+        Fits are cached by (`dist_type`, `ignore_trace`, `bins`, `trace_val`); the
+        least recently used entry is evicted once `cache_size` is exceeded.
+        With `adapt_freq`, the frequency of dry values of `mod` is first
+        adapted to that of `obs`.
+
+        Args:
+            dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "hist".
+            ignore_trace (bool, optional): Ignore trace values? Defaults to "False".
+            bins (int, optional): Number of bins. Defaults to 200.
+
+        Returns:
+            tuple: The obs and mod distributions.
+        """
+        key = (dist_type, ignore_trace, bins, self.trace_val)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        gen, rng = QuantileMapping.generate_distribution, self._rng
+        obs = to_time_major(self.obs, self.axis)
+        mod = to_time_major(self.mod, self.axis)
+        if self.adapt_freq:
+            mod = adapt_freq(obs, mod, self._rng)
+        dists = (
+            gen(obs, dist_type, ignore_trace, self.trace_val, bins, rng, self._mask),
+            gen(mod, dist_type, ignore_trace, self.trace_val, bins, rng, self._mask),
+        )
+        self._store(key, dists)
+        return dists
+
+    def set_fit(
+        self,
+        o_dist,
+        m_dist,
+        dist_type="hist",
+        ignore_trace: bool = False,
+        bins: int = BINS,
+    ):
+        """Use distributions fitted elsewhere as the cached fit of a key
+
+        `fit`, `transfer` and `adjust` then use `o_dist` and `m_dist` for
+        (`dist_type`, `ignore_trace`, `bins`) instead of fitting `obs` and
+        `mod`. On masked grids, `TableDistribution`s of every cell of the grid
+        are restricted to the cells that are adjusted.
+
+        Args:
+            o_dist: Fitted obs distribution.
+            m_dist: Fitted mod distribution.
+            dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "hist".
+            ignore_trace (bool, optional): Ignore trace values? Defaults to "False".
+            bins (int, optional): Number of bins. Defaults to 200.
+        """
+        dists = (o_dist, m_dist)
+        if self._mask is not None:
+            cells = np.flatnonzero(self._mask)
+            dists = tuple(
+                (
+                    MaskedDistribution(
+                        TableDistribution(dist.values[:, cells], dist.probs[:, cells]),
+                        cells,
+                        len(self._mask),
+                    )
+                    if isinstance(dist, TableDistribution)
+                    else dist
+                )
+                for dist in dists
+            )
+        self._store((dist_type, ignore_trace, bins, self.trace_val), dists)
+
+    def _store(self, key: tuple, dists: tuple):
+        """Cache the fits of `key`, evicting the least recently used"""
+        self._cache[key] = dists
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def transfer(
+        self, dist_type="hist", ignore_trace: bool = False, bins: int = BINS
+    ) -> QuantileTransfer:
+        """Quantile mapping transfer function from the cached fits
+
+        The returned object applies the "qm" adjustment to data of any length,
+        e.g. chunk by chunk with `transform_iter`.
+
+        Args:
+            dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "hist".
+            ignore_trace (bool, optional): Ignore trace values? Defaults to "False".
+            bins (int, optional): Number of bins. Defaults to 200.
+
+        Returns:
+            QuantileTransfer: The transfer function.
+        """
+        o_dist, m_dist = self.fit(dist_type, ignore_trace, bins)
+        tail = None
+        if self.tail != "clip":
+            tail = Tail.fit(
+                self.tail,
+                o_dist,
+                m_dist,
+                self.max_cdf,
+                to_time_major(self.obs, self.axis),
+                to_time_major(self.mod, self.axis),
+            )
+        meta = {
+            "dist_type": dist_type,
+            "ignore_trace": ignore_trace,
+            "bins": bins,
+            "trace_val": self.trace_val,
+        }
+        return QuantileTransfer(o_dist, m_dist, self.max_cdf, self.axis, meta, tail)
+
+    def clear_cache(self):
+        """Drop all cached obs and mod distributions"""
+        self._cache.clear()
+
     def adjust(
         self,
         data: FloatNDArray,
         method="qm",
         dist_type="hist",
         ignore_trace: bool = False,
+        bins: int = BINS,
+        dtype=None,
+        out: FloatNDArray = None,
+        window: int = None,
+        step: int = None,
+        fit_data: FloatNDArray = None,
     ):
+        """Adjust the bias of `data`
+
+        Gridded inputs are shaped (time, ...) with the time dimension along
+        `axis`; every cell is adjusted independently and the result has the
+        shape of `data`.
+
+        With a list of methods, e.g. ["qm", "qdm.rel", "qdm.abs"], all are
+        computed in one call and returned by method. The fitted distributions
+        are shared, and the QDM modes share the future distribution and its
+        quantiles.
+
+        Args:
+            data (FloatNDArray): Data to adjust.
+            method (str | list, optional): One of "qm", "dqm[.rel|.abs]", "qdm[.rel|.abs]", or a list of them. Defaults to "qm".
+            dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "hist".
+            ignore_trace (bool, optional): Ignore trace values? Defaults to "False".
+            bins (int, optional): Number of bins. Defaults to 200.
+            dtype (optional): Floating dtype of the result, e.g. np.float32. Defaults to float64.
+            out (FloatNDArray, optional): Array to write the adjusted values into,
+                e.g. a memory-mapped array. Defaults to a new array.
+            window (int, optional): QDM only: fit the distribution of `data` over a
+                moving window of this many time steps. Defaults to the whole series.
+            step (int, optional): QDM only: time steps adjusted with each window.
+                Defaults to a third of `window`.
+            fit_data (FloatNDArray, optional): Data whose mean (dqm) or
+                distribution (qdm) is used instead of that of `data`, e.g. a
+                longer period around `data`. Defaults to `data`.
+
+        Returns:
+            FloatNDArray | dict: The adjusted values, by method for a list of methods.
+        """
+        if fit_data is None:
+            self._check_data(data)
+        else:
+            self._check_data(fit_data)
+            self._check_data(data, min_len=1)
+        if isinstance(method, (list, tuple)):
+            if out is not None:
+                raise ValueError("`out` is not supported with several methods.")
+            return self._adjust_methods(
+                data,
+                method,
+                dist_type,
+                ignore_trace,
+                bins,
+                dtype,
+                window,
+                step,
+                fit_data,
+            )
+        if not method.startswith("qdm") and (window, step) != (None, None):
+            raise ValueError("`window` and `step` only apply to the qdm methods.")
+        if method.startswith("qdm") and self.tail != "clip":
+            raise ValueError('`tail` only applies to "qm" and "dqm".')
+
+        o_dist, m_dist = self.fit(dist_type, ignore_trace, bins)
+        kwargs = {
+            "bins": bins,
+            "axis": self.axis,
+            "o_dist": o_dist,
+            "m_dist": m_dist,
+            "seed": self._rng,
+            "mask": self._mask,
+            "fit_data": fit_data,
+            "_trusted": True,
+        }
+        # output options are only passed on when given
+        options = {k: v for k, v in [("dtype", dtype), ("out", out)] if v is not None}
         if method == "qm":
             return QuantileMapping(
-                self.obs, self.mod, data, max_cdf=self.max_cdf, trace_val=self.trace_val
-            ).compute(dist_type=dist_type, ignore_trace=ignore_trace)
+                self.obs,
+                self.mod,
+                data,
+                max_cdf=self.max_cdf,
+                trace_val=self.trace_val,
+                tail=self.tail,
+                **kwargs,
+            ).compute(dist_type=dist_type, ignore_trace=ignore_trace, **options)
         elif method.startswith("dqm"):
             mode = _get_ba_mode(method)
             qm = DetrendedQuantileMapping(
-                self.obs, self.mod, data, max_cdf=self.max_cdf, trace_val=self.trace_val
+                self.obs,
+                self.mod,
+                data,
+                max_cdf=self.max_cdf,
+                trace_val=self.trace_val,
+                tail=self.tail,
+                **kwargs,
             )
             if mode is not None:
                 return qm.compute(
-                    mode=mode, dist_type=dist_type, ignore_trace=ignore_trace
+                    mode=mode,
+                    dist_type=dist_type,
+                    ignore_trace=ignore_trace,
+                    **options,
                 )
-            return qm.compute(dist_type=dist_type, ignore_trace=ignore_trace)
+            return qm.compute(dist_type=dist_type, ignore_trace=ignore_trace, **options)
         elif method.startswith("qdm"):
             mode = _get_ba_mode(method)
             qm = QuantileDeltaMapping(
-                self.obs, self.mod, data, max_cdf=self.max_cdf, trace_val=self.trace_val
+                self.obs,
+                self.mod,
+                data,
+                max_cdf=self.max_cdf,
+                trace_val=self.trace_val,
+                window=window,
+                step=step,
+                **kwargs,
             )
             if mode is not None:
                 return qm.compute(
-                    mode=mode, dist_type=dist_type, ignore_trace=ignore_trace
+                    mode=mode,
+                    dist_type=dist_type,
+                    ignore_trace=ignore_trace,
+                    **options,
                 )
-            return qm.compute(dist_type=dist_type, ignore_trace=ignore_trace)
-        return QuantileMapping(self.obs, self.mod, data, max_cdf=self.max_cdf).compute(
-            dist_type=dist_type
+            return qm.compute(dist_type=dist_type, ignore_trace=ignore_trace, **options)
+        return QuantileMapping(
+            self.obs, self.mod, data, max_cdf=self.max_cdf, **kwargs
+        ).compute(dist_type=dist_type, **options)
+
+    def _adjust_methods(
+        self,
+        data: FloatNDArray,
+        methods: list,
+        dist_type="hist",
+        ignore_trace: bool = False,
+        bins: int = BINS,
+        dtype=None,
+        window: int = None,
+        step: int = None,
+        fit_data: FloatNDArray = None,
+    ) -> dict:
+        """Adjust `data` with every method of `methods`, sharing fits"""
+        res = {}
+        qdm_modes = {
+            m: _get_ba_mode(m) or "rel" for m in methods if m.startswith("qdm")
+        }
+        if qdm_modes and self.tail != "clip":
+            raise ValueError('`tail` only applies to "qm" and "dqm".')
+        if qdm_modes:
+            o_dist, m_dist = self.fit(dist_type, ignore_trace, bins)
+            by_mode = QuantileDeltaMapping(
+                self.obs,
+                self.mod,
+                data,
+                max_cdf=self.max_cdf,
+                trace_val=self.trace_val,
+                bins=bins,
+                axis=self.axis,
+                o_dist=o_dist,
+                m_dist=m_dist,
+                seed=self._rng,
+                mask=self._mask,
+                window=window,
+                step=step,
+                fit_data=fit_data,
+                _trusted=True,
+            ).compute_modes(
+                list(dict.fromkeys(qdm_modes.values())),
+                dist_type=dist_type,
+                ignore_trace=ignore_trace,
+                dtype=dtype,
+            )
+            res.update({m: by_mode[mode] for m, mode in qdm_modes.items()})
+        for m in methods:
+            if m not in res and (window, step) != (None, None):
+                raise ValueError("`window` and `step` only apply to the qdm methods.")
+            if m not in res:
+                res[m] = self.adjust(
+                    data, m, dist_type, ignore_trace, bins, dtype, fit_data=fit_data
+                )
+        return {m: res[m] for m in methods}
+
+    def adjust_many(
+        self,
+        data: FloatNDArray,
+        method="qm",
+        dist_type="hist",
+        ignore_trace: bool = False,
+        bins: int = BINS,
+        n_workers: int = None,
+        chunk_size: int = None,
+    ):
+        """Adjust the bias of gridded or multi-series `data` in parallel
+
+        The cells are sharded across a pool of `n_workers` processes that
+        read the inputs from shared memory. Without random draws (no
+        `ignore_trace` or `adapt_freq`), the result equals that of `adjust`.
+        Otherwise the draws come from generators seeded by `seed` and the
+        chunk, reproducible for a given `chunk_size`; with `seed` = None,
+        fresh entropy is drawn once per call.
+
+        Args:
+            data (FloatNDArray): Data to adjust, shaped (time, ...) along `axis`.
+            method (str, optional): One of "qm", "dqm[.rel|.abs]", "qdm[.rel|.abs]". Defaults to "qm".
+            dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "hist".
+            ignore_trace (bool, optional): Ignore trace values? Defaults to "False".
+            bins (int, optional): Number of bins. Defaults to 200.
+            n_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+            chunk_size (int, optional): Cells per task. Defaults to four tasks per worker.
+
+        Returns:
+            FloatNDArray: The adjusted values.
+        """
+        if not is_float_ndarray(data) or data.ndim < 2:
+            raise TypeError("`data` is not a gridded numpy array.")
+        if grid_shape(data, self.axis) != grid_shape(self.obs, self.axis):
+            raise ValueError(
+                "`data` must have the same shape as `obs` except along `axis`."
+            )
+        if isinstance(self.seed, np.random.Generator):
+            raise TypeError("`seed` must be an integer to adjust in parallel.")
+
+        params = {
+            "method": method,
+            "dist_type": dist_type,
+            "ignore_trace": ignore_trace,
+            "bins": bins,
+            "max_cdf": self.max_cdf,
+            "trace_val": self.trace_val,
+            "seed": self.seed,
+            "adapt_freq": self.adapt_freq,
+            "mask": None if self.mask is None else self.mask.ravel(),
+            "tail": self.tail,
+        }
+        res = adjust_many(
+            to_time_major(self.obs, self.axis),
+            to_time_major(self.mod, self.axis),
+            to_time_major(data, self.axis),
+            params,
+            n_workers=n_workers,
+            chunk_size=chunk_size,
         )
+        return from_time_major(res, data.shape, self.axis)
@@ -0,0 +1,273 @@
+"""Command-line bias adjustment of files
+
+    bias-adjust obs.nc mod.nc future.nc -o adjusted.nc --method qdm.rel
+
+The observed, modelled and future series are read from NetCDF (".nc"),
+Zarr (".zarr"), ".npy" or CSV files, with time along the first axis of the
+arrays (one series per column for CSV). Cells are adjusted in tiles of
+`--tile-size` cells:
+
+- NetCDF and Zarr variables are opened lazily with xarray and dask and
+  written tile by tile as they are computed, by `--workers` threads.
+- ".npy" inputs are memory-mapped and adjusted into a memory-mapped ".npy"
+  output, so memory use is bounded by the tile size. The tiles are
+  seeded like the chunks of `BiasAdjustment.adjust_many`.
+- CSV files are read and written whole.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from bias_adjustment.const import BINS, MAX_CDF, TILE_SIZE, TRACE_VAL
+from bias_adjustment.parallel import _adjust_chunk, _chunks, adjust_many
+from bias_adjustment.quantile_mapping.tails import TAILS
+from bias_adjustment.utils import grid_shape, is_float_ndarray
+
+METHODS = ["qm", "dqm", "dqm.rel", "dqm.abs", "qdm", "qdm.rel", "qdm.abs"]
+DATASET_SUFFIXES = (".nc", ".nc4", ".zarr")
+ARRAY_SUFFIXES = (".npy", ".csv")
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="bias-adjust",
+        description="Bias adjustment by quantile mapping of NetCDF, Zarr, "
+        ".npy or CSV files.",
+    )
+    parser.add_argument("obs", type=Path, help="observed series")
+    parser.add_argument("mod", type=Path, help="modelled series, observed period")
+    parser.add_argument("data", type=Path, help="series to adjust")
+    parser.add_argument("-o", "--output", type=Path, required=True)
+    parser.add_argument("-m", "--method", choices=METHODS, default="qm")
+    parser.add_argument(
+        "-d",
+        "--dist-type",
+        default="hist",
+        help='"hist", "empirical", "<family>.fast" or a scipy.stats name',
+    )
+    parser.add_argument("--max-cdf", type=float, default=MAX_CDF)
+    parser.add_argument("--trace-val", type=float, default=TRACE_VAL)
+    parser.add_argument("--bins", type=int, default=BINS)
+    parser.add_argument("--ignore-trace", action="store_true")
+    parser.add_argument(
+        "--adapt-freq", action="store_true", help="adapt the wet-day frequency"
+    )
+    parser.add_argument(
+        "--tail",
+        choices=TAILS,
+        default="clip",
+        help="adjustment above the calibration range (qm and dqm)",
+    )
+    parser.add_argument("--seed", type=int, help="seed of the random trace values")
+    parser.add_argument(
+        "-v",
+        "--var",
+        action="append",
+        help="NetCDF/Zarr variable to adjust, repeatable; defaults to all "
+        "variables with a time dimension",
+    )
+    parser.add_argument("--dim", default="time", help="NetCDF/Zarr time dimension")
+    parser.add_argument(
+        "--tile-size", type=int, default=TILE_SIZE, help="cells adjusted per task"
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes (threads for NetCDF/Zarr)",
+    )
+    parser.add_argument("--dtype", choices=["float32", "float64"], default="float64")
+    return parser
+
+
+def _params(args: argparse.Namespace) -> dict:
+    return {
+        "method": args.method,
+        "dist_type": args.dist_type,
+        "ignore_trace": args.ignore_trace,
+        "bins": args.bins,
+        "max_cdf": args.max_cdf,
+        "trace_val": args.trace_val,
+        # unseeded runs draw their entropy once, for all tiles
+        "seed": np.random.SeedSequence().entropy if args.seed is None else args.seed,
+        "adapt_freq": args.adapt_freq,
+        "tail": args.tail,
+    }
+
+
+def _flat(arr: np.ndarray) -> np.ndarray:
+    """(time, cells) view of a time-major array"""
+    return arr.reshape(arr.shape[0], -1)
+
+
+def _csv_header(path: Path):
+    """First line of a CSV file if it is not numeric, else None"""
+    with open(path) as f:
+        first = f.readline()
+    try:
+        [float(v) for v in first.split(",")]
+    except ValueError:
+        return first.rstrip("\n")
+    return None
+
+
+def _read_array(path: Path) -> np.ndarray:
+    if path.suffix == ".npy":
+        return np.load(path, mmap_mode="r")
+    skiprows = 0 if _csv_header(path) is None else 1
+    return np.loadtxt(path, delimiter=",", ndmin=2, skiprows=skiprows)
+
+
+def _adjust_file_tile(start: int, stop: int, paths: list, out_path: Path, params):
+    """Worker entry point: adjust one tile of memory-mapped .npy files"""
+    obs, mod, data = (_flat(np.load(p, mmap_mode="r")) for p in paths)
+    out = np.load(out_path, mmap_mode="r+")
+    _adjust_chunk(start, stop, obs, mod, data, _flat(out), params)
+    out.flush()
+
+
+def adjust_arrays(args: argparse.Namespace):
+    """Adjust .npy or CSV files tile by tile"""
+    arrays = {name: _read_array(getattr(args, name)) for name in ["obs", "mod", "data"]}
+    for name, arr in arrays.items():
+        if not is_float_ndarray(arr):
+            raise TypeError(f"`{name}` must hold floating point values.")
+    if len({grid_shape(arr) for arr in arrays.values()}) > 1:
+        raise ValueError("`obs`, `mod` and `data` must have the same cells.")
+
+    shape = arrays["data"].shape
+    params = _params(args)
+    paths = [args.obs, args.mod, args.data]
+    tiles = _chunks(int(np.prod(shape[1:])), args.tile_size)
+    if args.output.suffix == ".npy":
+        out = np.lib.format.open_memmap(
+            args.output, mode="w+", dtype=args.dtype, shape=shape
+        )
+    else:
+        out = np.empty(shape, dtype=args.dtype)
+
+    if args.workers > 1 and all(p.suffix == ".npy" for p in paths + [args.output]):
+        # workers map the files themselves, nothing is copied between processes
+        out.flush()
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = [
+                pool.submit(_adjust_file_tile, start, stop, paths, args.output, params)
+                for start, stop in tiles
+            ]
+            for future in futures:
+                future.result()
+        return
+    obs, mod, data = (_flat(arr) for arr in arrays.values())
+    if args.workers > 1:
+        _flat(out)[:] = adjust_many(
+            obs, mod, data, params, n_workers=args.workers, chunk_size=args.tile_size
+        )
+    else:
+        for start, stop in tiles:
+            _adjust_chunk(start, stop, obs, mod, data, _flat(out), params)
+
+    if args.output.suffix == ".npy":
+        out.flush()
+    else:
+        header = _csv_header(args.data) if args.data.suffix == ".csv" else None
+        np.savetxt(
+            args.output,
+            _flat(out),
+            delimiter=",",
+            header=header or "",
+            comments="",
+        )
+
+
+def _open_dataset(path: Path):
+    import xarray as xr
+
+    if path.suffix == ".zarr":
+        return xr.open_zarr(path)
+    return xr.open_dataset(path, chunks={})
+
+
+def adjust_datasets(args: argparse.Namespace):
+    """Adjust NetCDF or Zarr variables lazily, tile by tile"""
+    try:
+        import dask
+        import xarray as xr
+    except ImportError as e:
+        raise ImportError(
+            "NetCDF and Zarr files require xarray and dask; "
+            "install them with `pip install xarray dask`."
+        ) from e
+    from bias_adjustment.xarray import adjust
+
+    obs, mod, data = (_open_dataset(p) for p in [args.obs, args.mod, args.data])
+    names = args.var or [v for v in data.data_vars if args.dim in data[v].dims]
+    if not names:
+        raise ValueError(f"`data` has no variable with a `{args.dim}` dimension.")
+
+    res = xr.Dataset(attrs=data.attrs)
+    for name in names:
+        for label, ds in [("obs", obs), ("mod", mod), ("data", data)]:
+            if name not in ds.data_vars:
+                raise ValueError(f"`{label}` has no variable `{name}`.")
+        da = data[name]
+        # tile along the first grid dimension, keep the others whole
+        grid = [d for d in da.dims if d != args.dim]
+        chunks = {d: -1 for d in grid[1:]}
+        if grid:
+            rest = int(np.prod([da.sizes[d] for d in grid[1:]]))
+            chunks[grid[0]] = max(1, args.tile_size // rest)
+        res[name] = adjust(
+            obs[name],
+            mod[name],
+            da,
+            dim=args.dim,
+            method=args.method,
+            dist_type=args.dist_type,
+            ignore_trace=args.ignore_trace,
+            bins=args.bins,
+            max_cdf=args.max_cdf,
+            trace_val=args.trace_val,
+            chunks=chunks,
+            tail=args.tail,
+            seed=args.seed,
+            adapt_freq=args.adapt_freq,
+        ).astype(args.dtype)
+
+    # threads work with every NetCDF/Zarr backend; numpy releases the GIL
+    scheduler = "threads" if args.workers > 1 else "synchronous"
+    with dask.config.set(scheduler=scheduler, num_workers=args.workers):
+        if args.output.suffix == ".zarr":
+            res.to_zarr(args.output, mode="w")
+        else:
+            res.to_netcdf(args.output)
+
+
+def main(argv: list = None) -> int:
+    """Entry point of the `bias-adjust` command"""
+    parser = _parser()
+    args = parser.parse_args(argv)
+    if args.tile_size < 1:
+        parser.error("--tile-size must be at least 1")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    suffixes = {p.suffix for p in [args.obs, args.mod, args.data, args.output]}
+    try:
+        if suffixes <= set(DATASET_SUFFIXES):
+            adjust_datasets(args)
+        elif suffixes <= set(ARRAY_SUFFIXES):
+            if args.var:
+                raise ValueError("--var only applies to NetCDF and Zarr files.")
+            adjust_arrays(args)
+        else:
+            raise ValueError(
+                "Files must all be NetCDF/Zarr (.nc, .nc4, .zarr) "
+                "or all arrays (.npy, .csv)."
+            )
+    except (ImportError, OSError, TypeError, ValueError) as e:
+        parser.exit(1, f"{parser.prog}: error: {e}\n")
+    return 0
@@ -1,2 +1,9 @@
 MAX_CDF = 0.9999999
 TRACE_VAL = 0.05
+BINS = 200
+CACHE_SIZE = 8
+EMPIRICAL_SIZE = 10_000
+BLOCK_SIZE = 1 << 18
+TILE_SIZE = 1024
+TABLE_SIZE = 1024
+TAIL_Q = 0.99
@@ -1,3 +1,4 @@
-from bias_adjustment.distributions.distributions import Distributions
+from bias_adjustment.distributions.distributions import Distributions, FitResult
+from bias_adjustment.distributions.sketch import HistogramSketch
 
-__all__ = [Distributions]
+__all__ = [Distributions, FitResult, HistogramSketch]
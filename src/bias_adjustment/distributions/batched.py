@@ -0,0 +1,274 @@
+import warnings
+from dataclasses import dataclass
+from typing import Any, List
+
+import numpy as np
+
+from bias_adjustment.utils import FloatNDArray
+
+
+def _searchsorted_columns(xp: FloatNDArray, x: FloatNDArray) -> FloatNDArray:
+    """Row-wise `np.searchsorted(..., side="right")`
+
+    Every row of `xp` is rescaled to [1, 2] and shifted into its own band so
+    that all rows form a single increasing array, which lets one
+    `np.searchsorted` call locate the values of every row at once. Entries
+    misplaced by the rescaling round-off are then corrected with exact
+    comparisons.
+
+    Args:
+        xp (FloatNDArray): Increasing values per row, shaped (cells, m).
+        x (FloatNDArray): Values to locate, shaped (cells, n).
+
+    Returns:
+        FloatNDArray: Indices into the flattened `xp`, shaped (cells, n).
+    """
+    k, m = xp.shape
+    lo = xp[:, :1]
+    span = xp[:, -1:] - lo
+    span = np.where(span > 0, span, 1.0)
+    offset = 1.0 + 4.0 * np.arange(k)[:, None]
+    flat = ((xp - lo) / span + offset).ravel()
+    xn = np.clip((x - lo) / span, -1.0, 2.0)
+    xn += offset
+    idx = np.searchsorted(flat, xn, side="right")
+
+    # exact fix-up: xp[idx - 1] <= x < xp[idx] within each row
+    start = m * np.arange(k)[:, None]
+    xp = xp.ravel()
+    bad = ((idx > start) & (x < xp.take(np.maximum(idx - 1, start)))) | (
+        (idx < start + m) & (x >= xp.take(np.minimum(idx, start + m - 1)))
+    )
+    if bad.any():
+        rows, cols = np.nonzero(bad)
+        _x, _idx, _start = x[rows, cols], idx[rows, cols], start[rows, 0]
+        while True:
+            dec = (_idx > _start) & (_x < xp[np.maximum(_idx - 1, _start)])
+            inc = (_idx < _start + m) & (_x >= xp[np.minimum(_idx, _start + m - 1)])
+            if not (dec.any() or inc.any()):
+                break
+            _idx -= dec
+            _idx += inc
+        idx[rows, cols] = _idx
+    return idx
+
+
+def _interp_columns(
+    x: FloatNDArray,
+    xp: FloatNDArray,
+    fp: FloatNDArray,
+    left: float = None,
+    right: float = None,
+) -> FloatNDArray:
+    """Column-wise `np.interp`, using the same arithmetic
+
+    Args:
+        x (FloatNDArray): Values to evaluate, shaped (n, cells).
+        xp (FloatNDArray): Increasing abscissae per column, shaped (m, cells).
+        fp (FloatNDArray): Ordinates per column, shaped (m, cells).
+        left (float, optional): Value for `x` < `xp[0]`. Defaults to `fp[0]`.
+        right (float, optional): Value for `x` > `xp[-1]`. Defaults to `fp[-1]`.
+    """
+    # work on contiguous rows, one per cell
+    m, k = xp.shape
+    xT = np.ascontiguousarray(x.T)
+    xpT = np.ascontiguousarray(xp.T)
+    fpT = np.ascontiguousarray(fp.T).ravel()
+    idx = _searchsorted_columns(xpT, xT)
+
+    start = m * np.arange(k)[:, None]
+    j = np.clip(idx - 1, start, start + m - 2)
+    xpT = xpT.ravel()
+    x0 = xpT.take(j)
+    f0 = fpT.take(j)
+    j += 1
+    with np.errstate(invalid="ignore", divide="ignore"):
+        res = (fpT.take(j) - f0) / (xpT.take(j) - x0)
+        res *= xT - x0
+    res += f0
+    res = np.where(xT == x0, f0, res)
+
+    idx -= start
+    res = np.where(idx == 0, fp[:1].T if left is None else left, res)
+    res = np.where(idx == m, fp[-1:].T, res)
+    res = np.where(xT > xp[-1:].T, fp[-1:].T if right is None else right, res)
+    res[np.isnan(xT)] = np.nan
+    return res.T
+
+
+def _hist_table(data: FloatNDArray, bins: int = 200):
+    """Bin edges and cumulative probabilities of per-column histograms
+
+    Mirrors `np.histogram` followed by `scipy.stats.rv_histogram` for every
+    column of `data`, without looping over the columns.
+
+    Args:
+        data (FloatNDArray): Input data shaped (time, cells). NaNs are ignored.
+        bins (int, optional): Number of bins. Defaults to 200.
+    """
+    n, k = data.shape
+    valid = ~np.isnan(data)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        first = np.nanmin(data, axis=0)
+        last = np.nanmax(data, axis=0)
+    same = first == last
+    first = np.where(same, first - 0.5, first)
+    last = np.where(same, last + 0.5, last)
+
+    edges = np.linspace(first, last, bins + 1)
+    empty = np.isnan(edges[0])
+    edges[:, empty] = np.linspace(0, 1, bins + 1)[:, None]
+
+    _data = np.where(valid, data, edges[0])
+    with np.errstate(invalid="ignore"):
+        idx = ((_data - edges[0]) * (bins / (edges[-1] - edges[0]))).astype(np.intp)
+    np.clip(idx, 0, bins - 1, out=idx)
+    # same edge corrections as `np.histogram`
+    idx -= _data < np.take_along_axis(edges, idx, axis=0)
+    inc = (_data >= np.take_along_axis(edges, idx + 1, axis=0)) & (idx != bins - 1)
+    idx += inc
+
+    idx += bins * np.arange(k)
+    counts = np.bincount(idx[valid], minlength=bins * k).reshape(k, bins)
+
+    # same arithmetic as `np.histogram(density=True)` and `rv_histogram`, on
+    # contiguous rows so that the sums round identically
+    widths = np.diff(edges, axis=0).T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pdf = counts / widths / counts.sum(axis=1, keepdims=True) / widths
+        pdf = pdf / np.sum(pdf * widths, axis=1, keepdims=True)
+    cum = np.zeros((k, bins + 1))
+    np.cumsum(pdf * widths, axis=1, out=cum[:, 1:])
+    cum = cum.T
+    cum[:, empty] = np.nan
+    edges[:, empty] = np.nan
+    return edges, cum
+
+
+def _empirical_table(data: FloatNDArray, size: int = 10_000):
+    """Sorted values and cumulative probabilities of per-column empirical
+    distributions
+
+    Up to `size + 1` valid values per column are kept as is, at plotting
+    positions `i / (n - 1)`; longer columns are reduced to the quantiles at
+    `size + 1` evenly spaced probabilities. Either way the quantile function
+    matches `np.quantile` with linear interpolation at the table points.
+    Columns with fewer values than others are padded with their maximum at
+    probability 1.
+
+    Args:
+        data (FloatNDArray): Input data shaped (time, cells). NaNs are ignored.
+        size (int, optional): Maximum number of table intervals. Defaults to 10000.
+    """
+    values = np.sort(data, axis=0)
+    n_valid = np.count_nonzero(~np.isnan(values), axis=0)
+    last = np.maximum(n_valid - 1, 0)
+
+    if len(values) > size + 1:
+        probs = np.linspace(0, 1, size + 1)[:, None]
+        pos = probs * last
+        lo = np.floor(pos).astype(np.intp)
+        hi = np.minimum(lo + 1, last)
+        v_lo = np.take_along_axis(values, lo, axis=0)
+        v_hi = np.take_along_axis(values, hi, axis=0)
+        values = v_lo + (v_hi - v_lo) * (pos - lo)
+        probs = np.repeat(probs, values.shape[1], axis=1)
+    else:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            probs = np.arange(len(values))[:, None] / last
+        np.minimum(probs, 1.0, out=probs)
+        pad = np.arange(len(values))[:, None] >= n_valid
+        if pad.any():
+            values = np.where(
+                pad, np.take_along_axis(values, last[None], axis=0), values
+            )
+    probs[:, n_valid < 2] = np.nan
+    return values, probs
+
+
+@dataclass
+class TableDistribution:
+    """Piecewise linear distribution defined by a table of values and their
+    cumulative probabilities
+
+    `values` and `probs` are shaped (m,) for a single series or (m, cells) for
+    a batch of independent series. Columns that are all NaN yield NaN.
+    """
+
+    values: FloatNDArray
+    probs: FloatNDArray
+
+    def _columns(self, arr: FloatNDArray):
+        bad = np.isnan(arr).any(axis=0)
+        if bad.any():
+            arr = arr.copy()
+            arr[:, bad] = np.linspace(0, 1, arr.shape[0])[:, None]
+        return arr, bad
+
+    def cdf(self, x: FloatNDArray) -> FloatNDArray:
+        if self.values.ndim == 1:
+            res = np.interp(x, self.values, self.probs, left=0.0, right=1.0)
+            return np.where(np.isnan(x), np.nan, res)
+        xp, bad = self._columns(self.values)
+        fp, _ = self._columns(self.probs)
+        res = _interp_columns(x, xp, fp, left=0.0, right=1.0)
+        res[:, bad] = np.nan
+        return res
+
+    def ppf(self, q: FloatNDArray) -> FloatNDArray:
+        if self.values.ndim == 1:
+            res = np.interp(q, self.probs, self.values)
+        else:
+            xp, bad = self._columns(self.probs)
+            fp, _ = self._columns(self.values)
+            res = _interp_columns(q, xp, fp)
+            res[:, bad] = np.nan
+        return np.where((q < 0) | (q > 1), np.nan, res)
+
+
+@dataclass
+class MaskedDistribution:
+    """Distribution of some columns of a grid, NaN in the others
+
+    `dist` is fitted on the columns `cells` of a grid of `n_cells` columns
+    only, so that masked or empty cells cost nothing to fit or evaluate.
+    """
+
+    dist: Any
+    cells: np.ndarray
+    n_cells: int
+
+    def _apply(self, func: str, x: FloatNDArray) -> FloatNDArray:
+        res = np.full(x.shape, np.nan)
+        res[:, self.cells] = getattr(self.dist, func)(x[:, self.cells])
+        return res
+
+    def cdf(self, x: FloatNDArray) -> FloatNDArray:
+        return self._apply("cdf", x)
+
+    def ppf(self, q: FloatNDArray) -> FloatNDArray:
+        return self._apply("ppf", q)
+
+
+@dataclass
+class DistributionBatch:
+    """Independent fitted distributions, one per column
+
+    Cells without a distribution (`None`) yield NaN.
+    """
+
+    dists: List[Any]
+
+    def _apply(self, func: str, x: FloatNDArray) -> FloatNDArray:
+        res = np.full(x.shape, np.nan)
+        for i, dist in enumerate(self.dists):
+            if dist is not None:
+                res[:, i] = getattr(dist, func)(x[:, i])
+        return res
+
+    def cdf(self, x: FloatNDArray) -> FloatNDArray:
+        return self._apply("cdf", x)
+
+    def ppf(self, q: FloatNDArray) -> FloatNDArray:
+        return self._apply("ppf", q)
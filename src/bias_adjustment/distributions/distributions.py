@@ -1,12 +1,30 @@
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List
+from typing import Any, List, Literal, get_args
 
 import numpy as np
-from scipy import stats as st
 
+from bias_adjustment import kernels
+from bias_adjustment.const import EMPIRICAL_SIZE
+from bias_adjustment.distributions.analytic import (
+    FAST_FAMILIES,
+    ParametricBatch,
+    fit_params,
+)
+from bias_adjustment.distributions.batched import (
+    DistributionBatch,
+    MaskedDistribution,
+    TableDistribution,
+    _empirical_table,
+    _hist_table,
+)
+from bias_adjustment.profiling import timed
 from bias_adjustment.utils import FloatNDArray, is_float_ndarray
 
+Criterion = Literal["sse", "aic", "bic", "ks"]
+
 
 def _fit_hist(data: FloatNDArray, bins=200):
     """Generate a distribution from a histogram
@@ -27,8 +45,46 @@ def _fit_hist(data: FloatNDArray, bins=200):
         if not isinstance(v, int):
             raise TypeError(f"`{v}` is not an integer.")
 
-    h = np.histogram(data[~np.isnan(data)], bins=bins, density=True)
-    return st.rv_histogram(h)
+    return _hist(data, bins)
+
+
+def _hist(data: FloatNDArray, bins=200):
+    """`_fit_hist` of validated data"""
+    from scipy import stats as st
+
+    return st.rv_histogram(np.histogram(data[~np.isnan(data)], bins=bins, density=True))
+
+
+def _fit_empirical(data: FloatNDArray, size=EMPIRICAL_SIZE):
+    """Generate an empirical distribution from the sorted data
+
+    The cdf and ppf interpolate linearly between the sorted values (or, for
+    more than `size` values, between `size + 1` evenly spaced quantiles), so
+    the ppf matches `np.quantile` and the tails keep the data resolution.
+
+    Args:
+        data (FloatNDArray): Input data.
+        size (int, optional): Maximum number of table intervals. Defaults to 10000.
+    """
+
+    for v in [data]:
+        if not is_float_ndarray(v):
+            raise TypeError(f"`{v}` is not a float numpy array.")
+        min_len = 10
+        if len(v) < min_len:
+            raise ValueError(f"Length of `{v}` must be greater than {min_len}.")
+
+    for v in [size]:
+        if not isinstance(v, int):
+            raise TypeError(f"`{v}` is not an integer.")
+
+    return _empirical(data, size)
+
+
+def _empirical(data: FloatNDArray, size=EMPIRICAL_SIZE):
+    """`_fit_empirical` of validated data"""
+    values, probs = _empirical_table(data[~np.isnan(data), None], size)
+    return TableDistribution(values[:, 0], probs[:, 0])
 
 
 def _fit_dist(data: FloatNDArray, dist_type="gamma"):
@@ -46,20 +102,141 @@ def _fit_dist(data: FloatNDArray, dist_type="gamma"):
         if len(v) < min_len:
             raise ValueError(f"Length of `{v}` must be greater than {min_len}.")
 
-    if not (
-        hasattr(st, dist_type) and isinstance(getattr(st, dist_type), st.rv_continuous)
-    ):
+    return _scipy_fit(data, _scipy_dist(dist_type))
+
+
+def _scipy_dist(dist_type: str):
+    """The scipy.stats distribution named `dist_type`"""
+    # scipy.stats is slow to import; only load it for parametric fits
+    from scipy import stats as st
+
+    dist = getattr(st, dist_type, None)
+    if not isinstance(dist, st.rv_continuous):
         raise ValueError("`dist_type` must be a valid scipy.stats distribution name.")
+    return dist
+
+
+def _scipy_fit(data: FloatNDArray, dist):
+    """Frozen `dist` fitted to validated data"""
+    return dist(*dist.fit(data[~np.isnan(data)]))
+
+
+@dataclass
+class FitResult:
+    name: str
+    dist: Any
+    score: float
+    elapsed: float
+    screened_out: bool = False
+
+
+def _fit_candidate(data: FloatNDArray, dist_type: str, bins=100, criterion="sse"):
+    """Fit a distribution and score it against the data; lower is better
+
+    Args:
+        data (FloatNDArray): Input data without NaNs.
+        dist_type (str): Valid scipy.stats distribution name.
+        bins (int, optional): Number of histogram bins for "sse". Defaults to 100.
+        criterion (str, optional): "sse", "aic", "bic" or "ks". Defaults to "sse".
+    """
+    start = time.perf_counter()
+    dist = Distributions(data).fit(dist_type=dist_type, bins=bins)
+
+    if criterion == "sse":
+        # Calculate fitted PDF and error with fit in distribution
+        y, x = np.histogram(data, bins=bins, density=True)
+        x = (x + np.roll(x, -1))[:-1] / 2.0
+        score = np.sum(np.power(y - dist.pdf(x), 2.0))
+    elif criterion in ["aic", "bic"]:
+        k = len(dist.args)
+        penalty = 2 * k if criterion == "aic" else k * np.log(len(data))
+        score = penalty - 2 * np.sum(dist.logpdf(data))
+    else:
+        from scipy import stats as st
+
+        score = st.kstest(data, dist.cdf).statistic
+    return FitResult(dist_type, dist, float(score), time.perf_counter() - start)
+
+
+def _fit_hist_grid(data: FloatNDArray, bins=200):
+    """Generate per-cell histogram distributions for gridded data
 
-    dist: st.rv_continuous = getattr(st, dist_type)
-    params = dist.fit(data[~np.isnan(data)])
-    return dist(*params)
+    Args:
+        data (FloatNDArray): Input data shaped (time, cells).
+        bins (int, optional): Number of bins. Defaults to 200.
+    """
+    if kernels.ENABLED:
+        edges, cum = kernels.hist_table(data, bins)
+    else:
+        edges, cum = _hist_table(data, bins)
+    return TableDistribution(edges, cum)
+
+
+def _fit_empirical_grid(data: FloatNDArray, size=EMPIRICAL_SIZE):
+    """Generate per-cell empirical distributions for gridded data
+
+    Args:
+        data (FloatNDArray): Input data shaped (time, cells).
+        size (int, optional): Maximum number of table intervals. Defaults to 10000.
+    """
+    values, probs = _empirical_table(data, size)
+    return TableDistribution(values, probs)
+
+
+def _fit_dist_grid(data: FloatNDArray, dist_type="gamma", min_len=10):
+    """Generate per-cell distributions of a given type for gridded data
+
+    Args:
+        data (FloatNDArray): Input data shaped (time, cells).
+        dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "gamma".
+        min_len (int, optional): Minimum number of valid values per cell. Defaults to 10.
+    """
+    dist = _scipy_dist(dist_type)
+    n_valid = np.count_nonzero(~np.isnan(data), axis=0)
+    return DistributionBatch(
+        [
+            _scipy_fit(data[:, i], dist) if n_valid[i] >= min_len else None
+            for i in range(data.shape[1])
+        ]
+    )
+
+
+def _fit(data: FloatNDArray, dist_type="hist", bins=200, min_len=10):
+    """Fit a series, or every column of gridded data"""
+    if dist_type == "hist":
+        if data.ndim > 1:
+            return _fit_hist_grid(data, bins)
+        return _hist(data, bins)
+    elif dist_type == "empirical":
+        if data.ndim > 1:
+            return _fit_empirical_grid(data)
+        return _empirical(data)
+    elif dist_type.endswith(".fast"):
+        family = dist_type[: -len(".fast")]
+        if family not in FAST_FAMILIES:
+            raise ValueError(
+                f"`dist_type` must be one of {[f + '.fast' for f in FAST_FAMILIES]}."
+            )
+        return ParametricBatch(family, fit_params(data, family, min_len))
+    if data.ndim > 1:
+        return _fit_dist_grid(data, dist_type, min_len)
+    return _scipy_fit(data, _scipy_dist(dist_type))
 
 
 @dataclass
 class Distributions:
+    """Fit distributions to a series, or to every column of gridded data
+
+    Attributes:
+        data (FloatNDArray): Series, or gridded data shaped (time, cells).
+        min_len (int): Minimum number of values. Defaults to 10.
+        mask (np.ndarray): Boolean mask of the cells of gridded data to fit;
+            the others yield NaN. Defaults to all cells.
+    """
+
     data: FloatNDArray
     min_len: int = 10
+    mask: np.ndarray = None
 
     def __post_init__(self):
         for name in ["data"]:
@@ -76,11 +253,23 @@ class Distributions:
             if not isinstance(attr, int):
                 raise TypeError(f"`{name}` is not an integer.")
 
+        if self.mask is not None:
+            if not (isinstance(self.mask, np.ndarray) and self.mask.dtype == bool):
+                raise TypeError("`mask` is not a boolean numpy array.")
+            if self.data.ndim == 1 or self.mask.shape != self.data.shape[1:]:
+                raise ValueError("`mask` must have one value per cell of `data`.")
+
+    @timed("fit.{dist_type}")
     def fit(self, dist_type="hist", bins=200):
         """Generate distribution
 
+        Gridded data shaped (time, cells) yields one distribution per cell.
+
         Args:
-            dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "hist".
+            dist_type (str, optional): "hist", "empirical" or a valid scipy.stats
+                distribution name. "<name>.fast" fits gamma, lognorm, norm or
+                weibull_min with vectorized closed-form/Newton estimators and a
+                location fixed at 0. Defaults to "hist".
             bins (int, optional): Number of bins. Defaults to 200.
         """
 
@@ -92,24 +281,49 @@ class Distributions:
         if not isinstance(bins, int):
             raise TypeError("`bins` must be an integer.")
 
-        if dist_type == "hist":
-            return _fit_hist(self.data, bins)
-        elif hasattr(st, dist_type) and isinstance(
-            getattr(st, dist_type), st.rv_continuous
-        ):
-            return _fit_dist(self.data, dist_type)
-        else:
-            raise ValueError(
-                "`dist_type` must be a valid scipy.stats distribution name."
-            )
-
-    def best_fit(self, distributions: List[str] = None, bins=100):
-        """Find best fit distribution to data
+        if self.mask is None or self.data.ndim == 1:
+            return _fit(self.data, dist_type, bins, self.min_len)
+        # one copy of the cells to fit, instead of per-cell NaN filtering
+        cells = np.flatnonzero(self.mask)
+        return MaskedDistribution(
+            _fit(self.data[:, cells], dist_type, bins, self.min_len),
+            cells,
+            self.data.shape[1],
+        )
+
+    def rank_fits(
+        self,
+        distributions: List[str] = None,
+        bins=100,
+        criterion: Criterion = "sse",
+        n_workers: int = 1,
+        executor: Literal["thread", "process"] = "thread",
+        screen_size: int = None,
+        screen_keep: int = 2,
+        seed: int = 0,
+    ) -> List["FitResult"]:
+        """Fit and rank candidate distributions
+
+        Candidates are evaluated concurrently with `n_workers` threads or
+        processes. With `screen_size`, every candidate is first fitted on a
+        random subsample of that size and only the best `screen_keep` are
+        fitted on the full data.
 
         Args:
             distributions (List[str], optional): List of distribution names to test.
                 Defaults to ["norm", "lognorm", "gamma"].
             bins (int, optional): Number of bins. Defaults to 100.
+            criterion (str, optional): "sse" of the histogram density, "aic",
+                "bic" or "ks" statistic; lower is better. Defaults to "sse".
+            n_workers (int, optional): Number of concurrent fits. Defaults to 1.
+            executor (str, optional): "thread" or "process". Defaults to "thread".
+            screen_size (int, optional): Subsample size for screening. Defaults to None.
+            screen_keep (int, optional): Candidates kept after screening. Defaults to 2.
+            seed (int, optional): Seed of the screening subsample. Defaults to 0.
+
+        Returns:
+            List[FitResult]: Successful fits, best first. Candidates dropped by
+                the screening follow, ranked by their screening score.
         """
 
         if distributions is None:
@@ -121,37 +335,111 @@ class Distributions:
             raise TypeError(
                 "`distributions` must be a valid scipy.stats distribution name."
             )
+        # batched fits have no pdf or parameters to score
+        unscored = [
+            name
+            for name in distributions
+            if name == "empirical" or name.endswith(".fast")
+        ]
+        if unscored:
+            raise ValueError(f"{unscored} cannot be ranked, use scipy.stats names.")
 
         if not isinstance(bins, int):
             raise TypeError("`bins` must be an integer.")
 
-        # Get histogram of original data
+        if criterion not in get_args(Criterion):
+            raise ValueError(f"`criterion` must be one of {get_args(Criterion)}.")
+
+        if executor not in ["thread", "process"]:
+            raise ValueError("`executor` must be 'thread' or 'process'.")
+
+        for name, attr in [("n_workers", n_workers), ("screen_keep", screen_keep)]:
+            if not isinstance(attr, int):
+                raise TypeError(f"`{name}` must be an integer.")
+            if attr < 1:
+                raise ValueError(f"`{name}` must be at least 1.")
+
+        if screen_size is not None:
+            if not isinstance(screen_size, int):
+                raise TypeError("`screen_size` must be an integer.")
+            if screen_size < self.min_len:
+                raise ValueError(f"`screen_size` must be at least {self.min_len}.")
+
         _data = self.data[~np.isnan(self.data)]
-        y, x = np.histogram(_data, bins=bins, density=True)
-        x = (x + np.roll(x, -1))[:-1] / 2.0
+        screened = []
+        if screen_size is not None and screen_size < len(_data):
+            rng = np.random.default_rng(seed)
+            sample = rng.choice(_data, size=screen_size, replace=False)
+            screened = self._evaluate(
+                sample, distributions, bins, criterion, n_workers, executor
+            )
+            distributions = [res.name for res in screened[:screen_keep]]
+            screened = screened[screen_keep:]
+            for res in screened:
+                res.screened_out = True
+
+        ranking = self._evaluate(
+            _data, distributions, bins, criterion, n_workers, executor
+        )
+        return ranking + screened
+
+    def _evaluate(self, data, distributions, bins, criterion, n_workers, executor):
+        pool_cls = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+        with pool_cls(max_workers=n_workers) as pool:
+            futures = [
+                pool.submit(_fit_candidate, data, name, bins, criterion)
+                for name in distributions
+            ]
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    warnings.warn(str(e))
+        return sorted(results, key=lambda res: res.score)
+
+    def best_fit(
+        self,
+        distributions: List[str] = None,
+        bins=100,
+        criterion: Criterion = "sse",
+        n_workers: int = 1,
+        executor: Literal["thread", "process"] = "thread",
+        screen_size: int = None,
+        screen_keep: int = 2,
+        seed: int = 0,
+    ):
+        """Find best fit distribution to data
+
+        See `rank_fits` for the ranking and timings of all candidates.
+
+        Args:
+            distributions (List[str], optional): List of distribution names to test.
+                Defaults to ["norm", "lognorm", "gamma"].
+            bins (int, optional): Number of bins. Defaults to 100.
+            criterion (str, optional): "sse", "aic", "bic" or "ks". Defaults to "sse".
+            n_workers (int, optional): Number of concurrent fits. Defaults to 1.
+            executor (str, optional): "thread" or "process". Defaults to "thread".
+            screen_size (int, optional): Subsample size for screening. Defaults to None.
+            screen_keep (int, optional): Candidates kept after screening. Defaults to 2.
+            seed (int, optional): Seed of the screening subsample. Defaults to 0.
+        """
 
-        # Best holders
-        best_dist: st.rv_continuous = getattr(st, "norm")
-        best_sse = np.inf
-
-        for dist_name in distributions:
-            # Try to fit the distribution
-            # print(dist_name)
-            try:
-                # fit dist to data
-                dist = self.fit(dist_type=dist_name, bins=bins)
-
-                # Calculate fitted PDF and error with fit in distribution
-                pdf = dist.pdf(x)
-                sse = np.sum(np.power(y - pdf, 2.0))
-
-                # identify if this distribution is better
-                if best_sse > sse > 0:
-                    best_dist = dist
-                    best_sse = sse
-            except Exception as e:
-                warnings.warn(str(e))
-                continue
-            # print(dist, params)
-
-        return best_dist
+        ranking = self.rank_fits(
+            distributions,
+            bins,
+            criterion=criterion,
+            n_workers=n_workers,
+            executor=executor,
+            screen_size=screen_size,
+            screen_keep=screen_keep,
+            seed=seed,
+        )
+        if all(res.screened_out for res in ranking):
+            raise ValueError("None of `distributions` could be fitted to the data.")
+        for res in ranking:
+            if not res.screened_out and (criterion != "sse" or res.score > 0):
+                return res.dist
+        from scipy import stats as st
+
+        return st.norm
@@ -0,0 +1,121 @@
+import sys
+
+import numpy as np
+
+from bias_adjustment.distributions.analytic import ParametricBatch
+from bias_adjustment.distributions.batched import (
+    DistributionBatch,
+    MaskedDistribution,
+    TableDistribution,
+)
+from bias_adjustment.distributions.sketch import HistogramSketch
+
+
+def dist_to_arrays(dist, prefix: str):
+    """Describe a fitted distribution as metadata and named arrays
+
+    Args:
+        dist: Fitted distribution: `TableDistribution`, `DistributionBatch`,
+            `ParametricBatch`, `MaskedDistribution`, `HistogramSketch`,
+            `scipy.stats.rv_histogram` or a frozen scipy.stats distribution.
+        prefix (str): Prefix of the array names.
+
+    Returns:
+        tuple: JSON-serializable metadata and a dict of arrays.
+    """
+    # scipy.stats objects only exist once it is imported; don't import it here
+    st = sys.modules.get("scipy.stats")
+    if isinstance(dist, TableDistribution):
+        return {"kind": "table"}, {
+            f"{prefix}.values": np.asarray(dist.values),
+            f"{prefix}.probs": np.asarray(dist.probs),
+        }
+    if isinstance(dist, HistogramSketch):
+        return {"kind": "sketch", "offset": dist.offset, "max_bins": dist.max_bins}, {
+            f"{prefix}.origin": dist.origin,
+            f"{prefix}.width": dist.width,
+            f"{prefix}.counts": dist.counts,
+        }
+    if isinstance(dist, MaskedDistribution):
+        meta, arrays = dist_to_arrays(dist.dist, prefix)
+        return {"kind": "masked", "n_cells": dist.n_cells, "dist": meta}, {
+            **arrays,
+            f"{prefix}.cells": np.asarray(dist.cells),
+        }
+    if isinstance(dist, ParametricBatch):
+        return {"kind": "params", "name": dist.dist_type}, {
+            f"{prefix}.params": np.asarray(dist.params)
+        }
+    if st is not None and isinstance(dist, st.rv_histogram):
+        hist, edges = dist._histogram
+        return {"kind": "hist"}, {
+            f"{prefix}.hist": np.asarray(hist),
+            f"{prefix}.edges": np.asarray(edges),
+        }
+    if isinstance(dist, DistributionBatch):
+        fitted = [d for d in dist.dists if d is not None]
+        if not fitted:
+            raise ValueError("`dist` has no fitted cells.")
+        name = fitted[0].dist.name
+        n_params = len(fitted[0].args)
+        params = np.full((len(dist.dists), n_params), np.nan)
+        for i, d in enumerate(dist.dists):
+            if d is not None:
+                params[i] = d.args
+        return {"kind": "batch", "name": name}, {f"{prefix}.params": params}
+    if (
+        st is not None
+        and isinstance(getattr(dist, "dist", None), st.rv_continuous)
+        and not dist.kwds
+    ):
+        return {"kind": "scipy", "name": dist.dist.name}, {
+            f"{prefix}.params": np.asarray(dist.args, dtype=float)
+        }
+    raise TypeError(f"Cannot serialize a `{type(dist).__name__}` distribution.")
+
+
+def dist_from_arrays(meta: dict, arrays: dict, prefix: str):
+    """Rebuild a fitted distribution described by `dist_to_arrays`
+
+    Args:
+        meta (dict): Distribution metadata.
+        arrays (dict): Arrays by name.
+        prefix (str): Prefix of the array names.
+    """
+    kind = meta["kind"]
+    if kind == "table":
+        return TableDistribution(arrays[f"{prefix}.values"], arrays[f"{prefix}.probs"])
+    if kind == "params":
+        return ParametricBatch(meta["name"], arrays[f"{prefix}.params"])
+    if kind == "sketch":
+        return HistogramSketch(
+            np.asarray(arrays[f"{prefix}.origin"]),
+            np.asarray(arrays[f"{prefix}.width"]),
+            np.array(arrays[f"{prefix}.counts"]),
+            meta["offset"],
+            meta["max_bins"],
+        )
+    if kind == "masked":
+        return MaskedDistribution(
+            dist_from_arrays(meta["dist"], arrays, prefix),
+            np.asarray(arrays[f"{prefix}.cells"]),
+            meta["n_cells"],
+        )
+    from scipy import stats as st
+
+    if kind == "hist":
+        return st.rv_histogram(
+            (
+                np.asarray(arrays[f"{prefix}.hist"]),
+                np.asarray(arrays[f"{prefix}.edges"]),
+            )
+        )
+    dist = getattr(st, meta["name"])
+    params = np.asarray(arrays[f"{prefix}.params"])
+    if kind == "batch":
+        return DistributionBatch(
+            [None if np.isnan(p).any() else dist(*p) for p in params]
+        )
+    if kind == "scipy":
+        return dist(*params)
+    raise ValueError(f"Unknown distribution kind `{kind}`.")
@@ -0,0 +1,238 @@
+import warnings
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from bias_adjustment.const import BINS
+from bias_adjustment.distributions.batched import TableDistribution
+from bias_adjustment.utils import FloatNDArray, is_float_ndarray
+
+
+@dataclass
+class HistogramSketch:
+    """Histogram of a growing record that can be updated and merged
+
+    Bin `b` of a cell covers `[origin + b * width, origin + (b + 1) * width)`.
+    The bins are fixed by the first data, so that new observations only add
+    counts: `update` costs O(new values) whatever the length of the record.
+    Values outside the current bins add bins of the same width; beyond
+    `max_bins` bins, pairs of bins are merged (doubling `width`). Sketches
+    sharing an origin, and widths differing by a power of two, merge
+    exactly, e.g. partial sketches of a record split between workers.
+
+    The sketch is a distribution: its cdf and ppf interpolate linearly within
+    the bins, as for "hist" fits, and it can be used as `o_dist` or `m_dist`
+    of `QuantileMapping` and `QuantileTransfer`.
+
+    Attributes:
+        origin (FloatNDArray): Bin origin, per cell for gridded data.
+        width (FloatNDArray): Bin width, per cell for gridded data.
+        counts (np.ndarray): Counts shaped (bins,) or (bins, cells).
+        offset (int): Bin index of `counts[0]`.
+        max_bins (int): Maximum number of bins. Defaults to 1000.
+    """
+
+    origin: FloatNDArray
+    width: FloatNDArray
+    counts: np.ndarray
+    offset: int = 0
+    max_bins: int = 5 * BINS
+    _table: TableDistribution = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        self.origin = np.asarray(self.origin, dtype=float)
+        self.width = np.asarray(self.width, dtype=float)
+        if not isinstance(self.counts, np.ndarray) or self.counts.ndim not in (1, 2):
+            raise TypeError("`counts` is not a 1-D or 2-D numpy array.")
+        if self.origin.shape != self.counts.shape[1:] or (
+            self.width.shape != self.counts.shape[1:]
+        ):
+            raise ValueError("`origin` and `width` must have one value per cell.")
+        for name in ["offset", "max_bins"]:
+            if not isinstance(getattr(self, name), int):
+                raise TypeError(f"`{name}` must be an integer.")
+        if self.max_bins < 2:
+            raise ValueError("`max_bins` must be at least 2.")
+
+    @classmethod
+    def from_data(cls, data: FloatNDArray, bins: int = BINS, max_bins: int = None):
+        """Sketch of `data`, with `bins` bins over its range
+
+        Gridded data shaped (time, cells) yields one histogram per cell.
+        Cells without valid values cannot be sketched and stay empty.
+
+        Args:
+            data (FloatNDArray): Input data. NaNs are ignored.
+            bins (int, optional): Number of bins. Defaults to 200.
+            max_bins (int, optional): Maximum number of bins. Defaults to 5 * `bins`.
+        """
+        if not is_float_ndarray(data) or data.ndim not in (1, 2):
+            raise TypeError("`data` is not a 1-D or 2-D float numpy array.")
+        if not isinstance(bins, int):
+            raise TypeError("`bins` must be an integer.")
+        if bins < 1:
+            raise ValueError("`bins` must be at least 1.")
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            first = np.nanmin(data, axis=0)
+            last = np.nanmax(data, axis=0)
+        # same range as `np.histogram`
+        same = first == last
+        first = np.where(same, first - 0.5, first)
+        last = np.where(same, last + 0.5, last)
+        width = (last - first) / bins
+
+        res = cls(
+            first,
+            width,
+            np.zeros((bins,) + data.shape[1:], dtype=np.int64),
+            max_bins=5 * bins if max_bins is None else max_bins,
+        )
+        # the maximum falls in the last bin, as in `np.histogram`
+        return res._add(np.where(data == last, last - width / 2, data))
+
+    def empty_like(self) -> "HistogramSketch":
+        """Empty sketch with the same bins, to sketch other parts of a record"""
+        return HistogramSketch(
+            self.origin,
+            self.width,
+            np.zeros_like(self.counts),
+            self.offset,
+            self.max_bins,
+        )
+
+    @property
+    def edges(self) -> FloatNDArray:
+        """Bin edges, shaped (bins + 1,) or (bins + 1, cells)"""
+        idx = np.arange(self.offset, self.offset + len(self.counts) + 1)
+        idx = idx.reshape((-1,) + (1,) * self.origin.ndim)
+        return self.origin + idx * self.width
+
+    @property
+    def n(self) -> np.ndarray:
+        """Number of values sketched, per cell for gridded data"""
+        return self.counts.sum(axis=0)
+
+    def update(self, data: FloatNDArray) -> "HistogramSketch":
+        """Add new observations, shaped (time,) or (time, cells)
+
+        Returns:
+            HistogramSketch: The updated sketch.
+        """
+        if not is_float_ndarray(data):
+            raise TypeError("`data` is not a float numpy array.")
+        if data.shape[1:] != self.counts.shape[1:]:
+            raise ValueError("`data` must have the cells of the sketch.")
+        return self._add(data)
+
+    def merge(self, other: "HistogramSketch") -> "HistogramSketch":
+        """Add the counts of another sketch of the same cells
+
+        Returns:
+            HistogramSketch: The merged sketch.
+        """
+        if not isinstance(other, HistogramSketch):
+            raise TypeError("`other` is not a HistogramSketch.")
+        if other.counts.shape[1:] != self.counts.shape[1:] or not np.array_equal(
+            other.origin, self.origin, equal_nan=True
+        ):
+            raise ValueError("Sketches must have the same cells and origin.")
+        log2 = _log2_ratio(other.width, self.width)
+        if log2 > 0:
+            self._coarsen(2**log2)
+        elif log2 < 0:
+            other = HistogramSketch(
+                other.origin, other.width, other.counts, other.offset
+            )._coarsen(2**-log2)
+        self._grow(other.offset, other.offset + len(other.counts))
+        start = other.offset - self.offset
+        self.counts[start : start + len(other.counts)] += other.counts
+        self._limit()
+        self._table = None
+        return self
+
+    def to_distribution(self) -> TableDistribution:
+        """The current distribution, as a table of edges and probabilities"""
+        if self._table is not None:
+            return self._table
+        cum = np.zeros(self.edges.shape)
+        np.cumsum(self.counts, axis=0, out=cum[1:])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cum /= cum[-1]
+        edges = self.edges
+        if cum.ndim > 1:
+            edges[:, np.isnan(cum[-1])] = np.nan
+        self._table = TableDistribution(edges, cum)
+        return self._table
+
+    def cdf(self, x: FloatNDArray) -> FloatNDArray:
+        return self.to_distribution().cdf(x)
+
+    def ppf(self, q: FloatNDArray) -> FloatNDArray:
+        return self.to_distribution().ppf(q)
+
+    def _add(self, data: FloatNDArray) -> "HistogramSketch":
+        with np.errstate(invalid="ignore"):
+            idx = np.floor((data - self.origin) / self.width)
+        valid = np.isfinite(idx)
+        if not valid.any():
+            return self
+        lo, hi = int(idx[valid].min()), int(idx[valid].max()) + 1
+        # coarsen first, so that a far outlier does not allocate a huge array
+        while max(hi, self.offset + len(self.counts)) - min(lo, self.offset) > (
+            self.max_bins
+        ):
+            self._coarsen(2)
+            idx = np.floor(idx / 2)
+            lo, hi = lo // 2, (hi - 1) // 2 + 1
+        self._grow(lo, hi)
+
+        idx = np.where(valid, idx, self.offset).astype(np.int64) - self.offset
+        if self.counts.ndim == 1:
+            self.counts += np.bincount(idx[valid], minlength=len(self.counts))
+        else:
+            n, k = self.counts.shape
+            flat = (idx * k + np.arange(k))[valid]
+            self.counts += np.bincount(flat, minlength=n * k).reshape(n, k)
+        self._table = None
+        return self
+
+    def _grow(self, lo: int, hi: int):
+        """Extend the bins to cover bin indices `lo:hi`"""
+        start = min(lo, self.offset)
+        stop = max(hi, self.offset + len(self.counts))
+        if (start, stop) == (self.offset, self.offset + len(self.counts)):
+            return
+        counts = np.zeros((stop - start,) + self.counts.shape[1:], dtype=np.int64)
+        counts[self.offset - start : self.offset - start + len(self.counts)] = (
+            self.counts
+        )
+        self.counts, self.offset = counts, start
+
+    def _coarsen(self, factor: int) -> "HistogramSketch":
+        """Merge every `factor` consecutive bins"""
+        start = self.offset // factor * factor
+        stop = -(-(self.offset + len(self.counts)) // factor) * factor
+        self._grow(start, stop)
+        shape = (len(self.counts) // factor, factor) + self.counts.shape[1:]
+        self.counts = self.counts.reshape(shape).sum(axis=1)
+        self.offset //= factor
+        self.width = self.width * factor
+        return self
+
+    def _limit(self):
+        while len(self.counts) > self.max_bins:
+            self._coarsen(2)
+
+
+def _log2_ratio(a: FloatNDArray, b: FloatNDArray) -> int:
+    """`log2(a / b)`, if it is the same integer in every cell"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        log2 = np.log2(a / b)
+    log2 = np.unique(log2[np.isfinite(log2)])
+    if len(log2) > 1 or (len(log2) and log2[0] != np.round(log2[0])):
+        raise ValueError("Sketch widths must differ by a power of two.")
+    return int(log2[0]) if len(log2) else 0
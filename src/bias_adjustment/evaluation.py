@@ -0,0 +1,269 @@
+"""Cross-validated skill of bias adjustment methods
+
+    records = cross_validate(obs, mod, ["qm", "dqm.rel", "qdm.rel"], folds=5)
+    pandas.DataFrame(records).groupby(["method", "metric"]).value.mean()
+
+`obs` and `mod` cover the same period. Every fold of time steps is
+adjusted with the methods fitted on the other folds, and its adjusted `mod`
+is compared with its `obs`. The result is a tidy table: one record per
+fold, method, dist_type and metric, averaged over the cells of a grid.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Literal
+
+import numpy as np
+
+from bias_adjustment.bias_adjustment import BiasAdjustment
+from bias_adjustment.const import BINS, TRACE_VAL
+from bias_adjustment.utils import FloatNDArray, is_float_ndarray, to_time_major
+
+METRICS = ["mean", "quantiles", "ks", "wet_freq"]
+QUANTILES = (0.1, 0.5, 0.9, 0.99)
+
+
+def kfold(n: int, k: int = 5) -> List[np.ndarray]:
+    """Indices of `k` contiguous folds of `n` time steps
+
+    Contiguous folds keep autocorrelated neighbours in the same fold.
+    """
+    if not isinstance(k, int):
+        raise TypeError("`k` must be an integer.")
+    if not 2 <= k <= n:
+        raise ValueError("`k` must be between 2 and the number of time steps.")
+    return np.array_split(np.arange(n), k)
+
+
+def year_folds(time: np.ndarray, years: int = 1) -> List[np.ndarray]:
+    """Indices of leave-`years`-out folds of consecutive years
+
+    Args:
+        time (np.ndarray): datetime64 time coordinates.
+        years (int, optional): Years per fold. Defaults to 1.
+    """
+    if not np.issubdtype(np.asarray(time).dtype, np.datetime64):
+        raise TypeError("`time` is not a datetime64 array.")
+    if not isinstance(years, int) or years < 1:
+        raise ValueError("`years` must be a positive integer.")
+    year = np.asarray(time).astype("datetime64[Y]").astype(int)
+    group = (year - year.min()) // years
+    return [np.flatnonzero(group == g) for g in np.unique(group)]
+
+
+def _sorted_quantiles(values: FloatNDArray, n: np.ndarray, quantiles) -> FloatNDArray:
+    """`np.quantile` of sorted columns with `n` valid values, NaNs last"""
+    pos = np.asarray(quantiles)[:, None] * np.maximum(n - 1, 0)
+    lo = np.floor(pos).astype(np.intp)
+    hi = np.minimum(lo + 1, np.maximum(n - 1, 0))
+    v_lo = np.take_along_axis(values, lo, axis=0)
+    v_hi = np.take_along_axis(values, hi, axis=0)
+    res = v_lo + (v_hi - v_lo) * (pos - lo)
+    res[:, n == 0] = np.nan
+    return res
+
+
+def ks_distance(a: FloatNDArray, b: FloatNDArray) -> FloatNDArray:
+    """Two-sample Kolmogorov-Smirnov distance of every column
+
+    The empirical cdfs of both samples are compared at every value of the
+    merged, sorted sample, ties included.
+
+    Args:
+        a (FloatNDArray): Sample shaped (time,) or (time, cells). NaNs are ignored.
+        b (FloatNDArray): Sample with the cells of `a`. NaNs are ignored.
+
+    Returns:
+        FloatNDArray: The distances, NaN for cells without values.
+    """
+    a2, b2 = (arr.reshape(len(arr), -1) for arr in [a, b])
+    n_a, n_b = (np.count_nonzero(~np.isnan(arr), axis=0) for arr in [a2, b2])
+    with np.errstate(divide="ignore"):
+        w_a, w_b = 1 / n_a, -1 / n_b
+    merged = np.concatenate([a2, b2])
+    weights = np.concatenate(
+        [np.where(np.isnan(a2), 0.0, w_a), np.where(np.isnan(b2), 0.0, w_b)]
+    )
+    order = np.argsort(merged, axis=0, kind="stable")
+    merged = np.take_along_axis(merged, order, axis=0)
+    diff = np.cumsum(np.take_along_axis(weights, order, axis=0), axis=0)
+    # the cdfs only differ after the last of tied values
+    last = np.ones(merged.shape, dtype=bool)
+    last[:-1] = merged[1:] != merged[:-1]
+    res = np.max(np.where(last, np.abs(diff), 0.0), axis=0)
+    res = np.where((n_a == 0) | (n_b == 0), np.nan, res)
+    return res[0] if a.ndim == 1 else res
+
+
+def skill(
+    adjusted: FloatNDArray,
+    obs: FloatNDArray,
+    metrics: List[str] = None,
+    quantiles=QUANTILES,
+    wet: float = TRACE_VAL,
+) -> dict:
+    """Skill metrics of adjusted values against observations, per cell
+
+    Args:
+        adjusted (FloatNDArray): Adjusted values shaped (time,) or (time, cells).
+        obs (FloatNDArray): Observations with the cells of `adjusted`.
+        metrics (List[str], optional): Any of "mean" (bias of the mean),
+            "quantiles" (bias of each of `quantiles`), "ks" (Kolmogorov-Smirnov
+            distance) and "wet_freq" (bias of the frequency of values above
+            `wet`). Defaults to all.
+        quantiles (optional): Quantiles of the "quantiles" metric.
+            Defaults to (0.1, 0.5, 0.9, 0.99).
+        wet (float, optional): Wet value threshold. Defaults to 0.05.
+
+    Returns:
+        dict: Metric name ("mean_bias", "q0.9_bias", "ks", "wet_freq_bias")
+            to values, a float or an array per cell.
+    """
+    metrics = METRICS if metrics is None else metrics
+    for name in metrics:
+        if name not in METRICS:
+            raise ValueError(f"`metrics` must be some of {METRICS}.")
+    a, o = (arr.reshape(len(arr), -1) for arr in [adjusted, obs])
+    n_a, n_o = (np.count_nonzero(~np.isnan(arr), axis=0) for arr in [a, o])
+    res = {}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if "mean" in metrics:
+            res["mean_bias"] = np.nansum(a, axis=0) / n_a - np.nansum(o, axis=0) / n_o
+        if "quantiles" in metrics:
+            q_a, q_o = (
+                _sorted_quantiles(np.sort(arr, axis=0), n, quantiles)
+                for arr, n in [(a, n_a), (o, n_o)]
+            )
+            for q, bias in zip(quantiles, q_a - q_o):
+                res[f"q{q:g}_bias"] = bias
+        if "ks" in metrics:
+            res["ks"] = ks_distance(a, o)
+        if "wet_freq" in metrics:
+            res["wet_freq_bias"] = (
+                np.count_nonzero(a > wet, axis=0) / n_a
+                - np.count_nonzero(o > wet, axis=0) / n_o
+            )
+    if adjusted.ndim == 1:
+        res = {name: float(value[0]) for name, value in res.items()}
+    return res
+
+
+def _evaluate_fold(
+    fold: int,
+    test: np.ndarray,
+    obs: FloatNDArray,
+    mod: FloatNDArray,
+    methods: list,
+    dist_types: list,
+    bins: int,
+    skill_kwargs: dict,
+    kwargs: dict,
+) -> list:
+    train = np.ones(len(obs), dtype=bool)
+    train[test] = False
+    ba = BiasAdjustment(obs[train], mod[train], **kwargs)
+
+    records = []
+    adjust = [m for m in methods if m != "raw"]
+    for dist_type in dist_types:
+        res = ba.adjust(mod[test], adjust, dist_type, bins=bins) if adjust else {}
+        if "raw" in methods:
+            res["raw"] = mod[test]
+        for method in methods:
+            scores = skill(res[method], obs[test], **skill_kwargs)
+            records.extend(
+                {
+                    "fold": fold,
+                    "method": method,
+                    "dist_type": dist_type,
+                    "metric": name,
+                    "value": float(np.nanmean(value)),
+                }
+                for name, value in scores.items()
+            )
+    return records
+
+
+def cross_validate(
+    obs: FloatNDArray,
+    mod: FloatNDArray,
+    methods: List[str] = None,
+    dist_types: List[str] = None,
+    folds=5,
+    metrics: List[str] = None,
+    quantiles=QUANTILES,
+    bins: int = BINS,
+    n_workers: int = 1,
+    executor: Literal["thread", "process"] = "thread",
+    axis: int = 0,
+    **kwargs,
+) -> List[dict]:
+    """Cross-validated skill of bias adjustment methods and dist_types
+
+    Folds are evaluated concurrently with `n_workers` threads or processes.
+    Every fold is fitted on its training time steps only, as
+    `BiasAdjustment(obs[train], mod[train])` would be; within a fold, all
+    methods share the fits of each dist_type.
+
+    Args:
+        obs (FloatNDArray): Observations shaped (time, ...) along `axis`.
+        mod (FloatNDArray): Model values over the same time steps.
+        methods (List[str], optional): Methods of `BiasAdjustment.adjust`, or
+            "raw" for the unadjusted `mod`. Defaults to ["qm"].
+        dist_types (List[str], optional): Distribution types. Defaults to ["hist"].
+        folds (int | list, optional): Number of contiguous folds, or the time
+            indices of every fold, e.g. from `year_folds`. Defaults to 5.
+        metrics (List[str], optional): Metrics of `skill`. Defaults to all.
+        quantiles (optional): Quantiles of the "quantiles" metric.
+            Defaults to (0.1, 0.5, 0.9, 0.99).
+        bins (int, optional): Number of bins. Defaults to 200.
+        n_workers (int, optional): Number of concurrent folds. Defaults to 1.
+        executor (str, optional): "thread" or "process". Defaults to "thread".
+        axis (int, optional): Time axis. Defaults to 0.
+        **kwargs: Other `BiasAdjustment` arguments, e.g. max_cdf, mask, tail.
+
+    Returns:
+        List[dict]: Records with the "fold", "method", "dist_type", "metric"
+            and "value" (averaged over cells) of every evaluation.
+    """
+    for name, attr in [("obs", obs), ("mod", mod)]:
+        if not is_float_ndarray(attr) or attr.ndim == 0:
+            raise TypeError(f"`{name}` is not a numpy array.")
+    if obs.shape != mod.shape:
+        raise ValueError("`obs` and `mod` must cover the same time steps.")
+    methods = ["qm"] if methods is None else methods
+    dist_types = ["hist"] if dist_types is None else dist_types
+    if executor not in ["thread", "process"]:
+        raise ValueError("`executor` must be 'thread' or 'process'.")
+    if not isinstance(n_workers, int):
+        raise TypeError("`n_workers` must be an integer.")
+    if n_workers < 1:
+        raise ValueError("`n_workers` must be at least 1.")
+
+    obs, mod = (to_time_major(arr, axis) for arr in [obs, mod])
+    if kwargs.get("mask") is not None:
+        kwargs["mask"] = np.ravel(kwargs["mask"])
+    tests = kfold(len(obs), folds) if isinstance(folds, int) else folds
+    skill_kwargs = {
+        "metrics": metrics,
+        "quantiles": quantiles,
+        "wet": kwargs.get("trace_val", TRACE_VAL),
+    }
+
+    pool_cls = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+    with pool_cls(max_workers=n_workers) as pool:
+        futures = [
+            pool.submit(
+                _evaluate_fold,
+                fold,
+                test,
+                obs,
+                mod,
+                methods,
+                dist_types,
+                bins,
+                skill_kwargs,
+                kwargs,
+            )
+            for fold, test in enumerate(tests)
+        ]
+        return [record for future in futures for record in future.result()]
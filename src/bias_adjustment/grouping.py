@@ -0,0 +1,253 @@
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from bias_adjustment.bias_adjustment import BiasAdjustment
+from bias_adjustment.const import BINS, CACHE_SIZE, MAX_CDF, TRACE_VAL
+from bias_adjustment.quantile_mapping.tails import TAILS
+from bias_adjustment.utils import (
+    FloatNDArray,
+    from_time_major,
+    grid_shape,
+    is_float_ndarray,
+    to_time_major,
+)
+
+DOY_PERIOD = 365
+
+_DOY_SPEC = re.compile(r"^doy(?:(?:±|\+-|\.)(\d+))?$")
+
+
+def parse_group(spec: str):
+    """Split a grouping spec into its kind and window half-width
+
+    Valid specs are "month", "season" (DJF, MAM, JJA, SON), "doy" and
+    "doy±<days>" (also written "doy.<days>"), a moving window of
+    `2 * days + 1` days around each day of the year.
+
+    Returns:
+        tuple: The kind ("month", "season" or "doy") and the window half-width.
+    """
+    if not isinstance(spec, str):
+        raise TypeError("`group` must be a string.")
+    if spec in ("month", "season"):
+        return spec, 0
+    match = _DOY_SPEC.match(spec)
+    if match is None:
+        raise ValueError(
+            '`group` must be one of "month", "season", "doy" or "doy±<days>".'
+        )
+    window = int(match.group(1) or 0)
+    if 2 * window + 1 > DOY_PERIOD:
+        raise ValueError("`group` window is longer than a year.")
+    return "doy", window
+
+
+def group_keys(time: np.ndarray, kind: str) -> np.ndarray:
+    """Group key of every time step
+
+    Months are numbered 1-12, seasons 0-3 starting with DJF and days of the
+    year 1-365; day 366 of leap years joins day 365, which would otherwise
+    have a quarter of the samples of the other days.
+    """
+    if kind == "doy":
+        days = time.astype("datetime64[D]")
+        doy = (days - days.astype("datetime64[Y]")).astype(int) + 1
+        return np.minimum(doy, DOY_PERIOD)
+    month = time.astype("datetime64[M]").astype(int) % 12 + 1
+    if kind == "season":
+        return month % 12 // 3
+    return month
+
+
+@dataclass
+class GroupIndex:
+    """Positions of the time steps of every group
+
+    The time steps are stably sorted by group key, so that every group is a
+    contiguous range of `order`. For moving windows, the days at either end
+    of the year are repeated on the other end, so that every window is
+    contiguous as well. Taking `order` once turns all groups into slices
+    (views) of the reordered array.
+
+    Attributes:
+        order (np.ndarray): Positions of the time steps, group by group.
+        window (dict): Range of `order` used to fit each group.
+        center (dict): Range of `order` of the time steps of each group.
+    """
+
+    time: np.ndarray
+    group: str = "month"
+    order: np.ndarray = field(init=False, repr=False)
+    window: dict = field(init=False, repr=False)
+    center: dict = field(init=False, repr=False)
+
+    def __post_init__(self):
+        if not (
+            isinstance(self.time, np.ndarray)
+            and np.issubdtype(self.time.dtype, np.datetime64)
+            and self.time.ndim == 1
+        ):
+            raise TypeError("`time` is not a 1-D numpy datetime64 array.")
+        kind, half = parse_group(self.group)
+
+        keys = group_keys(self.time, kind)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        if half:
+            head, tail = keys <= half, keys > DOY_PERIOD - half
+            order = np.concatenate([order[tail], order, order[head]])
+            keys = np.concatenate(
+                [keys[tail] - DOY_PERIOD, keys, keys[head] + DOY_PERIOD]
+            )
+        self.order = order
+
+        groups = np.unique(keys[(keys >= 1) & (keys <= DOY_PERIOD)] if half else keys)
+        lo = np.searchsorted(keys, groups, side="left")
+        hi = np.searchsorted(keys, groups, side="right")
+        w_lo = np.searchsorted(keys, groups - half, side="left")
+        w_hi = np.searchsorted(keys, groups + half, side="right")
+        self.center = {int(g): (a, b) for g, a, b in zip(groups, lo, hi)}
+        self.window = {int(g): (a, b) for g, a, b in zip(groups, w_lo, w_hi)}
+
+
+@dataclass
+class GroupedAdjustment:
+    """Bias adjustment fitted separately for every calendar group
+
+    The time steps of `obs`, `mod` and the data to adjust are grouped by
+    month, season or day of the year. Each group is fitted on its own
+    `BiasAdjustment`, which keeps its fits, so that adjusting several future
+    periods only fits the groups once. With a "doy±<days>" window, each day
+    of the year is fitted over the surrounding window, and only the values
+    of that day are adjusted, with the mean (dqm) or distribution (qdm) of
+    the data over the same window.
+    """
+
+    obs: FloatNDArray
+    mod: FloatNDArray
+    obs_time: np.ndarray
+    mod_time: np.ndarray
+    group: str = "month"
+    max_cdf: float = MAX_CDF
+    trace_val: float = TRACE_VAL
+    cache_size: int = CACHE_SIZE
+    axis: int = 0
+    mask: np.ndarray = field(default=None, repr=False)
+    tail: str = "clip"
+    _models: dict = field(default_factory=dict, init=False, repr=False)
+    _obs_index: GroupIndex = field(init=False, repr=False)
+    _mod_index: GroupIndex = field(init=False, repr=False)
+    _obs: FloatNDArray = field(init=False, repr=False)
+    _mod: FloatNDArray = field(init=False, repr=False)
+
+    def __post_init__(self):
+        if not isinstance(self.axis, int):
+            raise TypeError("`axis` must be an integer.")
+
+        for name in ["obs", "mod"]:
+            attr = getattr(self, name)
+            if not is_float_ndarray(attr) or attr.ndim == 0:
+                raise TypeError(f"`{name}` is not a numpy array.")
+            if not -attr.ndim <= self.axis < attr.ndim:
+                raise ValueError(f"`axis` is out of bounds for `{name}`.")
+
+        if grid_shape(self.obs, self.axis) != grid_shape(self.mod, self.axis):
+            raise ValueError(
+                "`obs` and `mod` must have the same shape except along `axis`."
+            )
+
+        if self.mask is not None and np.shape(self.mask) != grid_shape(
+            self.obs, self.axis
+        ):
+            raise ValueError("`mask` must have the shape of the grid.")
+        if self.tail not in TAILS:
+            raise ValueError(f"`tail` must be one of {TAILS}.")
+
+        self._obs_index = _index(self.obs, self.obs_time, self.group, self.axis)
+        self._mod_index = _index(self.mod, self.mod_time, self.group, self.axis)
+        # the single copy of the inputs: every group is a view of these
+        self._obs = to_time_major(self.obs, self.axis)[self._obs_index.order]
+        self._mod = to_time_major(self.mod, self.axis)[self._mod_index.order]
+
+    @property
+    def groups(self) -> list:
+        """Keys of the groups present in both `obs` and `mod`"""
+        return sorted(self._obs_index.window.keys() & self._mod_index.window.keys())
+
+    def model(self, key: int) -> BiasAdjustment:
+        """The `BiasAdjustment` of group `key`, created on first use"""
+        if key not in self._models:
+            if key not in self._obs_index.window or key not in self._mod_index.window:
+                raise ValueError(f"Group `{key}` is missing from `obs` or `mod`.")
+            o_lo, o_hi = self._obs_index.window[key]
+            m_lo, m_hi = self._mod_index.window[key]
+            self._models[key] = BiasAdjustment(
+                self._obs[o_lo:o_hi],
+                self._mod[m_lo:m_hi],
+                max_cdf=self.max_cdf,
+                trace_val=self.trace_val,
+                cache_size=self.cache_size,
+                mask=None if self.mask is None else np.ravel(self.mask),
+                tail=self.tail,
+            )
+        return self._models[key]
+
+    def adjust(
+        self,
+        data: FloatNDArray,
+        time: np.ndarray,
+        method="qm",
+        dist_type="hist",
+        ignore_trace: bool = False,
+        bins: int = BINS,
+    ) -> FloatNDArray:
+        """Adjust the bias of `data` group by group
+
+        Args:
+            data (FloatNDArray): Data to adjust.
+            time (np.ndarray): Time coordinates of `data` along `axis`.
+            method (str, optional): One of "qm", "dqm[.rel|.abs]", "qdm[.rel|.abs]". Defaults to "qm".
+            dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "hist".
+            ignore_trace (bool, optional): Ignore trace values? Defaults to "False".
+            bins (int, optional): Number of bins. Defaults to 200.
+
+        Returns:
+            FloatNDArray: The adjusted values, with the shape of `data`.
+        """
+        if not is_float_ndarray(data) or data.ndim == 0:
+            raise TypeError("`data` is not a numpy array.")
+        if not -data.ndim <= self.axis < data.ndim:
+            raise ValueError("`axis` is out of bounds for `data`.")
+        if grid_shape(data, self.axis) != grid_shape(self.obs, self.axis):
+            raise ValueError(
+                "`data` must have the same shape as `obs` except along `axis`."
+            )
+        index = _index(data, time, self.group, self.axis)
+        _data = to_time_major(data, self.axis)[index.order]
+
+        out = np.empty((data.shape[self.axis],) + _data.shape[1:])
+        for key, (lo, hi) in index.window.items():
+            c_lo, c_hi = index.center[key]
+            window = None if (lo, hi) == (c_lo, c_hi) else _data[lo:hi]
+            out[index.order[c_lo:c_hi]] = self.model(key).adjust(
+                _data[c_lo:c_hi],
+                method=method,
+                dist_type=dist_type,
+                ignore_trace=ignore_trace,
+                bins=bins,
+                fit_data=window,
+            )
+        return from_time_major(out, data.shape, self.axis)
+
+    def clear_cache(self):
+        """Drop the fits of all groups"""
+        self._models.clear()
+
+
+def _index(arr: FloatNDArray, time: np.ndarray, group: str, axis: int) -> GroupIndex:
+    index = GroupIndex(time, group)
+    if len(time) != arr.shape[axis]:
+        raise ValueError("`time` must have the length of the data along `axis`.")
+    return index
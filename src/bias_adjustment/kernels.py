@@ -0,0 +1,109 @@
+"""Optional compiled kernels of the quantile mapping hot loops
+
+With [numba](https://numba.pydata.org) installed and the environment
+variable `BIAS_ADJUSTMENT_NUMBA=1` (or `ENABLED = True` at runtime), the
+"hist" fits of gridded data and the cdf-then-ppf evaluations of tabulated
+distributions ("hist", "empirical" and sketches) run as compiled
+generalized ufuncs: one fused pass per cell, over a (time,) core
+dimension, instead of several NumPy passes that each allocate a
+temporary. They broadcast over the cells of a grid and run without the GIL,
+so threads adjust blocks concurrently.
+
+The kernels repeat the arithmetic of the NumPy paths, so results are
+identical. They are opt-in because importing numba takes about half a
+second and imports scipy, which the "empirical" paths otherwise avoid.
+numba is imported by the first kernel call; the kernels are compiled once
+and then loaded from numba's on-disk cache."""
+
+import functools
+import importlib.util
+import os
+
+import numpy as np
+
+from bias_adjustment.utils import FloatNDArray
+
+ENABLED = (
+    importlib.util.find_spec("numba") is not None
+    and os.environ.get("BIAS_ADJUSTMENT_NUMBA") == "1"
+)
+
+
+@functools.cache
+def _gufuncs():
+    # numba is imported by the first kernel call, not with the package
+    from bias_adjustment import _numba_kernels
+
+    return _numba_kernels.hist_table, _numba_kernels.qm, _numba_kernels.qdm
+
+
+def table(values: FloatNDArray, probs: FloatNDArray) -> tuple:
+    """Table of a distribution in kernel layout, to reuse across calls
+
+    Args:
+        values (FloatNDArray): Increasing values, shaped (m,) or (m, cells).
+        probs (FloatNDArray): Their cumulative probabilities.
+
+    Returns:
+        tuple: Values and probabilities as contiguous rows per cell.
+    """
+    return np.ascontiguousarray(values.T), np.ascontiguousarray(probs.T)
+
+
+def hist_table(data: FloatNDArray, bins: int = 200):
+    """Compiled `_hist_table`: edges and cumulative probabilities per column
+
+    Args:
+        data (FloatNDArray): Input data shaped (time, cells). NaNs are ignored.
+        bins (int, optional): Number of bins. Defaults to 200.
+    """
+    with np.errstate(invalid="ignore"):
+        edges, cum = _gufuncs()[0](np.ascontiguousarray(data.T), np.empty(bins + 1))
+    return edges.T, cum.T
+
+
+def qm(
+    data: FloatNDArray, m_table: tuple, o_table: tuple, max_cdf: float
+) -> FloatNDArray:
+    """Fused `o_dist.ppf(min(m_dist.cdf(data), max_cdf))` of tables
+
+    Args:
+        data (FloatNDArray): Time-major data, shaped (time,) or (time, cells).
+        m_table (tuple): `table` of the mod distribution.
+        o_table (tuple): `table` of the obs distribution.
+        max_cdf (float): Maximum cdf value.
+    """
+    with np.errstate(invalid="ignore"):
+        return _gufuncs()[1](data, *m_table, *o_table, max_cdf, axes=_axes(7))
+
+
+def qdm(
+    data: FloatNDArray,
+    f_table: tuple,
+    o_table: tuple,
+    h_table: tuple,
+    max_cdf: float,
+) -> tuple:
+    """Fused relative and absolute QDM adjustments of tables
+
+    Args:
+        data (FloatNDArray): Time-major data, shaped (time,) or (time, cells).
+        f_table (tuple): `table` of the future mod distribution.
+        o_table (tuple): `table` of the obs distribution.
+        h_table (tuple): `table` of the historical mod distribution.
+        max_cdf (float): Maximum cdf value.
+
+    Returns:
+        tuple: `o_ppf * (data / h_ppf)` and `o_ppf + data - h_ppf`, where
+            `o_ppf` and `h_ppf` are the obs and historical mod quantiles at
+            `min(f_cdf(data), max_cdf)`.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return _gufuncs()[2](
+            data, *f_table, *o_table, *h_table, max_cdf, axes=_axes(10, n_out=2)
+        )
+
+
+def _axes(n_args: int, n_out: int = 1) -> list:
+    """gufunc `axes`: time along axis 0 of the data and outputs"""
+    return [(0,)] + [(-1,)] * (n_args - n_out - 2) + [()] + [(0,)] * n_out
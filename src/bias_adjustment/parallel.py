@@ -0,0 +1,141 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from bias_adjustment.utils import FloatNDArray
+
+
+def _chunks(n_cells: int, chunk_size: int):
+    return [(i, min(i + chunk_size, n_cells)) for i in range(0, n_cells, chunk_size)]
+
+
+def _to_shared(arr: np.ndarray = None, shape: tuple = None):
+    """Shared memory block holding a copy of `arr`, or an empty float array"""
+    if arr is None:
+        dtype = np.dtype(np.float64)
+    else:
+        dtype, shape = arr.dtype, arr.shape
+    shm = shared_memory.SharedMemory(
+        create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1)
+    )
+    if arr is not None:
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf)[:] = arr
+    return shm, (shm.name, shape, dtype.str)
+
+
+def _adjust_chunk(start: int, stop: int, obs, mod, data, out, params: dict):
+    """Adjust the cells `start:stop` of (time, cells) arrays into `out`"""
+    from bias_adjustment.bias_adjustment import BiasAdjustment
+
+    # random values are seeded per chunk for reproducibility
+    seed = None if params["seed"] is None else [params["seed"], start]
+    ba = BiasAdjustment(
+        obs[:, start:stop],
+        mod[:, start:stop],
+        max_cdf=params["max_cdf"],
+        trace_val=params["trace_val"],
+        seed=seed,
+        adapt_freq=params["adapt_freq"],
+        mask=None if params.get("mask") is None else params["mask"][start:stop],
+        tail=params.get("tail", "clip"),
+    )
+    out[:, start:stop] = ba.adjust(
+        data[:, start:stop],
+        method=params["method"],
+        dist_type=params["dist_type"],
+        ignore_trace=params["ignore_trace"],
+        bins=params["bins"],
+    )
+
+
+def _adjust_shared_chunk(start: int, stop: int, specs: list, params: dict):
+    """Worker entry point: attach the shared arrays and adjust one chunk"""
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    try:
+        obs, mod, data, out = (
+            np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            for shm, (_, shape, dtype) in zip(blocks, specs)
+        )
+        _adjust_chunk(start, stop, obs, mod, data, out, params)
+        del obs, mod, data, out
+    finally:
+        for shm in blocks:
+            shm.close()
+
+
+def adjust_many(
+    obs: FloatNDArray,
+    mod: FloatNDArray,
+    data: FloatNDArray,
+    params: dict,
+    n_workers: int = None,
+    chunk_size: int = None,
+) -> FloatNDArray:
+    """Adjust independent series in parallel
+
+    The (time, cells) arrays are copied once into shared memory and the cells
+    are split into chunks of `chunk_size` columns, each adjusted by a worker
+    process. Chunks are fitted independently and seeded with
+    [`params["seed"]`, first cell], so the result does not depend on
+    `n_workers` or on the scheduling order. Without a seed, fresh entropy is
+    drawn once per call.
+
+    Args:
+        obs (FloatNDArray): Observed series shaped (time, cells).
+        mod (FloatNDArray): Modelled series shaped (time, cells).
+        data (FloatNDArray): Series to adjust shaped (time, cells).
+        params (dict): `BiasAdjustment` and `BiasAdjustment.adjust` arguments.
+        n_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        chunk_size (int, optional): Cells per task. Defaults to an even split in
+            four tasks per worker.
+
+    Returns:
+        FloatNDArray: The adjusted values shaped (time, cells).
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if not isinstance(n_workers, int):
+        raise TypeError("`n_workers` must be an integer.")
+    if n_workers < 1:
+        raise ValueError("`n_workers` must be at least 1.")
+
+    n_cells = data.shape[1]
+    if chunk_size is None:
+        chunk_size = max(1, math.ceil(n_cells / (4 * n_workers)))
+    if not isinstance(chunk_size, int):
+        raise TypeError("`chunk_size` must be an integer.")
+    if chunk_size < 1:
+        raise ValueError("`chunk_size` must be at least 1.")
+
+    chunks = _chunks(n_cells, chunk_size)
+    if params["seed"] is None:
+        params = {**params, "seed": np.random.SeedSequence().entropy}
+    if n_workers == 1 or len(chunks) == 1:
+        out = np.empty(data.shape)
+        for start, stop in chunks:
+            _adjust_chunk(start, stop, obs, mod, data, out, params)
+        return out
+
+    blocks, specs = [], []
+    try:
+        for arr in [obs, mod, data, None]:
+            shm, spec = _to_shared(arr, shape=data.shape)
+            blocks.append(shm)
+            specs.append(spec)
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = [
+                pool.submit(_adjust_shared_chunk, start, stop, specs, params)
+                for start, stop in chunks
+            ]
+            for future in futures:
+                future.result()
+        _, shape, dtype = specs[-1]
+        out = np.ndarray(shape, dtype=np.dtype(dtype), buffer=blocks[-1].buf).copy()
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    return out
@@ -0,0 +1,132 @@
+"""Opt-in timing of the adjustment pipeline
+
+Stages of the pipeline (validation, `generate_distribution`,
+`Distributions.fit`, `compute`, and the cdf/ppf evaluations) report their
+wall time and array sizes to every active `Profile`:
+
+    with Profile() as prof:
+        BiasAdjustment(obs, mod).adjust(data, method="qdm.rel")
+    print(prof.to_json())
+
+Without an active profile a stage costs a single check. Times are
+inclusive: a stage includes the time of the stages it calls. Work done in
+worker processes is not recorded.
+"""
+
+import functools
+import inspect
+import json
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+
+import numpy as np
+
+_profiles: list = []
+_lock = threading.Lock()
+_NULL = nullcontext()
+
+
+@dataclass
+class Profile:
+    """Wall time, call count and array size of every stage run while active
+
+    Attributes:
+        stages (dict): Per-stage "calls", "time" (seconds) and "size" (total
+            number of array elements processed).
+    """
+
+    stages: dict = field(default_factory=dict)
+
+    def __enter__(self):
+        with _lock:
+            _profiles.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        with _lock:
+            _profiles.remove(self)
+
+    def add(self, name: str, elapsed: float, size: int = 0):
+        """Record one call of stage `name`"""
+        with _lock:
+            stats = self.stages.setdefault(name, {"calls": 0, "time": 0.0, "size": 0})
+            stats["calls"] += 1
+            stats["time"] += elapsed
+            stats["size"] += size
+
+    def summary(self) -> dict:
+        """Stages sorted by decreasing time, with their mean time per call"""
+        return {
+            name: {**stats, "mean_time": stats["time"] / stats["calls"]}
+            for name, stats in sorted(
+                self.stages.items(), key=lambda item: -item[1]["time"]
+            )
+        }
+
+    def to_json(self, path: str = None, indent: int = 2) -> str:
+        """JSON summary, also written to `path` if given"""
+        res = json.dumps(self.summary(), indent=indent)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(res)
+        return res
+
+
+class _Stage:
+    __slots__ = ("name", "size", "start")
+
+    def __init__(self, name: str, size: int = 0):
+        self.name = name
+        self.size = size
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        for prof in list(_profiles):
+            prof.add(self.name, elapsed, self.size)
+
+
+def stage(name: str, size: int = 0):
+    """Context manager timing a stage, or a no-op without an active profile"""
+    if not _profiles:
+        return _NULL
+    return _Stage(name, size)
+
+
+def _size(bound: inspect.BoundArguments) -> int:
+    """Elements of the largest array argument, or of `self.data`"""
+    arrays = [v for v in bound.arguments.values() if isinstance(v, np.ndarray)]
+    data = getattr(bound.arguments.get("self"), "data", None)
+    if isinstance(data, np.ndarray):
+        arrays.append(data)
+    return max((arr.size for arr in arrays), default=0)
+
+
+def timed(name: str):
+    """Decorator timing every call of a function as a stage
+
+    Args:
+        name (str): Stage name, formatted with the call arguments, e.g.
+            "fit.{dist_type}".
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _profiles:
+                return func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            with _Stage(name.format(**bound.arguments), _size(bound)):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
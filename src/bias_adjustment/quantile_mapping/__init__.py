@@ -1,9 +1,12 @@
 from bias_adjustment.quantile_mapping.qm import QuantileMapping
 from bias_adjustment.quantile_mapping.dqm import DetrendedQuantileMapping
 from bias_adjustment.quantile_mapping.qdm import QuantileDeltaMapping
+from bias_adjustment.quantile_mapping.transfer import QuantileTransfer, TransferTable
 
 __all__ = [
     QuantileMapping,
     DetrendedQuantileMapping,
     QuantileDeltaMapping,
+    QuantileTransfer,
+    TransferTable,
 ]
@@ -3,42 +3,67 @@ from typing import get_args
 
 import numpy as np
 
+from bias_adjustment.profiling import timed
 from bias_adjustment.quantile_mapping.qm import QuantileMapping
-from bias_adjustment.utils import BAMode, FloatNDArray
+from bias_adjustment.quantile_mapping.transfer import _Transfer
+from bias_adjustment.utils import (
+    BAMode,
+    FloatNDArray,
+    map_blocks,
+    output_array,
+    to_time_major,
+)
 
 
 @dataclass
 class DetrendedQuantileMapping(QuantileMapping):
+    def _mean(self, arr: FloatNDArray):
+        arr = to_time_major(arr, self.axis)
+        if self.mask is None:
+            return np.nanmean(arr, axis=0, dtype=float)
+        res = np.full(arr.shape[1], np.nan)
+        res[self.mask] = np.nanmean(arr[:, self.mask], axis=0, dtype=float)
+        return res
+
     def delta(self, mode: BAMode = "rel"):
-        mod_mean = np.nanmean(self.mod)
-        dat_mean = np.nanmean(self.data)
+        mod_mean = self._mean(self.mod)
+        # the mean of `fit_data` stands in for that of `data` when given
+        dat_mean = self._mean(self.data if self.fit_data is None else self.fit_data)
         if mode == "rel":
             return dat_mean / mod_mean
         elif mode == "abs":
             return dat_mean - mod_mean
         return None
 
+    @timed("compute.dqm")
     def compute(
         self,
         mode: BAMode = "rel",
         dist_type="hist",
         ignore_trace: bool = False,
+        dtype=None,
+        out: FloatNDArray = None,
     ) -> FloatNDArray:
         if mode not in get_args(BAMode):
             raise ValueError(f"Length of `mode` must be {get_args(BAMode)}.")
 
-        o_dist = self.generate_distribution(
-            self.obs, dist_type, ignore_trace, self.trace_val
-        )
-        m_dist = self.generate_distribution(
-            self.mod, dist_type, ignore_trace, self.trace_val
+        o_dist, m_dist = self.fit_distributions(dist_type, ignore_trace)
+        transfer = _Transfer(
+            o_dist, m_dist, self.max_cdf, tail=self.fit_tail(o_dist, m_dist)
         )
-
         delta = self.delta(mode)
-        if mode == "rel":
-            m_cdf = np.minimum(self.max_cdf, m_dist.cdf(self.data / delta))
-            return o_dist.ppf(m_cdf) * delta
-        elif mode == "abs":
-            m_cdf = np.minimum(self.max_cdf, m_dist.cdf(self.data - delta))
-            return o_dist.ppf(m_cdf) + delta
-        return o_dist.ppf(m_cdf)
+
+        def adjust(data):
+            if mode == "rel":
+                data = data / delta
+            elif mode == "abs":
+                data = data - delta
+            res = transfer(data)
+            if mode == "rel":
+                res *= delta
+            elif mode == "abs":
+                res += delta
+            return res
+
+        out = output_array(self.data, out, dtype)
+        return map_blocks(adjust, self.data, out, self.axis)
@@ -1,37 +1,172 @@
-from dataclasses import dataclass
-from typing import get_args
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Dict, Sequence, get_args
 
 import numpy as np
 
+from bias_adjustment import kernels
+from bias_adjustment.profiling import stage, timed
 from bias_adjustment.quantile_mapping.qm import QuantileMapping
-from bias_adjustment.utils import BAMode, FloatNDArray
+from bias_adjustment.quantile_mapping.transfer import _kernel_table
+from bias_adjustment.utils import (
+    BAMode,
+    FloatNDArray,
+    map_blocks,
+    output_array,
+    to_time_major,
+)
+
+
+def _windows(n: int, window: int = None, step: int = None):
+    """Blocks of `step` time steps and the `window` centred on each
+
+    Windows at either end of the series are shifted to stay within it.
+
+    Returns:
+        list: (start, stop, window start, window stop) of every block.
+    """
+    if window is None or window >= n:
+        return [(0, n, 0, n)]
+    res = []
+    for start in range(0, n, step):
+        w_start = min(max(start + step // 2 - window // 2, 0), n - window)
+        res.append((start, min(start + step, n), w_start, w_start + window))
+    return res
 
 
 @dataclass
 class QuantileDeltaMapping(QuantileMapping):
+    """Quantile delta mapping (Cannon et al. 2015)
+
+    By default the distribution of `data` is fitted over the whole series.
+    With a moving `window` of time steps, it is fitted over the window
+    centred on every block of `step` time steps instead, and applied to
+    that block only, as for long non-stationary projections (e.g. a 30-year
+    window and 10-year steps). With `fit_data`, it is fitted over
+    `fit_data` instead, e.g. a longer period around `data`.
+    """
+
+    window: int = field(default=None, kw_only=True)
+    step: int = field(default=None, kw_only=True)
+
+    def __post_init__(self):
+        super().__post_init__()
+        if self.tail != "clip":
+            raise ValueError('`tail` only applies to "qm" and "dqm".')
+        if self.fit_data is not None and (self.window, self.step) != (None, None):
+            raise ValueError("`window` and `step` do not apply with `fit_data`.")
+        if self.window is None:
+            if self.step is not None:
+                raise ValueError("`step` requires a `window`.")
+            return
+
+        min_len = 10
+        for name in ["window", "step"]:
+            attr = getattr(self, name)
+            if attr is not None and not isinstance(attr, int):
+                raise TypeError(f"`{name}` must be an integer.")
+        if self.window < min_len:
+            raise ValueError(f"`window` must be at least {min_len}.")
+        if self.step is None:
+            self.step = max(self.window // 3, 1)
+        if not 1 <= self.step <= self.window:
+            raise ValueError("`step` must be between 1 and `window`.")
+
+    @timed("compute.qdm")
     def compute(
         self,
         mode: BAMode = "rel",
         dist_type="hist",
         ignore_trace: bool = False,
+        dtype=None,
+        out: FloatNDArray = None,
     ) -> FloatNDArray:
         if mode not in get_args(BAMode):
             raise ValueError(f"Length of `mode` must be {get_args(BAMode)}.")
 
-        o_dist = self.generate_distribution(
-            self.obs, dist_type, ignore_trace, self.trace_val
-        )
-        mh_dist = self.generate_distribution(
-            self.mod, dist_type, ignore_trace, self.trace_val
-        )
-        mf_dist = self.generate_distribution(
-            self.data, dist_type, ignore_trace, self.trace_val
-        )
-
-        mf_cdf = np.minimum(self.max_cdf, mf_dist.cdf(self.data))
-
-        if mode == "rel":  # Relative
-            return o_dist.ppf(mf_cdf) * (self.data / mh_dist.ppf(mf_cdf))
-        elif mode == "abs":  # Absolute
-            return o_dist.ppf(mf_cdf) + self.data - mh_dist.ppf(mf_cdf)
-        return o_dist.ppf(mf_cdf)
+        outs = {mode: output_array(self.data, out, dtype)}
+        return self._compute(outs, dist_type, ignore_trace)[mode]
+
+    @timed("compute.qdm")
+    def compute_modes(
+        self,
+        modes: Sequence[BAMode] = ("rel", "abs"),
+        dist_type="hist",
+        ignore_trace: bool = False,
+        dtype=None,
+    ) -> Dict[str, FloatNDArray]:
+        """Adjust the bias with several modes in one pass
+
+        The distributions are fitted once and the quantiles of `data` are
+        shared by all modes.
+
+        Args:
+            modes (Sequence[BAMode], optional): Modes to compute. Defaults to ("rel", "abs").
+            dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "hist".
+            ignore_trace (bool, optional): Ignore trace values? Defaults to "False".
+            dtype (optional): Floating dtype of the results. Defaults to float64.
+
+        Returns:
+            Dict[str, FloatNDArray]: The adjusted values by mode.
+        """
+        for mode in modes:
+            if mode not in get_args(BAMode):
+                raise ValueError(f"Length of `mode` must be {get_args(BAMode)}.")
+
+        outs = {mode: output_array(self.data, None, dtype) for mode in modes}
+        return self._compute(outs, dist_type, ignore_trace)
+
+    def _compute(self, outs: dict, dist_type="hist", ignore_trace: bool = False):
+        o_dist, mh_dist = self.fit_distributions(dist_type, ignore_trace)
+        data = to_time_major(self.data, self.axis)
+
+        # the fused kernel computes both modes of tabulated distributions
+        tables = None
+        if kernels.ENABLED:
+            tables = tuple(_kernel_table(d) for d in [o_dist, mh_dist])
+            if None in tables:
+                tables = None
+
+        def adjust(data, mf_dist, mf_table):
+            if mf_table is not None:
+                with stage("transfer", data.size):
+                    rel, abs_ = kernels.qdm(data, mf_table, *tables, self.max_cdf)
+                return tuple(rel if mode == "rel" else abs_ for mode in outs)
+            with stage("cdf", data.size):
+                mf_cdf = mf_dist.cdf(data)
+            np.minimum(mf_cdf, self.max_cdf, out=mf_cdf)
+            with stage("ppf", 2 * data.size):
+                o_ppf = o_dist.ppf(mf_cdf)
+                mh_ppf = mh_dist.ppf(mf_cdf)
+            res = []
+            for mode in outs:
+                if mode == "rel":  # Relative
+                    res.append(o_ppf * (data / mh_ppf))
+                elif mode == "abs":  # Absolute
+                    res.append(o_ppf + data - mh_ppf)
+            return tuple(res)
+
+        blocks = _windows(len(data), self.window, self.step)
+        if self.fit_data is not None:
+            data = to_time_major(self.fit_data, self.axis)
+            blocks = [(0, blocks[0][1], 0, len(data))]
+        index = [slice(None)] * self.data.ndim
+        for start, stop, w_start, w_stop in blocks:
+            mf_dist = self.generate_distribution(
+                data[w_start:w_stop],
+                dist_type,
+                ignore_trace,
+                self.trace_val,
+                self.bins,
+                self._rng,
+                self.mask,
+            )
+            mf_table = None if tables is None else _kernel_table(mf_dist)
+            index[self.axis] = slice(start, stop)
+            map_blocks(
+                partial(adjust, mf_dist=mf_dist, mf_table=mf_table),
+                self.data[tuple(index)],
+                tuple(out[tuple(index)] for out in outs.values()),
+                self.axis,
+            )
+        return outs
@@ -1,10 +1,21 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Any
 
 import numpy as np
 
-from bias_adjustment.const import MAX_CDF, TRACE_VAL
+from bias_adjustment.const import BINS, MAX_CDF, TRACE_VAL
 from bias_adjustment.distributions import Distributions
-from bias_adjustment.utils import FloatNDArray, is_float_ndarray, rand_trace
+from bias_adjustment.profiling import timed
+from bias_adjustment.quantile_mapping.tails import TAILS, Tail
+from bias_adjustment.quantile_mapping.transfer import QuantileTransfer, _Transfer
+from bias_adjustment.utils import (
+    FloatNDArray,
+    grid_shape,
+    is_float_ndarray,
+    jitter_trace,
+    output_array,
+    to_time_major,
+)
 
 
 @dataclass
@@ -14,16 +25,57 @@ class QuantileMapping:
     data: FloatNDArray
     max_cdf: float = MAX_CDF
     trace_val: float = TRACE_VAL
+    bins: int = field(default=BINS, kw_only=True)
+    axis: int = field(default=0, kw_only=True)
+    o_dist: Any = field(default=None, repr=False, kw_only=True)
+    m_dist: Any = field(default=None, repr=False, kw_only=True)
+    seed: Any = field(default=None, repr=False, kw_only=True)
+    mask: np.ndarray = field(default=None, repr=False, kw_only=True)
+    tail: str = field(default="clip", kw_only=True)
+    fit_data: FloatNDArray = field(default=None, repr=False, kw_only=True)
+    _trusted: bool = field(default=False, repr=False, compare=False, kw_only=True)
+    _rng: np.random.Generator = field(init=False, repr=False)
 
+    @timed("validate")
     def __post_init__(self):
-        for name in ["obs", "mod", "data"]:
+        # `BiasAdjustment` validates its inputs once and passes `_trusted`
+        if not self._trusted:
+            self._validate()
+        if self.mask is not None:
+            self.mask = np.ravel(self.mask)
+        self._rng = np.random.default_rng(self.seed)
+
+    def _validate(self):
+        if not isinstance(self.axis, int):
+            raise TypeError("`axis` must be an integer.")
+
+        for name in ["obs", "mod", "data", "fit_data"]:
             attr = getattr(self, name)
-            if not is_float_ndarray(attr):
+            if name == "fit_data" and attr is None:
+                continue
+            if not is_float_ndarray(attr) or attr.ndim == 0:
                 raise TypeError(f"`{name}` is not a numpy array.")
+            if not -attr.ndim <= self.axis < attr.ndim:
+                raise ValueError(f"`axis` is out of bounds for `{name}`.")
             min_len = 10
-            if len(attr) < min_len:
+            if attr.shape[self.axis] < min_len:
                 raise ValueError(f"Length of `{name}` must be greater than {min_len}.")
 
+        if not (
+            grid_shape(self.obs, self.axis)
+            == grid_shape(self.mod, self.axis)
+            == grid_shape(self.data, self.axis)
+        ):
+            raise ValueError(
+                "`obs`, `mod` and `data` must have the same shape except along `axis`."
+            )
+        if self.fit_data is not None and grid_shape(
+            self.fit_data, self.axis
+        ) != grid_shape(self.data, self.axis):
+            raise ValueError(
+                "`fit_data` must have the same shape as `data` except along `axis`."
+            )
+
         for name in ["max_cdf", "trace_val"]:
             attr = getattr(self, name)
             if not isinstance(attr, float):
@@ -32,12 +84,28 @@ class QuantileMapping:
                 if attr < 0.5 or attr >= 1:
                     raise ValueError((f"`{name}` should be [0.5, 1)."))
 
+        if not isinstance(self.bins, int):
+            raise TypeError("`bins` must be an integer.")
+
+        if self.mask is not None:
+            if not (isinstance(self.mask, np.ndarray) and self.mask.dtype == bool):
+                raise TypeError("`mask` is not a boolean numpy array.")
+            if self.obs.ndim == 1 or self.mask.shape != grid_shape(self.obs, self.axis):
+                raise ValueError("`mask` must have the shape of the grid.")
+
+        if self.tail not in TAILS:
+            raise ValueError(f"`tail` must be one of {TAILS}.")
+
     @staticmethod
+    @timed("generate_distribution")
     def generate_distribution(
         data: FloatNDArray,
         dist_type="hist",
         ignore_trace: bool = False,
         trace_val: float = TRACE_VAL,
+        bins: int = BINS,
+        rng: np.random.Generator = None,
+        mask: np.ndarray = None,
     ):
         f"""Generate Distribution
         Args:
@@ -45,36 +113,111 @@ class QuantileMapping:
             dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "hist".
             ignore_trace (bool, optional): Ignore trace values? Defaults to "False".
             trace_val (float, optional): Trace value. Ignored when `ignore_trace` = False Defaults to `{TRACE_VAL}`.
+            bins (int, optional): Number of bins. Defaults to `{BINS}`.
+            rng (np.random.Generator, optional): Random generator of the trace values. Defaults to a new one.
+            mask (np.ndarray, optional): Boolean mask of the cells of gridded data to fit. Defaults to all cells.
         """
-        if ignore_trace:
-            _data = data[data > 0].copy()  # ignore zeroes
-            _data[_data < trace_val] = rand_trace(
-                trace_val
-            )  # replace trace with random values (0, trace_val]
+        if ignore_trace and data.ndim > 1:
+            # ignore zeroes, keep the grid
+            _data = jitter_trace(data, trace_val, rng)
+        elif ignore_trace:
+            # ignore zeroes, replace trace with random values (0, trace_val]
+            _data = data[data > 0].astype(np.float64, copy=False)
+            jitter_trace(_data, trace_val, rng, out=_data)
         else:
-            _data = data.copy()
-        return Distributions(_data).fit(dist_type)
+            _data = data.astype(np.float64)
+        return Distributions(_data, mask=mask if _data.ndim > 1 else None).fit(
+            dist_type, bins
+        )
+
+    def fit_distributions(self, dist_type="hist", ignore_trace: bool = False):
+        """Fit the obs and mod distributions, reusing `o_dist`/`m_dist` if given
+
+        Args:
+            dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "hist".
+            ignore_trace (bool, optional): Ignore trace values? Defaults to "False".
+
+        Returns:
+            tuple: The obs and mod distributions.
+        """
+        o_dist = self.o_dist
+        if o_dist is None:
+            o_dist = self.generate_distribution(
+                to_time_major(self.obs, self.axis),
+                dist_type,
+                ignore_trace,
+                self.trace_val,
+                self.bins,
+                self._rng,
+                self.mask,
+            )
+        m_dist = self.m_dist
+        if m_dist is None:
+            m_dist = self.generate_distribution(
+                to_time_major(self.mod, self.axis),
+                dist_type,
+                ignore_trace,
+                self.trace_val,
+                self.bins,
+                self._rng,
+                self.mask,
+            )
+        return o_dist, m_dist
 
+    def fit_tail(self, o_dist, m_dist) -> Tail:
+        """Tail of the transfer function of `o_dist` and `m_dist`, see `Tail.fit`
+
+        Returns:
+            Tail: The tail, or None for the "clip" tail.
+        """
+        if self.tail == "clip":
+            return None
+        return Tail.fit(
+            self.tail,
+            o_dist,
+            m_dist,
+            self.max_cdf,
+            to_time_major(self.obs, self.axis),
+            to_time_major(self.mod, self.axis),
+        )
+
+    def transfer(
+        self, dist_type="hist", ignore_trace: bool = False
+    ) -> QuantileTransfer:
+        """Fitted transfer function, to apply to data in chunks
+
+        Args:
+            dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "hist".
+            ignore_trace (bool, optional): Ignore trace values? Defaults to "False".
+
+        Returns:
+            QuantileTransfer: The transfer function.
+        """
+        o_dist, m_dist = self.fit_distributions(dist_type, ignore_trace)
+        tail = self.fit_tail(o_dist, m_dist)
+        return QuantileTransfer(o_dist, m_dist, self.max_cdf, self.axis, tail=tail)
+
+    @timed("compute.qm")
     def compute(
         self,
         dist_type="hist",
         ignore_trace: bool = False,
+        dtype=None,
+        out: FloatNDArray = None,
     ) -> FloatNDArray:
         """Adjust the bias
 
         Args:
             dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "hist".
             ignore_trace (bool, optional): Ignore trace values? Defaults to "False".
+            dtype (optional): Floating dtype of the result. Defaults to float64.
+            out (FloatNDArray, optional): Array to write the adjusted values into. Defaults to a new array.
 
         Returns:
             FloatNDArray: The adjusted values.
         """
-        o_dist = self.generate_distribution(
-            self.obs, dist_type, ignore_trace, self.trace_val
-        )
-        m_dist = self.generate_distribution(
-            self.mod, dist_type, ignore_trace, self.trace_val
+        o_dist, m_dist = self.fit_distributions(dist_type, ignore_trace)
+        tail = self.fit_tail(o_dist, m_dist)
+        return _Transfer(o_dist, m_dist, self.max_cdf, self.axis, tail).transform(
+            self.data, output_array(self.data, out, dtype)
         )
-
-        m_cdf = np.minimum(self.max_cdf, m_dist.cdf(self.data))
-        return o_dist.ppf(m_cdf)
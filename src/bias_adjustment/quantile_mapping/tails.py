@@ -0,0 +1,264 @@
+import warnings
+from dataclasses import dataclass
+
+import numpy as np
+
+from bias_adjustment.const import TAIL_Q
+from bias_adjustment.distributions.analytic import ParametricBatch
+from bias_adjustment.distributions.batched import (
+    DistributionBatch,
+    MaskedDistribution,
+    TableDistribution,
+)
+from bias_adjustment.distributions.sketch import HistogramSketch
+from bias_adjustment.utils import FloatNDArray
+
+TAILS = ["clip", "constant", "linear", "gpd"]
+
+
+def _n_cells(dist):
+    """Number of cells of a gridded distribution, None for a single series"""
+    if isinstance(dist, MaskedDistribution):
+        return dist.n_cells
+    if isinstance(dist, DistributionBatch):
+        return len(dist.dists)
+    if isinstance(dist, HistogramSketch):
+        shape = dist.counts.shape[1:]
+    elif isinstance(dist, TableDistribution):
+        shape = np.shape(dist.values)[1:]
+    elif isinstance(dist, ParametricBatch):
+        shape = np.shape(dist.params)[1:]
+    else:
+        shape = ()
+    return shape[0] if shape else None
+
+
+def _ppf(dist, probs: list, n_cells: int = None) -> FloatNDArray:
+    """Quantiles at `probs`, shaped (len(probs),) or (len(probs), cells)"""
+    q = np.array(probs, dtype=float)
+    if n_cells is not None:
+        q = np.repeat(q[:, None], n_cells, axis=1)
+    return dist.ppf(q)
+
+
+def _fit_gpd(excess: FloatNDArray, min_len: int = 10) -> FloatNDArray:
+    """Generalized Pareto shape and scale of excesses, per column
+
+    Probability weighted moments estimators (Hosking and Wallis 1987), with
+    the location fixed at 0. Columns with fewer than `min_len` excesses get
+    NaN parameters.
+
+    Args:
+        excess (FloatNDArray): Excesses over a threshold shaped (time, cells),
+            NaN below the threshold.
+        min_len (int, optional): Minimum number of excesses. Defaults to 10.
+
+    Returns:
+        FloatNDArray: Shape (scipy.stats.genpareto `c`) and scale, shaped (2, cells).
+    """
+    values = np.sort(excess, axis=0)
+    n = np.count_nonzero(~np.isnan(values), axis=0)
+    # weights (n - j) / (n - 1) of the ascending values j = 1..n
+    j = np.arange(1, len(values) + 1)[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weights = (n - j) / (n - 1)
+        a0 = np.nansum(values, axis=0) / n
+        a1 = np.nansum(values * weights, axis=0) / n
+        scale = 2 * a0 * a1 / (a0 - 2 * a1)
+        shape = 2 - a0 / (a0 - 2 * a1)
+    params = np.stack([shape, scale])
+    params[:, (n < min_len) | ~(scale > 0)] = np.nan
+    return params
+
+
+def _constant(excess: FloatNDArray, params: FloatNDArray) -> FloatNDArray:
+    (value,) = params
+    return value + excess
+
+
+def _linear(excess: FloatNDArray, params: FloatNDArray) -> FloatNDArray:
+    value, slope = params
+    return value + slope * excess
+
+
+def _gpd(excess: FloatNDArray, params: FloatNDArray) -> FloatNDArray:
+    m_shape, m_scale, o_start, o_shape, o_scale, min_log_sf = params
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        # conditional log survival of the mod excess, bounded by `min_log_sf`
+        # (also beyond the upper endpoint of a mod GPD with a negative shape)...
+        z = np.maximum(m_shape * excess / m_scale, -1.0)
+        log_sf = np.where(
+            np.abs(m_shape) < 1e-8, -excess / m_scale, -np.log1p(z) / m_shape
+        )
+        log_sf = np.maximum(log_sf, min_log_sf)
+        # ...mapped to the obs excess of the same survival, at most the upper
+        # endpoint of an obs GPD with a negative shape
+        res = np.where(
+            np.abs(o_shape) < 1e-8,
+            -o_scale * log_sf,
+            o_scale * np.expm1(-o_shape * log_sf) / o_shape,
+        )
+        res = np.where(o_shape < 0, np.minimum(res, -o_scale / o_shape), res)
+    return o_start + res
+
+
+_TAIL_FUNCS = {"constant": _constant, "linear": _linear, "gpd": _gpd}
+
+
+@dataclass
+class Tail:
+    """Adjustment of the values above the calibration range
+
+    Values of a cell above `start` are adjusted from their excess over
+    `start`, by mode:
+
+    - "constant": the adjustment at `start` is kept, as an offset.
+    - "linear": the quantile-quantile slope between the `q` and `max_cdf`
+      quantiles is extended.
+    - "gpd": generalized Pareto distributions fitted to the obs and mod
+      excesses over their `q` quantiles are mapped onto each other, up to
+      the `min_sf` survival of `Tail.fit` (by default, that of the `max_cdf`
+      quantile) and the upper endpoint of an obs GPD with a negative shape.
+
+    Build one with `Tail.fit`; cells whose tail cannot be fitted have a NaN
+    `start` and keep the quantile mapping.
+
+    Attributes:
+        mode (str): "constant", "linear" or "gpd".
+        start (FloatNDArray): Threshold, per cell for gridded data.
+        params (FloatNDArray): Mode parameters, shaped (n_params,) or
+            (n_params, cells).
+    """
+
+    mode: str
+    start: FloatNDArray
+    params: FloatNDArray
+
+    def __post_init__(self):
+        if self.mode not in _TAIL_FUNCS:
+            raise ValueError(f"`mode` must be one of {list(_TAIL_FUNCS)}.")
+        self.start = np.asarray(self.start, dtype=float)
+        self.params = np.asarray(self.params, dtype=float)
+        if self.params.shape[1:] != self.start.shape:
+            raise ValueError("`start` and `params` must have one value per cell.")
+
+    @classmethod
+    def fit(
+        cls,
+        mode: str,
+        o_dist,
+        m_dist,
+        max_cdf: float,
+        obs: FloatNDArray = None,
+        mod: FloatNDArray = None,
+        q: float = TAIL_Q,
+        min_sf: float = None,
+    ):
+        """Tail of the quantile mapping of `m_dist` onto `o_dist`
+
+        Args:
+            mode (str): One of "clip", "constant", "linear", "gpd".
+            o_dist: Fitted obs distribution.
+            m_dist: Fitted mod distribution.
+            max_cdf (float): Maximum cdf value of the quantile mapping.
+            obs (FloatNDArray, optional): Time-major obs, required by "gpd".
+            mod (FloatNDArray, optional): Time-major mod, required by "gpd".
+            q (float, optional): Quantile where "linear" slopes and "gpd"
+                tails start. Defaults to 0.99.
+            min_sf (float, optional): Smallest survival probability of the
+                "gpd" mod excesses, conditional on exceeding the `q` quantile,
+                that is mapped: beyond it, the adjusted values stay at the
+                obs excess of that survival. Defaults to that of the
+                `max_cdf` quantile, (1 - `max_cdf`) / (1 - `q`).
+
+        Returns:
+            Tail: The tail, or None for "clip" (values above the `max_cdf`
+                quantile take the adjusted value of that quantile).
+        """
+        if mode not in TAILS:
+            raise ValueError(f"`tail` must be one of {TAILS}.")
+        if mode == "clip":
+            return None
+        if not isinstance(q, float):
+            raise TypeError("`q` is not a float.")
+        if not 0.5 <= q < max_cdf:
+            raise ValueError("`q` should be [0.5, `max_cdf`).")
+        if min_sf is None:
+            min_sf = (1 - max_cdf) / (1 - q)
+        if not isinstance(min_sf, float):
+            raise TypeError("`min_sf` is not a float.")
+        if not 0 < min_sf < 1:
+            raise ValueError("`min_sf` should be (0, 1).")
+
+        n_cells = _n_cells(m_dist)
+        (m_q, m_hi), (o_q, o_hi) = (
+            _ppf(dist, [q, max_cdf], n_cells) for dist in [m_dist, o_dist]
+        )
+        if mode == "constant":
+            return cls(mode, m_hi, np.asarray(o_hi)[None])
+        if mode == "linear":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                slope = (o_hi - o_q) / (m_hi - m_q)
+            slope = np.where(m_hi > m_q, slope, 0.0)
+            return cls(mode, m_hi, np.stack([o_hi, slope]))
+
+        if obs is None or mod is None:
+            raise ValueError('`obs` and `mod` are required by the "gpd" tail.')
+        excess = [
+            np.where(data > start, data - start, np.nan)
+            for data, start in [(mod, m_q), (obs, o_q)]
+        ]
+        if n_cells is None:
+            excess = [arr.reshape(len(arr), -1) for arr in excess]
+        (m_shape, m_scale), (o_shape, o_scale) = (_fit_gpd(arr) for arr in excess)
+        if n_cells is None:
+            m_shape, m_scale, o_shape, o_scale = (
+                arr[0] for arr in [m_shape, m_scale, o_shape, o_scale]
+            )
+        failed = np.isnan(m_shape + o_shape)
+        # cells without quantiles (masked or without data) are not adjusted
+        unfit = failed & ~np.isnan(m_q + o_q)
+        if unfit.any():
+            where = "the series" if n_cells is None else np.flatnonzero(unfit)
+            warnings.warn(
+                f"The GPD tail could not be fitted to {where} (fewer than 10 "
+                "excesses), the quantile mapping is clipped there."
+            )
+        start = np.where(failed, np.nan, m_q)
+        min_log_sf = np.full_like(start, np.log(min_sf))
+        params = np.stack([m_shape, m_scale, o_q, o_shape, o_scale, min_log_sf])
+        return cls(mode, start, params)
+
+    def apply(self, data: FloatNDArray, res: FloatNDArray) -> FloatNDArray:
+        """Overwrite `res` with the tail adjustment of the `data` above `start`
+
+        Args:
+            data (FloatNDArray): Time-major data, shaped (time,) or (time, cells).
+            res (FloatNDArray): Quantile mapping of `data`, updated in place.
+
+        Returns:
+            FloatNDArray: `res`.
+        """
+        with np.errstate(invalid="ignore"):
+            above = data > self.start
+        if not above.any():
+            return res
+        start, params = self.start, self.params
+        if data.ndim > 1:
+            cells = np.nonzero(above)[1]
+            start, params = start[cells], params[:, cells]
+        res[above] = _TAIL_FUNCS[self.mode](data[above] - start, params)
+        return res
+
+
+def tail_to_arrays(tail: Tail, prefix: str = "tail"):
+    """Describe a tail as metadata and named arrays, see `dist_to_arrays`"""
+    return {"mode": tail.mode}, {
+        f"{prefix}.start": tail.start,
+        f"{prefix}.params": tail.params,
+    }
+
+
+def tail_from_arrays(meta: dict, arrays: dict, prefix: str = "tail") -> Tail:
+    """Rebuild a tail described by `tail_to_arrays`"""
+    return Tail(meta["mode"], arrays[f"{prefix}.start"], arrays[f"{prefix}.params"])
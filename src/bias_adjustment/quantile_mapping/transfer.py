@@ -0,0 +1,478 @@
+import json
+import os
+import sys
+import warnings
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+from bias_adjustment import kernels
+from bias_adjustment.const import MAX_CDF, TABLE_SIZE
+from bias_adjustment.distributions.batched import MaskedDistribution, TableDistribution
+from bias_adjustment.distributions.serialize import dist_from_arrays, dist_to_arrays
+from bias_adjustment.distributions.sketch import HistogramSketch
+from bias_adjustment.profiling import stage
+from bias_adjustment.quantile_mapping.tails import (
+    Tail,
+    _n_cells,
+    tail_from_arrays,
+    tail_to_arrays,
+)
+from bias_adjustment.utils import (
+    FloatNDArray,
+    is_float_ndarray,
+    map_blocks,
+    output_array,
+)
+
+EXTRAPOLATE = ["clip", "linear", "nan"]
+
+
+def _lookup(
+    data: FloatNDArray,
+    start: FloatNDArray,
+    step: FloatNDArray,
+    adjusted: FloatNDArray,
+    slope: FloatNDArray,
+    extrapolate: str = "clip",
+) -> FloatNDArray:
+    """Linear interpolation in an evenly spaced table, per column for a grid
+
+    The interval of every value is computed rather than searched for, so the
+    cost does not depend on the table size.
+    """
+    size = len(adjusted)
+    pos = data - start
+    pos /= step
+    if extrapolate == "clip":
+        np.clip(pos, 0, size - 1, out=pos)
+    # NaN positions index the first interval and stay NaN
+    idx = np.fmin(np.fmax(pos, 0), size - 2).astype(np.intp)
+    pos -= idx
+    if adjusted.ndim > 1:
+        idx *= adjusted.shape[1]
+        idx += np.arange(adjusted.shape[1])
+    pos *= slope.take(idx)
+    pos += adjusted.take(idx)
+    if extrapolate == "nan":
+        with np.errstate(invalid="ignore"):
+            outside = (data < start) | (data > start + (size - 1) * step)
+        pos[outside] = np.nan
+    return pos
+
+
+def _write_arrays(path: str, meta: dict, arrays: dict):
+    os.makedirs(path, exist_ok=True)
+    for key, arr in arrays.items():
+        np.save(os.path.join(path, f"{key}.npy"), arr)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def _read_arrays(path: str, mmap_mode: str = None, version: int = 1):
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("format") != version:
+        raise ValueError(f"Unsupported format version `{meta.get('format')}`.")
+    arrays = {
+        name[: -len(".npy")]: np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+        for name in os.listdir(path)
+        if name.endswith(".npy")
+    }
+    return meta, arrays
+
+
+def _kernel_table(dist):
+    """`kernels.table` of a tabulated distribution, None for other types"""
+    if isinstance(dist, HistogramSketch):
+        dist = dist.to_distribution()
+    if isinstance(dist, TableDistribution):
+        return kernels.table(dist.values, dist.probs)
+    if isinstance(dist, MaskedDistribution):
+        inner = dist.dist
+        if not isinstance(inner, TableDistribution):
+            return None
+        # masked cells get NaN tables, hence NaN values
+        values, probs = (
+            np.full((len(arr), dist.n_cells), np.nan)
+            for arr in [inner.values, inner.probs]
+        )
+        values[:, dist.cells], probs[:, dist.cells] = inner.values, inner.probs
+        return kernels.table(values, probs)
+    # scipy.stats objects only exist once it is imported; don't import it here
+    st = sys.modules.get("scipy.stats")
+    if st is not None and isinstance(dist, st.rv_histogram):
+        return kernels.table(dist._hbins, dist._hcdf)
+    return None
+
+
+class _Transfer:
+    """Quantile mapping of validated distributions, without any checks
+
+    The adjustment paths build one per call; `QuantileTransfer` is the
+    checked public equivalent. With `kernels.ENABLED`, tabulated
+    distributions are mapped by the fused compiled kernel.
+    """
+
+    __slots__ = ("o_dist", "m_dist", "max_cdf", "axis", "tail", "_tables")
+
+    def __init__(
+        self,
+        o_dist,
+        m_dist,
+        max_cdf: float = MAX_CDF,
+        axis: int = 0,
+        tail: Tail = None,
+    ):
+        self.o_dist = o_dist
+        self.m_dist = m_dist
+        self.max_cdf = max_cdf
+        self.axis = axis
+        self.tail = tail
+        self._tables = None
+
+    def kernel_tables(self) -> tuple:
+        """Kernel tables of `m_dist` and `o_dist`, None if they are not both
+        tabulated or the kernels are disabled"""
+        if not kernels.ENABLED:
+            return None
+        if self._tables is None:
+            tables = tuple(_kernel_table(d) for d in [self.m_dist, self.o_dist])
+            self._tables = () if None in tables else tables
+        return self._tables or None
+
+    def __call__(self, data: FloatNDArray) -> FloatNDArray:
+        tables = self.kernel_tables()
+        if tables is not None:
+            with stage("transfer", data.size):
+                res = kernels.qm(data, *tables, self.max_cdf)
+        else:
+            with stage("cdf", data.size):
+                m_cdf = self.m_dist.cdf(data)
+            np.minimum(m_cdf, self.max_cdf, out=m_cdf)
+            with stage("ppf", data.size):
+                res = self.o_dist.ppf(m_cdf)
+        if self.tail is not None:
+            self.tail.apply(data, res)
+        return res
+
+    def transform(self, data: FloatNDArray, out: FloatNDArray) -> FloatNDArray:
+        return map_blocks(self, data, out, self.axis)
+
+
+@dataclass
+class QuantileTransfer:
+    """Quantile mapping transfer function of fitted obs and mod distributions
+
+    Applying it is an element-wise map, so data can be transformed in chunks
+    of any length. Gridded distributions expect chunks shaped (time, ...)
+    along `axis` with the grid they were fitted on.
+
+    `meta` records how the distributions were fitted (e.g. dist_type, bins,
+    trace_val) and is kept by `save`/`load`. Values above the `max_cdf`
+    quantile of `m_dist` take the adjusted value of that quantile, unless a
+    `tail` (see `Tail.fit`) adjusts them.
+    """
+
+    o_dist: Any
+    m_dist: Any
+    max_cdf: float = MAX_CDF
+    axis: int = 0
+    meta: dict = field(default_factory=dict)
+    tail: Tail = None
+
+    FORMAT_VERSION = 1
+
+    def __post_init__(self):
+        for name in ["o_dist", "m_dist"]:
+            attr = getattr(self, name)
+            if not (hasattr(attr, "cdf") and hasattr(attr, "ppf")):
+                raise TypeError(f"`{name}` is not a fitted distribution.")
+
+        for name in ["max_cdf"]:
+            attr = getattr(self, name)
+            if not isinstance(attr, float):
+                raise TypeError(f"`{name}` is not a float.")
+            if attr < 0.5 or attr >= 1:
+                raise ValueError(f"`{name}` should be [0.5, 1).")
+
+        if self.tail is not None and not isinstance(self.tail, Tail):
+            raise TypeError("`tail` is not a Tail.")
+
+    def transform(
+        self, chunk: FloatNDArray, out: FloatNDArray = None, dtype=None
+    ) -> FloatNDArray:
+        """Adjust a chunk of data
+
+        The chunk is adjusted block by block, so that temporaries stay small
+        when writing into `out`.
+
+        Args:
+            chunk (FloatNDArray): Data to adjust.
+            out (FloatNDArray, optional): Array to write the adjusted values into,
+                e.g. a memory-mapped array. Defaults to a new array.
+            dtype (optional): Floating dtype of the result. Defaults to float64.
+
+        Returns:
+            FloatNDArray: The adjusted values.
+        """
+        if not is_float_ndarray(chunk):
+            raise TypeError("`chunk` is not a float numpy array.")
+        return _Transfer(
+            self.o_dist, self.m_dist, self.max_cdf, self.axis, self.tail
+        ).transform(chunk, output_array(chunk, out, dtype))
+
+    def transform_iter(self, chunks: Iterable[FloatNDArray]) -> Iterator[FloatNDArray]:
+        """Adjust a stream of chunks, one at a time
+
+        Args:
+            chunks (Iterable[FloatNDArray]): Data to adjust.
+
+        Yields:
+            FloatNDArray: The adjusted values of each chunk.
+        """
+        for chunk in chunks:
+            yield self.transform(chunk)
+
+    def compile(
+        self,
+        size: int = TABLE_SIZE,
+        tol: float = None,
+        max_size: int = 64 * TABLE_SIZE,
+        extrapolate: str = "clip",
+    ) -> "TransferTable":
+        """Tabulate the transfer function for fast repeated application
+
+        The table holds the adjusted values of `size` evenly spaced values of
+        the calibration range, from the lowest `m_dist` value (or its
+        `1 - max_cdf` quantile if unbounded) to its `max_cdf` quantile. With
+        `tol`, the spacing is halved until the table deviates from the
+        transfer function by at most `tol` at the midpoints of its intervals.
+
+        Where the transfer function jumps, e.g. across empty bins of a "hist"
+        fit, no spacing reaches a `tol` below the jump, but fewer values fall
+        in the interval of the jump as the table grows. Up to `max_size`
+        values are then used, with a warning.
+
+        Args:
+            size (int, optional): Number of table values. Defaults to 1024.
+            tol (float, optional): Maximum absolute error at the midpoints of
+                the table intervals. Defaults to None (no refinement).
+            max_size (int, optional): Maximum number of table values. Defaults to 65536.
+            extrapolate (str, optional): Values outside the calibration range
+                take the end values ("clip"), extend the end slopes ("linear"),
+                or are NaN ("nan"). Defaults to "clip".
+
+        Returns:
+            TransferTable: The lookup table.
+        """
+        if not isinstance(size, int) or not isinstance(max_size, int):
+            raise TypeError("`size` and `max_size` must be integers.")
+        if size < 2 or max_size < size:
+            raise ValueError("`size` must be at least 2 and at most `max_size`.")
+        if tol is not None:
+            if not isinstance(tol, float):
+                raise TypeError("`tol` is not a float.")
+            if tol <= 0:
+                raise ValueError("`tol` must be positive.")
+        if extrapolate not in EXTRAPOLATE:
+            raise ValueError(f"`extrapolate` must be one of {EXTRAPOLATE}.")
+
+        transfer = _Transfer(self.o_dist, self.m_dist, self.max_cdf, tail=self.tail)
+        n_cells = _n_cells(self.m_dist)
+        q = np.array([0, 1 - self.max_cdf, self.max_cdf])
+        if n_cells is not None:
+            q = np.repeat(q[:, None], n_cells, axis=1)
+        with stage("ppf", q.size):
+            lowest, low, high = self.m_dist.ppf(q)
+        start = np.where(np.isfinite(lowest), lowest, low)
+        span = np.where(high > start, high - start, 1.0)
+
+        while True:
+            step = span / (size - 1)
+            values = start + np.arange(size).reshape((-1,) + (1,) * start.ndim) * step
+            adjusted = transfer(values)
+            if tol is None:
+                break
+            table = TransferTable(start, step, adjusted)
+            mid = values[:-1] + step / 2
+            error = np.nanmax(np.abs(table(mid) - transfer(mid)), initial=0.0)
+            if error <= tol:
+                break
+            if 2 * size - 1 > max_size:
+                warnings.warn(
+                    f"`tol` is not reached within {max_size} values, "
+                    f"the error is {error:.3g}."
+                )
+                break
+            size = 2 * size - 1
+        return TransferTable(
+            start, step, adjusted, extrapolate, self.axis, dict(self.meta), self.tail
+        )
+
+    def save(self, path: str):
+        """Save the fitted transfer function to the directory `path`
+
+        The directory holds a `meta.json` description and one `.npy` file per
+        array (quantile tables, histograms or distribution parameters).
+
+        Args:
+            path (str): Output directory, created if missing.
+        """
+        meta = {
+            "format": self.FORMAT_VERSION,
+            "max_cdf": self.max_cdf,
+            "axis": self.axis,
+            "meta": self.meta,
+        }
+        arrays = {}
+        for name in ["o_dist", "m_dist"]:
+            meta[name], _arrays = dist_to_arrays(getattr(self, name), name)
+            arrays.update(_arrays)
+        if self.tail is not None:
+            meta["tail"], _arrays = tail_to_arrays(self.tail)
+            arrays.update(_arrays)
+        _write_arrays(path, meta, arrays)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = None) -> "QuantileTransfer":
+        """Load a transfer function saved with `save`
+
+        Args:
+            path (str): Directory written by `save`.
+            mmap_mode (str, optional): Memory-map the arrays instead of
+                reading them, see `np.load`. Defaults to None.
+
+        Returns:
+            QuantileTransfer: The transfer function.
+        """
+        meta, arrays = _read_arrays(path, mmap_mode, cls.FORMAT_VERSION)
+        if "o_dist" not in meta:
+            raise ValueError(f"`{path}` does not hold a QuantileTransfer.")
+        o_dist, m_dist = (
+            dist_from_arrays(meta[name], arrays, name) for name in ["o_dist", "m_dist"]
+        )
+        tail = meta.get("tail")
+        if tail is not None:
+            tail = tail_from_arrays(tail, arrays)
+        return cls(o_dist, m_dist, meta["max_cdf"], meta["axis"], meta["meta"], tail)
+
+
+@dataclass
+class TransferTable:
+    """Lookup table of a quantile mapping transfer function
+
+    The adjusted values of evenly spaced data values, so that applying it is
+    a linear interpolation whose interval is computed, not searched for,
+    instead of a cdf and a ppf evaluation. Build one with
+    `QuantileTransfer.compile`.
+
+    Attributes:
+        start (FloatNDArray): First table value, per cell for gridded data.
+        step (FloatNDArray): Table spacing, per cell for gridded data.
+        adjusted (FloatNDArray): Adjusted values, shaped (size,) or (size, cells).
+        extrapolate (str): "clip", "linear" or "nan", see
+            `QuantileTransfer.compile`. Defaults to "clip".
+        axis (int): Time axis of the chunks. Defaults to 0.
+        meta (dict): How the distributions were fitted.
+        tail (Tail): Tail of the transfer function, which replaces the table
+            and its extrapolation above the tail start. Defaults to None.
+    """
+
+    start: FloatNDArray
+    step: FloatNDArray
+    adjusted: FloatNDArray
+    extrapolate: str = "clip"
+    axis: int = 0
+    meta: dict = field(default_factory=dict)
+    tail: Tail = None
+    _slope: FloatNDArray = field(init=False, repr=False, compare=False)
+
+    FORMAT_VERSION = 1
+
+    def __post_init__(self):
+        self.start = np.asarray(self.start, dtype=float)
+        self.step = np.asarray(self.step, dtype=float)
+        if not is_float_ndarray(self.adjusted) or self.adjusted.ndim not in (1, 2):
+            raise TypeError("`adjusted` is not a 1-D or 2-D float numpy array.")
+        if len(self.adjusted) < 2:
+            raise ValueError("`adjusted` must have at least 2 values.")
+        if (
+            self.start.shape != self.adjusted.shape[1:]
+            or self.step.shape != self.adjusted.shape[1:]
+        ):
+            raise ValueError("`start` and `step` must have one value per cell.")
+        if self.extrapolate not in EXTRAPOLATE:
+            raise ValueError(f"`extrapolate` must be one of {EXTRAPOLATE}.")
+        if self.tail is not None and not isinstance(self.tail, Tail):
+            raise TypeError("`tail` is not a Tail.")
+        # one extra row so that the last table value has a slope
+        self._slope = np.diff(self.adjusted, axis=0, append=self.adjusted[-1:])
+
+    @property
+    def values(self) -> FloatNDArray:
+        """Data values of the table, shaped like `adjusted`"""
+        idx = np.arange(len(self.adjusted)).reshape((-1,) + (1,) * self.start.ndim)
+        return self.start + idx * self.step
+
+    def __call__(self, data: FloatNDArray) -> FloatNDArray:
+        with stage("lookup", data.size):
+            res = _lookup(
+                data,
+                self.start,
+                self.step,
+                self.adjusted,
+                self._slope,
+                self.extrapolate,
+            )
+        if self.tail is not None:
+            self.tail.apply(data, res)
+        return res
+
+    def transform(
+        self, chunk: FloatNDArray, out: FloatNDArray = None, dtype=None
+    ) -> FloatNDArray:
+        """Adjust a chunk of data, see `QuantileTransfer.transform`"""
+        if not is_float_ndarray(chunk):
+            raise TypeError("`chunk` is not a float numpy array.")
+        return map_blocks(self, chunk, output_array(chunk, out, dtype), self.axis)
+
+    def transform_iter(self, chunks: Iterable[FloatNDArray]) -> Iterator[FloatNDArray]:
+        """Adjust a stream of chunks, one at a time"""
+        for chunk in chunks:
+            yield self.transform(chunk)
+
+    def save(self, path: str):
+        """Save the table to the directory `path`, created if missing"""
+        meta = {
+            "format": self.FORMAT_VERSION,
+            "kind": "table",
+            "extrapolate": self.extrapolate,
+            "axis": self.axis,
+            "meta": self.meta,
+        }
+        arrays = {"start": self.start, "step": self.step, "adjusted": self.adjusted}
+        if self.tail is not None:
+            meta["tail"], _arrays = tail_to_arrays(self.tail)
+            arrays.update(_arrays)
+        _write_arrays(path, meta, arrays)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = None) -> "TransferTable":
+        """Load a table saved with `save`, see `QuantileTransfer.load`"""
+        meta, arrays = _read_arrays(path, mmap_mode, cls.FORMAT_VERSION)
+        if meta.get("kind") != "table":
+            raise ValueError(f"`{path}` does not hold a TransferTable.")
+        tail = meta.get("tail")
+        if tail is not None:
+            tail = tail_from_arrays(tail, arrays)
+        return cls(
+            arrays["start"],
+            arrays["step"],
+            arrays["adjusted"],
+            meta["extrapolate"],
+            meta["axis"],
+            meta["meta"],
+            tail,
+        )
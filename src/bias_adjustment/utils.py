@@ -5,7 +5,7 @@ from typing import Literal, Union, get_args
 import numpy as np
 import numpy.typing as npt
 
-from bias_adjustment.const import TRACE_VAL
+from bias_adjustment.const import BLOCK_SIZE, TRACE_VAL
 
 FloatNDArray = npt.NDArray[np.float64]
 
@@ -15,7 +15,7 @@ BAMode = Literal["rel", "abs"]
 
 
 def is_float_ndarray(v):
-    return isinstance(v, np.ndarray) and np.issubdtype(v.dtype, np.floating)
+    return isinstance(v, np.ndarray) and v.dtype.kind == "f"
 
 
 def is_array_like(v):
@@ -26,3 +26,213 @@ def rand_trace(trace_val: float = TRACE_VAL, exponent: int = 5):
     min_val = math.pow(10, -exponent)
     max_val = trace_val - min_val
     return round(random.uniform(min_val, max_val), exponent)
+
+
+def jitter_trace(
+    data: FloatNDArray,
+    trace_val: float = TRACE_VAL,
+    rng: np.random.Generator = None,
+    out: FloatNDArray = None,
+    exponent: int = 5,
+) -> FloatNDArray:
+    """Mask dry values and replace trace values with random values
+
+    Values that are not positive become NaN, and every value below
+    `trace_val` is replaced with its own random draw in (0, `trace_val`),
+    rounded like `rand_trace`.
+
+    Args:
+        data (FloatNDArray): Input data.
+        trace_val (float, optional): Trace value. Defaults to 0.05.
+        rng (np.random.Generator, optional): Random generator. Defaults to a new one.
+        out (FloatNDArray, optional): Output buffer with the shape of `data`; may
+            be `data` itself. Defaults to a new array.
+        exponent (int, optional): Decimals of the random values. Defaults to 5.
+
+    Returns:
+        FloatNDArray: `out`, holding the masked values.
+    """
+    rng = np.random.default_rng(rng)
+    if out is None:
+        out = np.empty(data.shape)
+    with np.errstate(invalid="ignore"):
+        dry = ~(data > 0)
+        np.copyto(out, data)
+        out[dry] = np.nan
+        trace = out < trace_val
+    min_val = math.pow(10, -exponent)
+    draws = rng.uniform(min_val, trace_val - min_val, size=np.count_nonzero(trace))
+    out[trace] = np.round(draws, exponent)
+    return out
+
+
+def adapt_freq(
+    obs: FloatNDArray, mod: FloatNDArray, rng: np.random.Generator = None
+) -> FloatNDArray:
+    """Adapt the frequency of dry values of `mod` to that of `obs`
+
+    Where `mod` has more dry (not positive) values than `obs`, a random share
+    of its dry values is made wet, with values drawn from the `obs`
+    distribution between the dry frequencies of `obs` and `mod`, as in
+    Themeßl et al. (2012). Other cells are unchanged.
+
+    Args:
+        obs (FloatNDArray): Observed data shaped (time,) or (time, cells).
+        mod (FloatNDArray): Modelled data with the same cells.
+        rng (np.random.Generator, optional): Random generator. Defaults to a new one.
+
+    Returns:
+        FloatNDArray: The adapted `mod` values.
+    """
+    rng = np.random.default_rng(rng)
+    if mod.ndim == 1:
+        return adapt_freq(obs[:, None], mod[:, None], rng)[:, 0]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        o_valid = ~np.isnan(obs)
+        n_obs = np.count_nonzero(o_valid, axis=0)
+        p0_obs = np.count_nonzero(o_valid & (obs <= 0), axis=0) / n_obs
+        m_dry = mod <= 0
+        p0_mod = np.count_nonzero(m_dry, axis=0) / np.count_nonzero(
+            ~np.isnan(mod), axis=0
+        )
+        # share of the dry `mod` values to make wet
+        share = np.where(p0_mod > p0_obs, 1 - p0_obs / p0_mod, 0.0)
+
+    wet = m_dry & (rng.random(mod.shape) < share)
+    if not wet.any():
+        return mod.copy()
+
+    # `obs` quantiles at random probabilities in (p0_obs, p0_mod), by
+    # linear interpolation of the sorted values like `np.quantile`
+    rows, cols = np.nonzero(wet)
+    pos = rng.uniform(p0_obs[cols], p0_mod[cols]) * (n_obs[cols] - 1)
+    lo = np.floor(pos).astype(np.intp)
+    hi = np.minimum(lo + 1, n_obs[cols] - 1)
+    values = np.sort(obs, axis=0)
+    res = mod.copy()
+    res[rows, cols] = values[lo, cols] + (values[hi, cols] - values[lo, cols]) * (
+        pos - lo
+    )
+    return res
+
+
+def grid_shape(arr: np.ndarray, axis: int = 0) -> tuple:
+    """Shape of `arr` without its time `axis`"""
+    shape = list(arr.shape)
+    del shape[axis]
+    return tuple(shape)
+
+
+def to_time_major(arr: np.ndarray, axis: int = 0) -> np.ndarray:
+    """Reshape `arr` to (time, cells) with `axis` as the time axis
+
+    1-D arrays are returned unchanged.
+    """
+    if arr.ndim == 1:
+        return arr
+    arr = np.moveaxis(arr, axis, 0)
+    return arr.reshape(arr.shape[0], -1)
+
+
+def from_time_major(arr: np.ndarray, shape: tuple, axis: int = 0) -> np.ndarray:
+    """Inverse of `to_time_major` for an array originally shaped `shape`"""
+    if len(shape) == 1:
+        return arr
+    axis = axis % len(shape)
+    moved = (shape[axis], *shape[:axis], *shape[axis + 1 :])
+    return np.moveaxis(arr.reshape(moved), 0, axis)
+
+
+def valid_cells(
+    *arrays: np.ndarray, axis: int = 0, min_len: int = 10, mask: np.ndarray = None
+) -> np.ndarray:
+    """Cells with at least `min_len` valid values in every array
+
+    Args:
+        *arrays (np.ndarray): Gridded arrays with time along `axis`.
+        axis (int, optional): Time axis. Defaults to 0.
+        min_len (int, optional): Minimum number of valid values. Defaults to 10.
+        mask (np.ndarray, optional): Boolean mask of the cells to keep, shaped
+            like the grid. Defaults to all cells.
+
+    Returns:
+        np.ndarray: Boolean mask of the cells of the flattened grid, or None
+            if all cells are kept.
+    """
+    keep = np.ones(math.prod(grid_shape(arrays[0], axis)), dtype=bool)
+    if mask is not None:
+        keep &= np.ravel(mask)
+    for arr in arrays:
+        keep &= np.count_nonzero(~np.isnan(arr), axis=axis).ravel() >= min_len
+    return None if keep.all() else keep
+
+
+def output_array(
+    data: np.ndarray, out: FloatNDArray = None, dtype=None
+) -> FloatNDArray:
+    """Check `out`, or allocate an output array shaped like `data`
+
+    Args:
+        data (np.ndarray): Data to adjust.
+        out (FloatNDArray, optional): Output array. Defaults to a new array.
+        dtype (optional): Floating dtype of a new array. Defaults to float64.
+    """
+    if dtype is not None and not np.issubdtype(dtype, np.floating):
+        raise TypeError("`dtype` is not a floating dtype.")
+    if out is None:
+        return np.empty(data.shape, dtype=np.float64 if dtype is None else dtype)
+    if not is_float_ndarray(out):
+        raise TypeError("`out` is not a float numpy array.")
+    if out.shape != data.shape:
+        raise ValueError("`out` must have the shape of `data`.")
+    if dtype is not None and out.dtype != dtype:
+        raise TypeError("`out` does not have the given `dtype`.")
+    return out
+
+
+def map_blocks(
+    func,
+    data: np.ndarray,
+    out: FloatNDArray,
+    axis: int = 0,
+    block_size: int = BLOCK_SIZE,
+) -> FloatNDArray:
+    """Apply `func` to blocks of time steps, writing into `out`
+
+    `func` maps a (time, cells) block of `data` to adjusted values, so that
+    the temporaries it allocates are at most `block_size` elements. Blocks
+    are evaluated in float64 and stored with the dtype of `out`. With a
+    tuple of output arrays, `func` returns a tuple of blocks.
+
+    Args:
+        func (callable): Element-wise adjustment of a time-major block.
+        data (np.ndarray): Data to adjust, with time along `axis`.
+        out (FloatNDArray): Output array shaped like `data`, or a tuple of them.
+        axis (int, optional): Time axis. Defaults to 0.
+        block_size (int, optional): Elements per block. Defaults to 2**18.
+
+    Returns:
+        FloatNDArray: `out`.
+    """
+    outs = out if isinstance(out, tuple) else (out,)
+    src = to_time_major(data, axis)
+    dsts = [to_time_major(arr, axis) for arr in outs]
+    # the time-major reshape copies an output if it is not a view
+    views = [np.may_share_memory(dst, arr) for dst, arr in zip(dsts, outs)]
+    dsts = [
+        dst if is_view else np.empty(dst.shape, dtype=dst.dtype)
+        for dst, is_view in zip(dsts, views)
+    ]
+
+    n_cells = math.prod(src.shape[1:])
+    rows = max(1, block_size // max(n_cells, 1))
+    for start in range(0, len(src), rows):
+        block = src[start : start + rows].astype(np.float64, copy=False)
+        res = func(block)
+        for dst, values in zip(dsts, res if isinstance(out, tuple) else (res,)):
+            dst[start : start + rows] = values
+    for arr, dst, is_view in zip(outs, dsts, views):
+        if not is_view:
+            arr[...] = from_time_major(dst, arr.shape, axis)
+    return out
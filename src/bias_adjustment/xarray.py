@@ -0,0 +1,136 @@
+"""Bias adjustment of `xarray.DataArray` inputs
+
+Requires the optional xarray and dask packages (`pip install xarray dask`).
+Dask-backed inputs are adjusted lazily, chunk by chunk.
+"""
+
+import numpy as np
+
+from bias_adjustment.bias_adjustment import BiasAdjustment
+from bias_adjustment.const import BINS, MAX_CDF, TRACE_VAL
+
+try:
+    import xarray as xr
+except ImportError as e:  # pragma: no cover
+    raise ImportError(
+        "`bias_adjustment.xarray` requires xarray; "
+        "install it with `pip install xarray dask`."
+    ) from e
+
+
+def _adjust_block(
+    obs, mod, data, cells, method, dist_type, ignore_trace, bins, seed, **kwargs
+):
+    """Adjust a block whose last axis is time
+
+    `cells` holds the flat indices of the cells of the block; random values
+    are seeded per block with the first of them, as in `adjust_many`.
+    """
+    seed = [seed, int(cells.flat[0])] if cells.size else seed
+    return BiasAdjustment(obs, mod, axis=-1, seed=seed, **kwargs).adjust(
+        data, method=method, dist_type=dist_type, ignore_trace=ignore_trace, bins=bins
+    )
+
+
+def _time_contiguous(da: "xr.DataArray", dim: str, chunks: dict = None):
+    if chunks is not None:
+        da = da.chunk({**chunks, dim: -1})
+    elif da.chunks is not None:
+        da = da.chunk({dim: -1})
+    return da
+
+
+def adjust(
+    obs: "xr.DataArray",
+    mod: "xr.DataArray",
+    data: "xr.DataArray",
+    dim: str = "time",
+    method="qm",
+    dist_type="hist",
+    ignore_trace: bool = False,
+    bins: int = BINS,
+    max_cdf: float = MAX_CDF,
+    trace_val: float = TRACE_VAL,
+    chunks: dict = None,
+    tail: str = "clip",
+    seed: int = None,
+    adapt_freq: bool = False,
+) -> "xr.DataArray":
+    """Adjust the bias of `data` cell by cell along `dim`
+
+    Wraps `BiasAdjustment.adjust` with `xarray.apply_ufunc`. Dask-backed
+    inputs are rechunked to a single chunk along `dim` and return a lazy
+    result that is computed chunk by chunk over the other dimensions.
+
+    Args:
+        obs (xr.DataArray): Observed data.
+        mod (xr.DataArray): Modelled data over the observed period.
+        data (xr.DataArray): Data to adjust.
+        dim (str, optional): Time dimension. Defaults to "time".
+        method (str, optional): One of "qm", "dqm[.rel|.abs]", "qdm[.rel|.abs]". Defaults to "qm".
+        dist_type (str, optional): Valid scipy.stats distribution name. Defaults to "hist".
+        ignore_trace (bool, optional): Ignore trace values? Defaults to "False".
+        bins (int, optional): Number of bins. Defaults to 200.
+        max_cdf (float, optional): Maximum cdf value. Defaults to 0.9999999.
+        trace_val (float, optional): Trace value. Defaults to 0.05.
+        chunks (dict, optional): Chunk sizes along the non-time dimensions.
+            Turns numpy-backed inputs into dask arrays. Defaults to None.
+        tail (str, optional): Adjustment above the calibration range, one of
+            "clip", "constant", "linear", "gpd". Defaults to "clip".
+        seed (int, optional): Seed of the random trace values and frequency
+            adaptation; every chunk draws from a generator seeded with it and
+            the flat index of its first cell. Defaults to None, fresh entropy.
+        adapt_freq (bool, optional): Adapt the frequency of dry values of `mod`
+            to that of `obs`? Defaults to False.
+
+    Returns:
+        xr.DataArray: The adjusted values, with the dimensions of `data`.
+    """
+    for name, da in [("obs", obs), ("mod", mod), ("data", data)]:
+        if not isinstance(da, xr.DataArray):
+            raise TypeError(f"`{name}` is not an xarray.DataArray.")
+        if dim not in da.dims:
+            raise ValueError(f"`{name}` has no `{dim}` dimension.")
+
+    # obs, mod and data may span different periods
+    obs_dim, mod_dim = f"{dim}_obs", f"{dim}_mod"
+    obs = _time_contiguous(obs, dim, chunks).rename({dim: obs_dim})
+    mod = _time_contiguous(mod, dim, chunks).rename({dim: mod_dim})
+    _data = _time_contiguous(data, dim, chunks)
+
+    grid = [d for d in data.dims if d != dim]
+    cells = xr.DataArray(
+        np.arange(int(np.prod([data.sizes[d] for d in grid]))).reshape(
+            [data.sizes[d] for d in grid]
+        ),
+        dims=grid,
+    )
+    if _data.chunks is not None:
+        cells = cells.chunk({d: _data.chunksizes[d] for d in grid})
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    res = xr.apply_ufunc(
+        _adjust_block,
+        obs.drop_vars(obs_dim, errors="ignore"),
+        mod.drop_vars(mod_dim, errors="ignore"),
+        _data,
+        cells,
+        input_core_dims=[[obs_dim], [mod_dim], [dim], []],
+        output_core_dims=[[dim]],
+        kwargs={
+            "method": method,
+            "dist_type": dist_type,
+            "ignore_trace": ignore_trace,
+            "bins": bins,
+            "max_cdf": max_cdf,
+            "trace_val": trace_val,
+            "tail": tail,
+            "seed": seed,
+            "adapt_freq": adapt_freq,
+        },
+        dask="parallelized",
+        output_dtypes=[float],
+        keep_attrs=True,
+    )
+    return res.transpose(*data.dims)
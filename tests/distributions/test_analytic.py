@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from scipy import stats as st
+
+from bias_adjustment.distributions import Distributions
+from bias_adjustment.distributions.analytic import ParametricBatch, fit_params
+
+rng = np.random.default_rng(1)
+grid = np.stack(
+    [
+        rng.gamma(0.8, 9.0, size=2000),
+        rng.gamma(4.0, 7.5, size=2000),
+        rng.lognormal(1.0, 0.6, size=2000),
+        rng.weibull(1.6, size=2000) * 4.0,
+    ],
+    axis=1,
+)
+grid[:150, 1] = np.nan
+
+
+@pytest.mark.parametrize(
+    "dist_type, rtol",
+    [("gamma", 1e-10), ("lognorm", 1e-10), ("norm", 1e-10), ("weibull_min", 1e-4)],
+    ids=["gamma", "lognorm", "norm", "weibull_min"],
+)
+def test_fit_params(dist_type, rtol):
+    params = fit_params(grid, dist_type)
+    dist = getattr(st, dist_type)
+    for i in range(grid.shape[1]):
+        data = grid[~np.isnan(grid[:, i]), i]
+        kwargs = {} if dist_type == "norm" else {"floc": 0}
+        expected = dist.fit(data, **kwargs)
+        np.testing.assert_allclose(params[:, i], expected, rtol=rtol, atol=1e-12)
+        # at least as likely as scipy's numerical optimum
+        assert dist.logpdf(data, *params[:, i]).sum() >= (
+            dist.logpdf(data, *expected).sum() - 1e-8
+        )
+    np.testing.assert_allclose(fit_params(grid[:, 0], dist_type), params[:, 0])
+
+
+def test_fit_params_invalid_cells():
+    data = grid.copy()
+    data[:, 1] = np.nan
+    data[0, 2] = -1.0
+    params = fit_params(data, "gamma")
+    assert np.isnan(params[:, 1]).all()
+    assert np.isnan(params[[0, 2], 2]).all()
+    assert not np.isnan(params[:, [0, 3]]).any()
+    with pytest.raises(ValueError):
+        fit_params(data, "beta")
+
+
+@pytest.mark.parametrize("dist_type", ["gamma", "lognorm", "norm", "weibull_min"])
+def test_parametric_batch(dist_type):
+    params = fit_params(grid, dist_type)
+    dist = ParametricBatch(dist_type, params)
+    q = np.linspace(0.001, 0.999, 50)[:, None].repeat(grid.shape[1], axis=1)
+    x = dist.ppf(q)
+    np.testing.assert_allclose(x, getattr(st, dist_type).ppf(q, *params))
+    np.testing.assert_allclose(dist.cdf(x), q)
+    assert np.isnan(dist.ppf(np.full((1, grid.shape[1]), 1.5))).all()
+
+
+def test_fit_fast():
+    dist = Distributions(grid).fit("gamma.fast")
+    assert isinstance(dist, ParametricBatch)
+    with pytest.raises(ValueError):
+        Distributions(grid).fit("beta.fast")
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from bias_adjustment.distributions import Distributions
+from bias_adjustment.distributions.batched import (
+    DistributionBatch,
+    MaskedDistribution,
+    TableDistribution,
+)
+from bias_adjustment.distributions.distributions import _fit_hist
+from tests.data import modf, modh, obs
+
+grid = np.stack([obs, modh, modf], axis=1)
+
+
+@pytest.mark.parametrize(
+    "dist_type, expected",
+    [("hist", TableDistribution), ("norm", DistributionBatch)],
+    ids=["dist_type: hist", "dist_type: norm"],
+)
+def test_fit_grid(dist_type, expected):
+    assert isinstance(Distributions(grid).fit(dist_type), expected)
+
+
+def test_hist_grid_matches_hist():
+    dist = Distributions(grid).fit("hist", bins=50)
+    q = np.linspace(0, 1, 101)[:, None].repeat(3, axis=1)
+    x = dist.ppf(q)
+    for i in range(grid.shape[1]):
+        expected = _fit_hist(grid[:, i], bins=50)
+        np.testing.assert_allclose(x[:, i], expected.ppf(q[:, i]))
+        np.testing.assert_allclose(dist.cdf(x)[:, i], expected.cdf(x[:, i]))
+
+
+def test_nan_cells():
+    data = grid.copy()
+    data[:, 1] = np.nan
+    data[:5, 0] = np.nan
+    for dist_type in ["hist", "norm"]:
+        dist = Distributions(data).fit(dist_type)
+        res = dist.ppf(dist.cdf(data))
+        assert np.isnan(res[:, 1]).all()
+        assert np.isnan(res[:5, 0]).all()
+        assert not np.isnan(res[5:, [0, 2]]).any()
+
+
+@pytest.mark.parametrize("dist_type", ["hist", "empirical", "gamma.fast", "norm"])
+def test_masked_cells(dist_type):
+    mask = np.array([True, False, True])
+    dist = Distributions(grid, mask=mask).fit(dist_type)
+    assert isinstance(dist, MaskedDistribution)
+    expected = Distributions(grid[:, mask]).fit(dist_type)
+    x = grid[::-1]
+    q = np.linspace(0, 1, len(grid))[:, None].repeat(3, axis=1)
+    for res, ref in [
+        (dist.cdf(x), expected.cdf(x[:, mask])),
+        (dist.ppf(q), expected.ppf(q[:, mask])),
+    ]:
+        np.testing.assert_array_equal(res[:, mask], ref)
+        assert np.isnan(res[:, 1]).all()
+
+
+@pytest.mark.parametrize(
+    "mask, error",
+    [
+        ([True, False, True], TypeError),
+        (np.ones(3), TypeError),
+        (np.ones(2, dtype=bool), ValueError),
+    ],
+    ids=["mask: list", "mask: not boolean", "mask: wrong length"],
+)
+def test_mask_errors(mask, error):
+    with pytest.raises(error):
+        Distributions(grid, mask=mask)
@@ -5,8 +5,13 @@ import pytest
 from scipy.stats import rv_continuous, rv_discrete
 from scipy.stats._distn_infrastructure import rv_continuous_frozen, rv_discrete_frozen
 
-from bias_adjustment.distributions import Distributions
-from bias_adjustment.distributions.distributions import _fit_dist, _fit_hist
+from bias_adjustment.distributions import Distributions, FitResult
+from bias_adjustment.distributions.batched import TableDistribution
+from bias_adjustment.distributions.distributions import (
+    _fit_dist,
+    _fit_empirical,
+    _fit_hist,
+)
 from bias_adjustment.utils import is_array_like
 from tests.data import obs
 
@@ -42,6 +47,35 @@ def test_fit_hist(params, error):
             _fit_hist(**params)
 
 
+@pytest.mark.parametrize(
+    "params, error",
+    [
+        ({"data": obs}, None),
+        ({}, TypeError),
+        ({"data": [1, 2, 3]}, TypeError),
+        ({"data": np.array(["1", "2", "3"])}, TypeError),
+        ({"data": np.array([1.1, 2.4, 3.0])}, ValueError),
+    ],
+    ids=[
+        "default",
+        "no input",
+        "data: wrong type 1",
+        "data: wrong type 2",
+        "data: wrong length",
+    ],
+)
+def test_fit_empirical(params, error):
+    if error is None:
+        dist = _fit_empirical(**params)
+        assert isinstance(dist, TableDistribution)
+        q = np.linspace(0, 1, 101)
+        np.testing.assert_allclose(dist.ppf(q), np.quantile(obs, q))
+        np.testing.assert_allclose(dist.cdf(dist.ppf(q)), q)
+    else:
+        with pytest.raises(error):
+            _fit_empirical(**params)
+
+
 @pytest.mark.parametrize(
     "params, error",
     [
@@ -131,6 +165,13 @@ class TestDistributions:
             with pytest.raises(error):
                 obj.fit(**params)
 
+    def test_method_fit_empirical(self):
+        dist = Distributions(obs).fit(dist_type="empirical")
+        assert isinstance(dist, TableDistribution)
+        assert dist.cdf(obs.min() - 1) == 0
+        assert dist.cdf(obs.max() + 1) == 1
+        assert np.isnan(dist.ppf(1.5))
+
     @pytest.mark.parametrize(
         "params, error, warning",
         [
@@ -138,9 +179,17 @@ class TestDistributions:
             ({"distributions": ["gamma"]}, None, None),
             ({"distributions": "gamma"}, TypeError, None),
             ({"distributions": [1, 2, 3]}, TypeError, None),
-            ({"distributions": ["not_valid_dist", "invalid_dist"]}, None, UserWarning),
+            (
+                {"distributions": ["not_valid_dist", "invalid_dist"]},
+                ValueError,
+                UserWarning,
+            ),
             ({"bins": 50}, None, None),
             ({"bins": "50"}, TypeError, None),
+            ({"screen_size": 500, "seed": 1}, None, None),
+            ({"screen_size": 500.0}, TypeError, None),
+            ({"screen_size": 0}, ValueError, None),
+            ({"screen_size": 5}, ValueError, None),
         ],
         ids=[
             "default",
@@ -150,16 +199,91 @@ class TestDistributions:
             "distributions: invalid values",
             "bins: valid value",
             "bins: wrong type",
+            "screen_size: valid value",
+            "screen_size: wrong type",
+            "screen_size: should be >= 1",
+            "screen_size: below min_len",
         ],
     )
     def test_method_best_fit(self, params, error, warning):
         obj = Distributions(obs)
         assert hasattr(obj, "best_fit")
         if warning is not None:
-            with pytest.warns(warning):
+            with pytest.warns(warning), pytest.raises(error):
                 obj.best_fit(**params)
         elif error is None:
             assert isinstance(obj.best_fit(**params), get_args(DistType))
         else:
             with pytest.raises(error):
                 obj.best_fit(**params)
+
+    def test_method_best_fit_seed(self, mocker):
+        obj = Distributions(obs)
+        spy = mocker.spy(obj, "rank_fits")
+        obj.best_fit(["norm", "gamma", "uniform"], screen_size=500, seed=3)
+        assert spy.call_args.kwargs["seed"] == 3
+
+    @pytest.mark.parametrize(
+        "params",
+        [
+            {},
+            {"criterion": "aic"},
+            {"criterion": "bic"},
+            {"criterion": "ks"},
+            {"n_workers": 3},
+            {"n_workers": 2, "executor": "process"},
+        ],
+        ids=[
+            "default",
+            "criterion: aic",
+            "criterion: bic",
+            "criterion: ks",
+            "n_workers: threads",
+            "executor: process",
+        ],
+    )
+    def test_method_rank_fits(self, params):
+        ranking = Distributions(obs).rank_fits(["norm", "gamma", "lognorm"], **params)
+        assert [isinstance(res, FitResult) for res in ranking] == [True] * 3
+        assert all(res.elapsed > 0 for res in ranking)
+        scores = [res.score for res in ranking]
+        assert scores == sorted(scores)
+        # obs is gamma distributed
+        assert ranking[0].name in ["gamma", "lognorm"]
+        assert ranking[-1].name == "norm"
+
+    def test_method_rank_fits_screening(self):
+        ranking = Distributions(obs).rank_fits(
+            ["norm", "gamma", "uniform"], screen_size=500, screen_keep=1
+        )
+        assert [res.name for res in ranking][0] == "gamma"
+        assert [res.screened_out for res in ranking] == [False, True, True]
+
+    @pytest.mark.parametrize(
+        "params, error",
+        [
+            ({"criterion": "mse"}, ValueError),
+            ({"executor": "cluster"}, ValueError),
+            ({"n_workers": 0}, ValueError),
+            ({"n_workers": "2"}, TypeError),
+            ({"screen_size": 0}, ValueError),
+            ({"screen_size": "500"}, TypeError),
+            ({"screen_size": 9}, ValueError),
+            ({"distributions": ["gamma", "gamma.fast"]}, ValueError),
+            ({"distributions": ["empirical"]}, ValueError),
+        ],
+        ids=[
+            "criterion: invalid value",
+            "executor: invalid value",
+            "n_workers: should be >= 1",
+            "n_workers: wrong type",
+            "screen_size: should be >= 1",
+            "screen_size: wrong type",
+            "screen_size: below min_len",
+            "distributions: batched fit",
+            "distributions: empirical",
+        ],
+    )
+    def test_method_rank_fits_errors(self, params, error):
+        with pytest.raises(error):
+            Distributions(obs).rank_fits(**params)
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from bias_adjustment.distributions import Distributions, HistogramSketch
+from bias_adjustment.quantile_mapping import QuantileTransfer
+from tests.data import modf, modh, obs
+
+grid = np.stack([obs, modh, modf], axis=1)
+
+
+@pytest.mark.parametrize("data", [obs, grid], ids=["series", "grid"])
+def test_from_data_matches_hist(data):
+    sketch = HistogramSketch.from_data(data, bins=50)
+    hist = Distributions(data).fit("hist", bins=50)
+    x = data[::7]
+    q = np.linspace(0, 1, len(x))
+    if data.ndim > 1:
+        q = q[:, None].repeat(data.shape[1], axis=1)
+    np.testing.assert_allclose(sketch.cdf(x), hist.cdf(x), atol=1e-12)
+    np.testing.assert_allclose(sketch.ppf(q), hist.ppf(q), atol=1e-9)
+    np.testing.assert_array_equal(sketch.n, np.count_nonzero(~np.isnan(data), axis=0))
+
+
+@pytest.mark.parametrize("data", [obs, grid], ids=["series", "grid"])
+def test_update_merge(data):
+    head, tail = data[:5000], data[5000:]
+    expected = HistogramSketch.from_data(head).update(tail)
+    assert expected.n.sum() == np.count_nonzero(~np.isnan(data))
+
+    base = HistogramSketch.from_data(head)
+    parts = [base.empty_like().update(part) for part in np.array_split(tail, 3)]
+    for part in parts:
+        base.merge(part)
+    assert base.offset == expected.offset
+    np.testing.assert_array_equal(base.counts, expected.counts)
+
+
+def test_coarsen():
+    sketch = HistogramSketch.from_data(obs, bins=100, max_bins=150)
+    width = sketch.width
+    sketch.update(np.array([obs.max() * 3]))
+    assert len(sketch.counts) <= 150
+    assert sketch.width == 4 * width
+    assert sketch.n == len(obs) + 1
+
+    fine = HistogramSketch.from_data(obs, bins=100, max_bins=150)
+    fine.merge(sketch)
+    assert fine.width == sketch.width
+    assert fine.n == 2 * len(obs) + 1
+
+
+def test_empty_cells():
+    data = grid.copy()
+    data[:, 1] = np.nan
+    sketch = HistogramSketch.from_data(data).update(grid)
+    res = sketch.ppf(sketch.cdf(grid))
+    assert np.isnan(res[:, 1]).all()
+    assert not np.isnan(res[:, [0, 2]]).any()
+
+
+def test_transfer(tmp_path):
+    o, m = HistogramSketch.from_data(obs), HistogramSketch.from_data(modh)
+    obj = QuantileTransfer(o, m)
+    obj.save(tmp_path / "fit")
+    res = QuantileTransfer.load(tmp_path / "fit")
+    assert isinstance(res.o_dist, HistogramSketch)
+    np.testing.assert_array_equal(res.transform(modf), obj.transform(modf))
+    res.o_dist.update(modf)
+    assert res.o_dist.n == 2 * len(obs)
+
+
+@pytest.mark.parametrize(
+    "func, error",
+    [
+        (lambda: HistogramSketch.from_data(obs.tolist()), TypeError),
+        (lambda: HistogramSketch.from_data(obs, bins=0), ValueError),
+        (lambda: HistogramSketch.from_data(obs).update(grid), ValueError),
+        (
+            lambda: HistogramSketch.from_data(obs).merge(
+                HistogramSketch.from_data(modh)
+            ),
+            ValueError,
+        ),
+        (lambda: HistogramSketch(0.0, 1.0, np.zeros(3), max_bins=1), ValueError),
+    ],
+    ids=[
+        "data: wrong type",
+        "bins: zero",
+        "update: wrong cells",
+        "merge: other origin",
+        "max_bins: too small",
+    ],
+)
+def test_errors(func, error):
+    with pytest.raises(error):
+        func()
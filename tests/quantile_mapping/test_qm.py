@@ -1,7 +1,12 @@
 import numpy as np
 import pytest
 
-from bias_adjustment.quantile_mapping.qm import QuantileMapping
+from bias_adjustment.quantile_mapping import (
+    DetrendedQuantileMapping,
+    QuantileDeltaMapping,
+    QuantileMapping,
+)
+from bias_adjustment.quantile_mapping.qdm import _windows
 from bias_adjustment.utils import is_array_like, is_float_ndarray
 from tests.data import max_cdf, modf, modh, obs, trace_val
 
@@ -75,3 +80,135 @@ class TestQuantileMapping:
         else:
             with pytest.raises(error):
                 obj.compute(**params)
+
+    @pytest.mark.parametrize(
+        "cls, mode",
+        [
+            (QuantileMapping, None),
+            (DetrendedQuantileMapping, "rel"),
+            (QuantileDeltaMapping, "abs"),
+        ],
+        ids=["qm", "dqm.rel", "qdm.abs"],
+    )
+    def test_method_compute_output(self, cls, mode):
+        kwargs = {} if mode is None else {"mode": mode}
+        obj = cls(obs, modh, modf)
+        expected = obj.compute(**kwargs)
+
+        res = obj.compute(dtype=np.float32, **kwargs)
+        assert res.dtype == np.float32
+        np.testing.assert_array_equal(res, expected.astype(np.float32))
+
+        # float32 data, blocks are evaluated in float64
+        data = modf.astype(np.float32)
+        res = cls(obs, modh, data).compute(dtype=np.float32, **kwargs)
+        expected = cls(obs, modh, data.astype(float)).compute(**kwargs)
+        np.testing.assert_array_equal(res, expected.astype(np.float32))
+
+        out = np.empty_like(modf)
+        assert obj.compute(out=out, **kwargs) is out
+        np.testing.assert_array_equal(out, obj.compute(**kwargs))
+
+    @pytest.mark.parametrize(
+        "params, error",
+        [
+            ({"out": np.empty(len(modf), dtype=int)}, TypeError),
+            ({"out": np.empty(10)}, ValueError),
+            ({"out": np.empty(len(modf)), "dtype": np.float32}, TypeError),
+            ({"dtype": int}, TypeError),
+        ],
+        ids=[
+            "out: wrong type",
+            "out: wrong shape",
+            "out: dtype mismatch",
+            "dtype: not floating",
+        ],
+    )
+    def test_method_compute_output_errors(self, params, error):
+        with pytest.raises(error):
+            QuantileMapping(obs, modh, modf).compute(**params)
+
+    def test_method_compute_modes(self):
+        obj = QuantileDeltaMapping(obs, modh, modf)
+        res = obj.compute_modes(["rel", "abs"], dtype=np.float32)
+        for mode in ["rel", "abs"]:
+            expected = obj.compute(mode=mode, dtype=np.float32)
+            np.testing.assert_array_equal(res[mode], expected)
+        with pytest.raises(ValueError):
+            obj.compute_modes(["rel", "mul"])
+
+
+@pytest.mark.parametrize(
+    "n, window, step",
+    [(100, 30, 10), (100, 30, 7), (100, 30, 30), (25, 30, 10)],
+    ids=["even steps", "uneven steps", "step: window", "window: whole series"],
+)
+def test_windows(n, window, step):
+    windows = _windows(n, window, step)
+    assert windows[0][0] == 0 and windows[-1][1] == n
+    for (_, stop, _, _), (start, _, _, _) in zip(windows, windows[1:]):
+        assert stop == start
+    for start, stop, w_start, w_stop in windows:
+        assert 0 <= w_start <= start < stop <= w_stop <= n
+        assert w_stop - w_start == min(window, n)
+
+
+class TestQuantileDeltaMapping:
+    @pytest.mark.parametrize(
+        "params, error",
+        [
+            ({"window": 3000}, None),
+            ({"window": 3000, "step": 1000}, None),
+            ({"window": "3000"}, TypeError),
+            ({"window": 3000, "step": 1.5}, TypeError),
+            ({"window": 5}, ValueError),
+            ({"window": 3000, "step": 4000}, ValueError),
+            ({"step": 1000}, ValueError),
+        ],
+        ids=[
+            "window: default step",
+            "window and step",
+            "window: wrong type",
+            "step: wrong type",
+            "window: too short",
+            "step: longer than window",
+            "step: without window",
+        ],
+    )
+    def test_init_window(self, params, error):
+        if error is None:
+            obj = QuantileDeltaMapping(obs, modh, modf, **params)
+            assert obj.step == params.get("step", params["window"] // 3)
+        else:
+            with pytest.raises(error):
+                QuantileDeltaMapping(obs, modh, modf, **params)
+
+    @pytest.mark.parametrize("mode", ["rel", "abs"])
+    def test_method_compute_window(self, mode):
+        data = modf * np.linspace(1, 2, len(modf))
+        res = QuantileDeltaMapping(obs, modh, data, window=3000, step=1500).compute(
+            mode=mode
+        )
+        for start, stop, w_start, w_stop in _windows(len(data), 3000, 1500):
+            expected = QuantileDeltaMapping(obs, modh, data[w_start:w_stop]).compute(
+                mode=mode
+            )
+            np.testing.assert_array_equal(
+                res[start:stop], expected[start - w_start : stop - w_start]
+            )
+
+        whole = QuantileDeltaMapping(obs, modh, data, window=len(data)).compute(
+            mode=mode
+        )
+        np.testing.assert_array_equal(
+            whole, QuantileDeltaMapping(obs, modh, data).compute(mode=mode)
+        )
+
+    def test_method_compute_window_grid(self):
+        o, m, d = (np.stack([x, x[::-1]], axis=1) for x in [obs, modh, modf])
+        res = QuantileDeltaMapping(o.T, m.T, d.T, axis=1, window=3000).compute()
+        for i in range(2):
+            expected = QuantileDeltaMapping(
+                o[:, i], m[:, i], d[:, i], window=3000
+            ).compute()
+            np.testing.assert_allclose(res[i], expected)
@@ -0,0 +1,160 @@
+import numpy as np
+import pytest
+from scipy import stats as st
+
+from bias_adjustment import BiasAdjustment
+from bias_adjustment.quantile_mapping import QuantileTransfer
+from bias_adjustment.quantile_mapping.tails import Tail, _fit_gpd
+from tests.data import modf, modh, obs
+
+extremes = np.array([60.0, 90.0, 140.0, 200.0, 400.0])
+
+
+@pytest.mark.parametrize("shape", [-0.2, 0.0, 0.3])
+def test_fit_gpd(shape):
+    data = st.genpareto.rvs(shape, scale=5, size=(20000, 2), random_state=1)
+    data[:19995, 1] = np.nan
+    res = _fit_gpd(data)
+    c, _, scale = st.genpareto.fit(data[:, 0], floc=0)
+    np.testing.assert_allclose(res[:, 0], [c, scale], atol=0.03, rtol=0.03)
+    # too few excesses
+    assert np.isnan(res[:, 1]).all()
+
+
+@pytest.mark.parametrize("tail", ["constant", "linear", "gpd"])
+def test_tail(tail):
+    ba, clip = BiasAdjustment(obs, modh, tail=tail), BiasAdjustment(obs, modh)
+    res, expected = ba.adjust(modf), clip.adjust(modf)
+    start = ba.transfer().tail.start
+    body = modf <= start
+    np.testing.assert_array_equal(res[body], expected[body])
+    assert (np.diff(ba.transfer().transform(extremes)) >= 0).all()
+
+    # continuous at the start of the tail
+    x = start + np.array([-1e-9, 1e-9])
+    np.testing.assert_allclose(*ba.transfer().transform(x), rtol=1e-6)
+
+
+def test_tail_extrapolation():
+    clip = BiasAdjustment(obs, modh).transfer().transform(extremes)
+    assert (clip[2:] == clip[-1]).all()
+    constant = BiasAdjustment(obs, modh, tail="constant").transfer()
+    res = constant.transform(extremes)
+    np.testing.assert_allclose(np.diff(res[2:]), np.diff(extremes[2:]))
+    linear = BiasAdjustment(obs, modh, tail="linear").transfer()
+    res = linear.transform(extremes)
+    slope = linear.tail.params[1]
+    np.testing.assert_allclose(np.diff(res[2:]), slope * np.diff(extremes[2:]))
+
+
+def test_tail_gpd():
+    ba = BiasAdjustment(obs, modh, tail="gpd")
+    data = np.array([100.0, 1000.0, 5000.0, 1e5, 1e300])
+    res = ba.transfer().transform(data)
+    assert np.isfinite(res).all()
+    assert (np.diff(res) >= 0).all()
+    np.testing.assert_array_equal(ba.adjust(np.resize(data, 20))[:5], res)
+
+    o_dist, m_dist = ba.fit()
+    tail = Tail.fit("gpd", o_dist, m_dist, 0.9999999, obs, modh, min_sf=1e-6)
+    # the conditional mod survival is 1e-6 near start - log(1e-6) * scale
+    res = tail.apply(np.array([100.0, 140.0, 150.0, 400.0]), np.zeros(4))
+    assert res[0] < res[1] < res[2]
+    assert res[2] == res[3]
+
+    # an obs GPD with a negative shape bounds the obs excess
+    params = tail.params.copy()
+    params[3] = -0.5
+    tail = Tail("gpd", tail.start, params)
+    res = tail.apply(np.array([1e5]), np.zeros(1))
+    assert res[0] <= params[2] + params[4] / 0.5
+
+
+def test_tail_gpd_unfit():
+    o, m = (np.stack([v, v], axis=1) for v in [obs, modh])
+    # about 5 values above the 0.99 quantile
+    m[500:, 1] = np.nan
+    with pytest.warns(UserWarning, match=r"\[1\]"):
+        tail = BiasAdjustment(o, m, tail="gpd").transfer().tail
+    assert np.isnan(tail.start[1])
+    assert not np.isnan(tail.start[0])
+
+
+@pytest.mark.parametrize("tail", ["constant", "linear", "gpd"])
+def test_tail_grid(tail):
+    o, m, d = (np.stack([v, v * 1.5, v[::-1]], axis=1) for v in [obs, modh, modf])
+    mask = np.array([True, False, True])
+    d[-1] = 400.0
+    res = BiasAdjustment(o, m, mask=mask, tail=tail).adjust(d)
+    assert np.isnan(res[:, 1]).all()
+    for i in [0, 2]:
+        expected = BiasAdjustment(o[:, i], m[:, i], tail=tail).adjust(d[:, i])
+        np.testing.assert_allclose(res[:, i], expected)
+
+
+@pytest.mark.parametrize("tail", ["linear", "gpd"])
+def test_tail_dqm(tail):
+    data = modf * 2
+    data[0] = 1000.0
+    res = BiasAdjustment(obs, modh, tail=tail).adjust(data, method="dqm")
+    clip = BiasAdjustment(obs, modh).adjust(data, method="dqm")
+    assert res[0] > clip[0]
+
+
+@pytest.mark.parametrize("tail", ["linear", "gpd"])
+def test_tail_save_load(tmp_path, tail):
+    obj = BiasAdjustment(obs, modh, tail=tail).transfer()
+    obj.save(tmp_path / "fit")
+    res = QuantileTransfer.load(tmp_path / "fit")
+    assert res.tail.mode == tail
+    np.testing.assert_array_equal(res.transform(extremes), obj.transform(extremes))
+
+    table = obj.compile()
+    assert table.tail is obj.tail
+    np.testing.assert_allclose(
+        table.transform(extremes[2:]), obj.transform(extremes[2:])
+    )
+    table.save(tmp_path / "table")
+    res = type(table).load(tmp_path / "table")
+    np.testing.assert_array_equal(res.transform(extremes), table.transform(extremes))
+
+
+@pytest.mark.parametrize(
+    "func, error",
+    [
+        (lambda d: Tail.fit("pareto", *d, 0.999), ValueError),
+        (lambda d: Tail.fit("linear", *d, 0.999, q=1), TypeError),
+        (lambda d: Tail.fit("linear", *d, 0.999, q=0.9999), ValueError),
+        (lambda d: Tail.fit("gpd", *d, 0.999), ValueError),
+        (lambda d: Tail.fit("gpd", *d, 0.999, obs, modh, min_sf=1), TypeError),
+        (lambda d: Tail.fit("gpd", *d, 0.999, obs, modh, min_sf=0.0), ValueError),
+        (lambda d: Tail("linear", 1.0, np.zeros((2, 3))), ValueError),
+        (lambda d: QuantileTransfer(*d, tail="gpd"), TypeError),
+        (
+            lambda d: BiasAdjustment(obs, modh, tail="gpd").adjust(modf, "qdm"),
+            ValueError,
+        ),
+        (
+            lambda d: BiasAdjustment(obs, modh, tail="linear").adjust(
+                modf, ["qm", "qdm.abs"]
+            ),
+            ValueError,
+        ),
+    ],
+    ids=[
+        "mode: invalid",
+        "q: wrong type",
+        "q: above max_cdf",
+        "gpd: no data",
+        "min_sf: wrong type",
+        "min_sf: zero",
+        "params: wrong cells",
+        "transfer tail: wrong type",
+        "qdm: no tail",
+        "qdm in a list: no tail",
+    ],
+)
+def test_errors(func, error):
+    dists = BiasAdjustment(obs, modh).fit()
+    with pytest.raises(error):
+        func(dists)
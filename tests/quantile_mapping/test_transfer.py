@@ -0,0 +1,227 @@
+import numpy as np
+import pytest
+
+from bias_adjustment import BiasAdjustment
+from bias_adjustment.quantile_mapping import (
+    QuantileMapping,
+    QuantileTransfer,
+    TransferTable,
+)
+from bias_adjustment.utils import is_float_ndarray
+from tests.data import modf, modh, obs
+
+
+class TestQuantileTransfer:
+    @pytest.mark.parametrize(
+        "params, error",
+        [
+            ({}, None),
+            ({"o_dist": "o_dist"}, TypeError),
+            ({"max_cdf": "0.88"}, TypeError),
+            ({"max_cdf": 1.2}, ValueError),
+        ],
+        ids=[
+            "default",
+            "o_dist: wrong type",
+            "max_cdf: wrong type",
+            "max_cdf: should be < 1",
+        ],
+    )
+    def test_init(self, params, error):
+        o_dist, m_dist = BiasAdjustment(obs, modh).fit()
+        params = {"o_dist": o_dist, "m_dist": m_dist, **params}
+        if error is None:
+            assert isinstance(QuantileTransfer(**params), QuantileTransfer)
+        else:
+            with pytest.raises(error):
+                QuantileTransfer(**params)
+
+    def test_method_transform(self):
+        obj = BiasAdjustment(obs, modh).transfer()
+        expected = QuantileMapping(obs, modh, modf).compute()
+        np.testing.assert_array_equal(obj.transform(modf), expected)
+        # no minimum length
+        np.testing.assert_array_equal(obj.transform(modf[:3]), expected[:3])
+        assert is_float_ndarray(obj.transform(np.array([1.0])))
+        with pytest.raises(TypeError):
+            obj.transform([1.0, 2.0])
+
+    def test_method_transform_iter(self):
+        obj = BiasAdjustment(obs, modh).transfer(dist_type="empirical")
+        expected = obj.transform(modf)
+        chunks = (modf[i : i + 7] for i in range(0, len(modf), 7))
+        res = obj.transform_iter(chunks)
+        assert not isinstance(res, list)
+        np.testing.assert_array_equal(np.concatenate(list(res)), expected)
+
+    def test_method_transform_iter_grid(self):
+        o = np.stack([obs, obs * 2], axis=1)
+        m = np.stack([modh, modh], axis=1)
+        d = np.stack([modf, modf[::-1]], axis=1)
+        obj = BiasAdjustment(o, m).transfer()
+        res = np.concatenate(list(obj.transform_iter(np.array_split(d, 9))))
+        np.testing.assert_array_equal(res, BiasAdjustment(o, m).adjust(d))
+
+    @pytest.mark.parametrize(
+        "dist_type, grid",
+        [
+            ("hist", False),
+            ("empirical", False),
+            ("gamma", False),
+            ("hist", True),
+            ("norm", True),
+            ("empirical", "masked"),
+        ],
+        ids=[
+            "dist_type: hist",
+            "dist_type: empirical",
+            "dist_type: gamma",
+            "grid: hist",
+            "grid: norm",
+            "grid: masked",
+        ],
+    )
+    def test_method_save_load(self, tmp_path, dist_type, grid):
+        o, m, d = obs, modh, modf
+        mask = None
+        if grid:
+            o, m, d = (np.stack([v, v[::-1]], axis=1) for v in [obs, modh, modf])
+        if grid == "masked":
+            mask = np.array([False, True])
+        obj = BiasAdjustment(o, m, max_cdf=0.999, mask=mask).transfer(
+            dist_type=dist_type
+        )
+        obj.save(tmp_path / "fit")
+        res = QuantileTransfer.load(tmp_path / "fit")
+        assert res.max_cdf == 0.999
+        assert res.meta == {
+            "dist_type": dist_type,
+            "ignore_trace": False,
+            "bins": 200,
+            "trace_val": 0.05,
+        }
+        np.testing.assert_array_equal(res.transform(d), obj.transform(d))
+
+    def test_method_load_mmap(self, tmp_path):
+        obj = BiasAdjustment(obs, modh).transfer(dist_type="empirical")
+        obj.save(tmp_path / "fit")
+        res = QuantileTransfer.load(tmp_path / "fit", mmap_mode="r")
+        assert isinstance(res.o_dist.values, np.memmap)
+        np.testing.assert_array_equal(res.transform(modf), obj.transform(modf))
+
+
+class TestTransferTable:
+    @pytest.mark.parametrize(
+        "params, error",
+        [
+            ({}, None),
+            ({"size": 10.0}, TypeError),
+            ({"size": 1}, ValueError),
+            ({"size": 100, "max_size": 10}, ValueError),
+            ({"tol": 1}, TypeError),
+            ({"tol": -1.0}, ValueError),
+            ({"extrapolate": "const"}, ValueError),
+        ],
+        ids=[
+            "default",
+            "size: wrong type",
+            "size: too small",
+            "max_size: below size",
+            "tol: wrong type",
+            "tol: negative",
+            "extrapolate: invalid",
+        ],
+    )
+    def test_compile(self, params, error):
+        obj = BiasAdjustment(obs, modh).transfer()
+        if error is None:
+            res = obj.compile(**params)
+            assert isinstance(res, TransferTable)
+            assert len(res.adjusted) == 1024
+            # calibration range of "hist" fits: the range of `modh`
+            np.testing.assert_allclose(
+                res.values[[0, -1]], [modh.min(), modh.max()], rtol=1e-5
+            )
+        else:
+            with pytest.raises(error):
+                obj.compile(**params)
+
+    @pytest.mark.parametrize("dist_type", ["gamma", "lognorm"])
+    def test_method_transform_tol(self, dist_type):
+        obj = BiasAdjustment(obs, modh).transfer(dist_type=dist_type)
+        res = obj.compile(size=64, tol=1e-4)
+        assert len(res.adjusted) > 64
+        mid = (res.values[1:] + res.values[:-1]) / 2
+        np.testing.assert_allclose(res.transform(mid), obj.transform(mid), atol=1e-4)
+        np.testing.assert_allclose(res.transform(modf), obj.transform(modf), atol=1e-4)
+
+    def test_method_transform_jumps(self):
+        obj = BiasAdjustment(obs, modh).transfer()
+        with pytest.warns(UserWarning, match="not reached"):
+            res = obj.compile(tol=1e-6, max_size=16384)
+        assert len(res.adjusted) == 16369
+        err = np.abs(res.transform(modf) - obj.transform(modf))
+        assert np.median(err) < 1e-12
+
+    @pytest.mark.parametrize("dist_type", ["hist", "norm"])
+    def test_method_transform_grid(self, dist_type):
+        o, m, d = (np.stack([v, v * 1.5, v[::-1]], axis=1) for v in [obs, modh, modf])
+        o[:, 1] = np.nan
+        obj = BiasAdjustment(o, m).transfer(dist_type=dist_type)
+        res = obj.compile(size=4096)
+        assert res.adjusted.shape == (4096, 3)
+        expected = obj.transform(d)
+        adjusted = res.transform(d, dtype=np.float32)
+        assert adjusted.dtype == np.float32
+        assert np.isnan(adjusted[:, 1]).all()
+        np.testing.assert_allclose(adjusted, expected, atol=1e-3, rtol=1e-2)
+
+    @pytest.mark.parametrize(
+        "extrapolate, expected",
+        [
+            ("clip", [1.78496065, 1.78496065, 132.5256486, np.nan]),
+            ("linear", [-3.7593613, -1.2203688, 15226.72, np.nan]),
+            ("nan", [np.nan, np.nan, np.nan, np.nan]),
+        ],
+    )
+    def test_method_transform_extrapolate(self, extrapolate, expected):
+        obj = BiasAdjustment(obs, modh).transfer()
+        res = obj.compile(extrapolate=extrapolate)
+        x = np.array([-5.0, 0.0, 1e4, np.nan])
+        np.testing.assert_allclose(res.transform(x), expected, rtol=1e-6)
+        if extrapolate == "clip":
+            np.testing.assert_array_equal(res.transform(x), obj.transform(x))
+
+    @pytest.mark.parametrize("grid", [False, True], ids=["series", "grid"])
+    def test_method_save_load(self, tmp_path, grid):
+        o, m, d = obs, modh, modf
+        if grid:
+            o, m, d = (np.stack([v, v[::-1]], axis=1) for v in [obs, modh, modf])
+        obj = BiasAdjustment(o, m).transfer().compile(extrapolate="linear")
+        obj.save(tmp_path / "table")
+        res = TransferTable.load(tmp_path / "table", mmap_mode="r")
+        assert res.extrapolate == "linear"
+        assert res.meta["dist_type"] == "hist"
+        np.testing.assert_array_equal(res.transform(d), obj.transform(d))
+        with pytest.raises(ValueError):
+            QuantileTransfer.load(tmp_path / "table")
+
+    @pytest.mark.parametrize(
+        "params, error",
+        [
+            ({"adjusted": [1.0, 2.0]}, TypeError),
+            ({"adjusted": np.array([1.0])}, ValueError),
+            ({"start": np.zeros(2)}, ValueError),
+            ({"extrapolate": "const"}, ValueError),
+        ],
+        ids=[
+            "adjusted: wrong type",
+            "adjusted: too short",
+            "start: wrong cells",
+            "extrapolate: invalid",
+        ],
+    )
+    def test_init(self, params, error):
+        params = {"start": 0.0, "step": 1.0, "adjusted": np.arange(3.0), **params}
+        with pytest.raises(error):
+            TransferTable(**params)
@@ -25,6 +25,9 @@ class TestBiasAdjustment:
             ({"obs": obs, "mod": modh, "max_cdf": "0.88"}, TypeError),
             ({"obs": obs, "mod": modh, "max_cdf": 1.2}, ValueError),
             ({"obs": obs, "mod": modh, "max_cdf": -0.5}, ValueError),
+            ({"obs": obs, "mod": modh, "trace_val": 1}, TypeError),
+            ({"obs": obs, "mod": modh, "tail": "gpd"}, None),
+            ({"obs": obs, "mod": modh, "tail": "pareto"}, ValueError),
         ],
         ids=[
             "default",
@@ -36,6 +39,9 @@ class TestBiasAdjustment:
             "max_cdf: wrong type",
             "max_cdf: should be < 1",
             "max_cdf: should be >= 0.5",
+            "trace_val: wrong type",
+            "tail: gpd",
+            "tail: invalid",
         ],
     )
     def test_init(self, params, error):
@@ -129,3 +135,225 @@ class TestBiasAdjustment:
         else:
             with pytest.raises(error):
                 obj.adjust(**params)
+
+    @pytest.mark.parametrize("method", ["qm", "dqm.abs", "qdm.rel"])
+    def test_method_adjust_fit_data(self, method):
+        obj = BiasAdjustment(obs, modh)
+        expected = obj.adjust(modf, method=method)
+        # only a few values, with the statistics of the whole series
+        res = obj.adjust(modf[100:105], method=method, fit_data=modf)
+        np.testing.assert_allclose(res, expected[100:105])
+        with pytest.raises(ValueError):
+            obj.adjust(modf, method="qdm", window=1000, fit_data=modf)
+        with pytest.raises(ValueError):
+            obj.adjust(modf, fit_data=modf[:5])
+
+    def test_method_fit(self):
+        obj = BiasAdjustment(obs, modh, cache_size=2)
+        assert hasattr(obj, "fit")
+        dists = obj.fit()
+        assert obj.fit() is dists
+        assert obj.fit(bins=100) is not dists
+        obj.fit(dist_type="norm")
+        # least recently used entry was evicted
+        assert len(obj._cache) == 2
+        assert obj.fit() is not dists
+        obj.clear_cache()
+        assert len(obj._cache) == 0
+
+    def test_method_set_fit(self):
+        o, m, d = (np.stack([v, v[::-1], v], axis=1) for v in [obs, modh, modf])
+        mask = np.array([True, False, True])
+        dists = BiasAdjustment(o, m).fit("empirical")
+        obj = BiasAdjustment(o, m, mask=mask, cache_size=1)
+        obj.set_fit(*dists, bins=50)
+        assert len(obj._cache) == 1
+        # restricted to the cells of the mask
+        assert obj.fit(bins=50)[0].cells.tolist() == [0, 2]
+        expected = BiasAdjustment(o, m, mask=mask).adjust(d, dist_type="empirical")
+        np.testing.assert_array_equal(obj.adjust(d, bins=50), expected)
+
+    @pytest.mark.parametrize(
+        "params, error",
+        [
+            ({"cache_size": 4}, None),
+            ({"cache_size": "4"}, TypeError),
+            ({"cache_size": 0}, ValueError),
+        ],
+        ids=[
+            "cache_size: valid value",
+            "cache_size: wrong type",
+            "cache_size: should be >= 1",
+        ],
+    )
+    def test_init_cache_size(self, params, error):
+        if error is None:
+            assert BiasAdjustment(obs, modh, **params).cache_size == 4
+        else:
+            with pytest.raises(error):
+                BiasAdjustment(obs, modh, **params)
+
+    @pytest.mark.parametrize(
+        "method, n_fits",
+        [("qm", 0), ("dqm.rel", 0), ("qdm.rel", 1)],
+        ids=["method: qm", "method: dqm.rel", "method: qdm.rel"],
+    )
+    def test_method_adjust_reuses_fit(self, mocker, method, n_fits):
+        obj = BiasAdjustment(obs, modh)
+        expected = obj.adjust(modf, method=method)
+        spy = mocker.spy(QuantileMapping, "generate_distribution")
+        np.testing.assert_array_equal(obj.adjust(modf, method=method), expected)
+        assert spy.call_count == n_fits
+
+    @pytest.mark.parametrize(
+        "data, error",
+        [
+            (modf, None),
+            (np.ones(5), ValueError),
+            (np.ones((len(modf), 2)), ValueError),
+        ],
+        ids=["valid", "data: too short", "data: wrong grid shape"],
+    )
+    @pytest.mark.parametrize("method", ["qm", "dqm.rel", "qdm.abs"])
+    def test_method_adjust_validates_once(self, mocker, method, data, error):
+        obj = BiasAdjustment(obs, modh)
+        spy = mocker.spy(QuantileMapping, "_validate")
+        if error is None:
+            obj.adjust(data, method=method)
+        else:
+            with pytest.raises(error):
+                obj.adjust(data, method=method)
+        assert spy.call_count == 0
+
+    @pytest.mark.parametrize(
+        "method, dist_type",
+        [("qm", "hist"), ("dqm.abs", "hist"), ("qdm.rel", "hist"), ("qm", "norm")],
+        ids=["method: qm", "method: dqm.abs", "method: qdm.rel", "dist_type: norm"],
+    )
+    def test_method_adjust_grid(self, method, dist_type):
+        # (cells, time) grid, adjusted along the last axis
+        o = np.stack([obs, obs[::-1] * 2])
+        m = np.stack([modh, modh[::-1]])
+        d = np.stack([modf, modf[::-1]])
+        res = BiasAdjustment(o, m, axis=-1).adjust(
+            d, method=method, dist_type=dist_type
+        )
+        assert res.shape == d.shape
+        for i in range(o.shape[0]):
+            expected = BiasAdjustment(o[i], m[i]).adjust(
+                d[i], method=method, dist_type=dist_type
+            )
+            np.testing.assert_allclose(res[i], expected)
+
+    @pytest.mark.parametrize(
+        "params, error",
+        [
+            ({"obs": obs[:, None], "mod": modh[:, None], "axis": 1}, ValueError),
+            ({"obs": obs[:, None], "mod": modh[:, None], "axis": "0"}, TypeError),
+            ({"obs": obs[:, None], "mod": np.ones((len(modh), 2))}, ValueError),
+        ],
+        ids=[
+            "axis: too short",
+            "axis: wrong type",
+            "mod: grid shape mismatch",
+        ],
+    )
+    def test_init_grid(self, params, error):
+        with pytest.raises(error):
+            BiasAdjustment(**params)
+
+    @pytest.mark.parametrize("method", ["qm", "qdm.rel"])
+    def test_seed(self, method):
+        o = np.where(obs < 10, 0.01, obs)
+        res = [
+            BiasAdjustment(o, modh, seed=seed).adjust(
+                modf, method=method, ignore_trace=True
+            )
+            for seed in [1, 1, 2]
+        ]
+        np.testing.assert_array_equal(res[0], res[1])
+        assert not np.array_equal(res[0], res[2])
+
+    def test_adapt_freq(self, mocker):
+        o = np.where(obs < 20, 0.0, obs)
+        spy = mocker.spy(QuantileMapping, "generate_distribution")
+        BiasAdjustment(o, modh, seed=0, adapt_freq=True).fit()
+        # modh has no dry values: unchanged
+        np.testing.assert_array_equal(spy.call_args_list[1].args[0], modh)
+
+        spy.reset_mock()
+        m = np.where(modh < 40, 0.0, modh)
+        BiasAdjustment(o, m, seed=0, adapt_freq=True).fit()
+        adapted = spy.call_args_list[1].args[0]
+        assert abs(np.mean(adapted <= 0) - np.mean(o <= 0)) < 0.02
+
+    @pytest.mark.parametrize("method", ["qm", "dqm", "qdm.abs"])
+    def test_method_adjust_output(self, method):
+        o, m, d = (np.stack([x, x[::-1]]) for x in [obs, modh, modf])
+        obj = BiasAdjustment(o, m, axis=-1)
+        expected = obj.adjust(d, method=method)
+        out = np.empty(d.shape, dtype=np.float32)
+        assert obj.adjust(d, method=method, out=out, dtype=np.float32) is out
+        np.testing.assert_array_equal(out, expected.astype(np.float32))
+
+    def test_method_adjust_list(self, mocker):
+        methods = ["qm", "dqm.abs", "qdm.rel", "qdm.abs", "qdm"]
+        obj = BiasAdjustment(obs, modh)
+        expected = {m: obj.adjust(modf, method=m) for m in methods}
+        spy = mocker.spy(QuantileMapping, "generate_distribution")
+        res = obj.adjust(modf, method=methods)
+        assert list(res) == methods
+        for m in methods:
+            np.testing.assert_array_equal(res[m], expected[m])
+        # the future distribution is fitted once for all QDM modes
+        assert spy.call_count == 1
+        with pytest.raises(ValueError):
+            obj.adjust(modf, method=methods, out=np.empty_like(modf))
+
+    def test_method_adjust_window(self):
+        obj = BiasAdjustment(obs, modh)
+        expected = QuantileDeltaMapping(obs, modh, modf, window=3000).compute()
+        res = obj.adjust(modf, method=["qdm.rel", "qdm.abs"], window=3000)
+        np.testing.assert_array_equal(res["qdm.rel"], expected)
+        np.testing.assert_array_equal(
+            obj.adjust(modf, method="qdm", window=3000), expected
+        )
+        for method in ["qm", ["qm", "qdm"]]:
+            with pytest.raises(ValueError):
+                obj.adjust(modf, method=method, window=3000)
+
+    @pytest.mark.parametrize(
+        "method", ["qm", "dqm.rel", "qdm.abs"], ids=["qm", "dqm.rel", "qdm.abs"]
+    )
+    @pytest.mark.parametrize(
+        "dist_type", ["hist", "empirical", "gamma.fast"], ids=lambda d: d
+    )
+    def test_method_adjust_mask(self, method, dist_type):
+        o, m, d = (np.stack([v, v[::-1], v], axis=1) for v in [obs, modh, modf])
+        o[:, 2] = np.nan
+        mask = np.array([True, False, True])
+        res = BiasAdjustment(o, m, mask=mask, seed=1).adjust(
+            d, method=method, dist_type=dist_type
+        )
+        expected = BiasAdjustment(o[:, :1], m[:, :1], seed=1).adjust(
+            d[:, :1], method=method, dist_type=dist_type
+        )
+        np.testing.assert_array_equal(res[:, :1], expected)
+        assert np.isnan(res[:, 1:]).all()
+
+    @pytest.mark.parametrize(
+        "grid, mask, error",
+        [
+            (False, np.ones(2, dtype=bool), ValueError),
+            (True, [True, False], TypeError),
+            (True, np.ones(2), TypeError),
+            (True, np.ones(3, dtype=bool), ValueError),
+        ],
+        ids=["mask: 1-D data", "mask: list", "mask: not boolean", "mask: wrong shape"],
+    )
+    def test_init_mask(self, grid, mask, error):
+        o, m = obs, modh
+        if grid:
+            o, m = (np.stack([v, v[::-1]], axis=1) for v in [obs, modh])
+        with pytest.raises(error):
+            BiasAdjustment(o, m, mask=mask)
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+from bias_adjustment import BiasAdjustment
+from bias_adjustment.cli import main
+from tests.data import modf, modh, obs
+
+n = 1000
+o = np.stack([obs[:n] * (1 + i / 10) for i in range(6)], axis=1).reshape(n, 2, 3)
+m = np.stack([np.roll(modh[:n], i) for i in range(6)], axis=1).reshape(n, 2, 3)
+d = np.stack([np.roll(modf[:n], i) for i in range(6)], axis=1).reshape(n, 2, 3)
+
+
+def _save_npy(tmp_path):
+    paths = []
+    for name, arr in [("obs", o), ("mod", m), ("data", d)]:
+        np.save(tmp_path / f"{name}.npy", arr)
+        paths.append(str(tmp_path / f"{name}.npy"))
+    return paths
+
+
+@pytest.mark.parametrize(
+    "args, params",
+    [
+        ([], {}),
+        (["-m", "qdm.rel", "--seed", "3"], {"method": "qdm.rel", "seed": 3}),
+        (["-j", "2"], {}),
+        (["--dtype", "float32"], {}),
+    ],
+    ids=["default", "method", "workers", "dtype"],
+)
+def test_npy(tmp_path, args, params):
+    out = tmp_path / "out.npy"
+    assert main(_save_npy(tmp_path) + ["-o", str(out), "--tile-size", "4"] + args) == 0
+    method = params.pop("method", "qm")
+    expected = BiasAdjustment(o, m, **params).adjust_many(
+        d, method=method, n_workers=1, chunk_size=4
+    )
+    res = np.load(out)
+    if "float32" in args:
+        assert res.dtype == np.float32
+        expected = expected.astype(np.float32)
+    np.testing.assert_array_equal(res, expected)
+
+
+def test_csv(tmp_path):
+    paths = []
+    for name, arr in [("obs", o), ("mod", m), ("data", d)]:
+        path = tmp_path / f"{name}.csv"
+        np.savetxt(path, arr.reshape(n, -1), delimiter=",", header="a,b,c,d,e,f")
+        paths.append(str(path))
+    out = tmp_path / "out.csv"
+    main(paths + ["-o", str(out), "-d", "empirical"])
+    expected = BiasAdjustment(o.reshape(n, -1), m.reshape(n, -1)).adjust_many(
+        d.reshape(n, -1), dist_type="empirical", n_workers=1, chunk_size=1024
+    )
+    assert out.read_text().startswith("# a,b,c,d,e,f\n")
+    np.testing.assert_allclose(np.loadtxt(out, delimiter=","), expected)
+
+
+def test_netcdf(tmp_path):
+    xr = pytest.importorskip("xarray")
+    pytest.importorskip("dask")
+    from bias_adjustment.xarray import adjust
+
+    datasets = {}
+    for name, arr, start in [("obs", o, 0), ("mod", m, 0), ("data", d, 5000)]:
+        ds = xr.Dataset(
+            {"pr": (("time", "lat", "lon"), arr), "tas": (("time", "lat", "lon"), arr)},
+            coords={"time": np.arange(start, start + n)},
+        )
+        ds.to_netcdf(tmp_path / f"{name}.nc")
+        datasets[name] = ds
+    out = tmp_path / "out.nc"
+    args = ["-v", "pr", "--tile-size", "2", "-j", "2"]
+    main([str(tmp_path / f"{name}.nc") for name in datasets] + ["-o", str(out)] + args)
+    with xr.open_dataset(out) as res:
+        assert list(res.data_vars) == ["pr"]
+        expected = adjust(*(ds.pr for ds in datasets.values()))
+        xr.testing.assert_equal(res.pr, expected)
+
+
+def test_netcdf_adapt_freq(tmp_path):
+    xr = pytest.importorskip("xarray")
+    pytest.importorskip("dask")
+
+    paths = []
+    for name, arr in [("obs", o), ("mod", m), ("data", d)]:
+        arr = arr.copy()
+        if name == "mod":
+            # more dry values than obs, so that the adaptation changes mod
+            arr[arr < np.quantile(arr, 0.3)] = 0
+        paths.append(str(tmp_path / f"{name}.nc"))
+        xr.Dataset({"pr": (("time", "lat", "lon"), arr)}).to_netcdf(paths[-1])
+    res = {}
+    for label, args in [
+        ("plain", []),
+        ("adapted", ["--adapt-freq", "--seed", "1"]),
+        ("again", ["--adapt-freq", "--seed", "1"]),
+    ]:
+        out = tmp_path / f"{label}.nc"
+        main(paths + ["-o", str(out), "-d", "empirical"] + args)
+        with xr.open_dataset(out) as ds:
+            res[label] = ds.pr.values
+    assert not np.array_equal(res["adapted"], res["plain"], equal_nan=True)
+    np.testing.assert_array_equal(res["adapted"], res["again"])
+
+
+@pytest.mark.parametrize(
+    "args, code",
+    [
+        (["-m", "eqm"], 2),
+        (["--tile-size", "0"], 2),
+        (["-v", "pr"], 1),
+        (["-d", "unknown"], 1),
+    ],
+    ids=["unknown method", "tile-size: zero", "var: arrays", "unknown dist_type"],
+)
+def test_errors(tmp_path, args, code):
+    with pytest.raises(SystemExit) as e:
+        main(_save_npy(tmp_path) + ["-o", str(tmp_path / "out.npy")] + args)
+    assert e.value.code == code
+
+
+def test_mixed_formats(tmp_path):
+    obs_path, mod_path, data_path = _save_npy(tmp_path)
+    with pytest.raises(SystemExit) as e:
+        main([obs_path, mod_path, data_path, "-o", str(tmp_path / "out.nc")])
+    assert e.value.code == 1
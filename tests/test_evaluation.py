@@ -0,0 +1,160 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from bias_adjustment import BiasAdjustment
+from bias_adjustment.evaluation import (
+    cross_validate,
+    kfold,
+    ks_distance,
+    skill,
+    year_folds,
+)
+from tests.data import modh, obs
+
+n_days = 20 * 365
+time = np.arange("1981-01-01", n_days, dtype="datetime64[D]")
+o, m = obs[:n_days], modh[:n_days]
+rng = np.random.default_rng(42)
+o_grid = np.stack([o, rng.permutation(o), np.roll(o, 100)], axis=1)
+m_grid = np.stack([m, rng.permutation(m), np.roll(m, 100)], axis=1)
+
+
+def test_folds():
+    folds = kfold(10, 3)
+    assert [len(f) for f in folds] == [4, 3, 3]
+    np.testing.assert_array_equal(np.concatenate(folds), np.arange(10))
+
+    folds = year_folds(time, years=5)
+    assert len(folds) == 4
+    years = time[folds[1]].astype("datetime64[Y]").astype(int) + 1970
+    assert (years.min(), years.max()) == (1986, 1990)
+    np.testing.assert_array_equal(np.concatenate(folds), np.arange(n_days))
+
+
+@pytest.mark.parametrize(
+    "func, args, error",
+    [
+        (kfold, (10, 1), ValueError),
+        (kfold, (10, 2.0), TypeError),
+        (year_folds, (np.arange(10),), TypeError),
+        (year_folds, (time, 0), ValueError),
+    ],
+    ids=["kfold: one fold", "kfold: wrong type", "year: no dates", "year: zero"],
+)
+def test_folds_errors(func, args, error):
+    with pytest.raises(error):
+        func(*args)
+
+
+def test_ks_distance():
+    a, b = np.round(o_grid[:1000], 0), o_grid[1000:1500].copy()
+    b[:100, 1] = np.nan
+    expected = [
+        stats.ks_2samp(a[:, i], b[~np.isnan(b[:, i]), i]).statistic for i in range(3)
+    ]
+    np.testing.assert_allclose(ks_distance(a, b), expected)
+    assert ks_distance(a[:, 0], b[:, 0]) == pytest.approx(expected[0])
+    b[:, 2] = np.nan
+    assert np.isnan(ks_distance(a, b)[2])
+
+
+def test_skill():
+    res = skill(m_grid, o_grid)
+    assert set(res) == {
+        "mean_bias",
+        "q0.1_bias",
+        "q0.5_bias",
+        "q0.9_bias",
+        "q0.99_bias",
+        "ks",
+        "wet_freq_bias",
+    }
+    np.testing.assert_allclose(res["mean_bias"], m_grid.mean(0) - o_grid.mean(0))
+    np.testing.assert_allclose(
+        res["q0.9_bias"],
+        np.quantile(m_grid, 0.9, axis=0) - np.quantile(o_grid, 0.9, axis=0),
+    )
+    np.testing.assert_allclose(
+        res["wet_freq_bias"], np.mean(m_grid > 0.05, 0) - np.mean(o_grid > 0.05, 0)
+    )
+    assert skill(m, o, ["ks"]) == {"ks": pytest.approx(res["ks"][0])}
+    with pytest.raises(ValueError):
+        skill(m, o, ["rmse"])
+
+
+@pytest.mark.parametrize(
+    "data, kwargs",
+    [
+        ((o, m), {}),
+        ((o_grid, m_grid), {}),
+        ((o_grid, m_grid), {"mask": np.array([True, False, True])}),
+        ((o_grid.T, m_grid.T), {"axis": 1}),
+    ],
+    ids=["series", "grid", "grid: masked", "grid: axis"],
+)
+def test_cross_validate(data, kwargs):
+    records = cross_validate(*data, ["raw", "qm", "qdm.rel"], folds=4, **kwargs)
+    assert len(records) == 4 * 3 * 7
+    assert set(records[0]) == {"fold", "method", "dist_type", "metric", "value"}
+    ks = {
+        method: np.mean(
+            [
+                r["value"]
+                for r in records
+                if (r["method"], r["metric"]) == (method, "ks")
+            ]
+        )
+        for method in ["raw", "qm", "qdm.rel"]
+    }
+    assert ks["qm"] < ks["raw"]
+    assert ks["qdm.rel"] < ks["raw"]
+
+
+@pytest.mark.parametrize("dist_type", ["hist", "gamma.fast"])
+def test_cross_validate_refit(dist_type):
+    """Every fold scores like a plain refit on its training time steps"""
+    folds = year_folds(time, 5)
+    methods = ["qm", "dqm.rel"]
+    records = cross_validate(o, m, methods, [dist_type], folds=folds)
+    for fold, test in enumerate(folds):
+        train = np.delete(np.arange(n_days), test)
+        ba = BiasAdjustment(o[train], m[train])
+        res = ba.adjust(m[test], methods, dist_type)
+        for method in methods:
+            expected = skill(res[method], o[test])
+            for r in records:
+                if (r["fold"], r["method"]) == (fold, method):
+                    assert r["value"] == pytest.approx(expected[r["metric"]])
+
+
+def test_cross_validate_parallel():
+    serial = cross_validate(o_grid, m_grid, ["qm"], ["hist", "gamma.fast"])
+    for executor in ["thread", "process"]:
+        assert (
+            cross_validate(
+                o_grid,
+                m_grid,
+                ["qm"],
+                ["hist", "gamma.fast"],
+                n_workers=2,
+                executor=executor,
+            )
+            == serial
+        )
+
+
+@pytest.mark.parametrize(
+    "args, kwargs, error",
+    [
+        ((o.tolist(), m), {}, TypeError),
+        ((o, m[:-1]), {}, ValueError),
+        ((o, m), {"executor": "cluster"}, ValueError),
+        ((o, m), {"n_workers": 0}, ValueError),
+        ((o, m), {"n_workers": 1.5}, TypeError),
+    ],
+    ids=["not arrays", "different lengths", "executor", "n_workers", "n_workers type"],
+)
+def test_cross_validate_errors(args, kwargs, error):
+    with pytest.raises(error):
+        cross_validate(*args, **kwargs)
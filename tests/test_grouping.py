@@ -0,0 +1,157 @@
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from bias_adjustment import BiasAdjustment, GroupedAdjustment
+from bias_adjustment.grouping import GroupIndex, group_keys, parse_group
+from tests.data import modf, modh, obs
+
+n_days = 20 * 365
+time = np.arange("1981-01-01", n_days, dtype="datetime64[D]")
+f_time = np.arange("2041-01-01", n_days, dtype="datetime64[D]")
+o, m, d = obs[:n_days], modh[:n_days], modf[:n_days]
+
+
+@pytest.mark.parametrize(
+    "spec, expected, error",
+    [
+        ("month", ("month", 0), None),
+        ("season", ("season", 0), None),
+        ("doy", ("doy", 0), None),
+        ("doy±15", ("doy", 15), None),
+        ("doy+-15", ("doy", 15), None),
+        ("doy.5", ("doy", 5), None),
+        ("week", None, ValueError),
+        ("doy±200", None, ValueError),
+        (15, None, TypeError),
+    ],
+    ids=[
+        "month",
+        "season",
+        "doy",
+        "doy window",
+        "doy window: ascii",
+        "doy window: dotted",
+        "unknown group",
+        "window: too long",
+        "wrong type",
+    ],
+)
+def test_parse_group(spec, expected, error):
+    if error is None:
+        assert parse_group(spec) == expected
+    else:
+        with pytest.raises(error):
+            parse_group(spec)
+
+
+def test_group_keys():
+    t = np.array(["2000-01-01", "2000-03-01", "2000-12-31", "2001-12-31"], "M8[D]")
+    np.testing.assert_array_equal(group_keys(t, "month"), [1, 3, 12, 12])
+    np.testing.assert_array_equal(group_keys(t, "season"), [0, 1, 0, 0])
+    np.testing.assert_array_equal(group_keys(t, "doy"), [1, 61, 365, 365])
+
+
+@pytest.mark.parametrize("group", ["month", "season", "doy", "doy±15"])
+def test_group_index(group):
+    index = GroupIndex(time, group)
+    kind, half = parse_group(group)
+    keys = group_keys(time, kind)
+    for key, (lo, hi) in index.center.items():
+        np.testing.assert_array_equal(index.order[lo:hi], np.flatnonzero(keys == key))
+        w_lo, w_hi = index.window[key]
+        dist = np.abs((keys - key + 182) % 365 - 182)
+        assert sorted(index.order[w_lo:w_hi]) == list(np.flatnonzero(dist <= half))
+
+
+class TestGroupedAdjustment:
+    @pytest.mark.parametrize(
+        "params, error",
+        [
+            ({}, None),
+            ({"obs": o.tolist()}, TypeError),
+            ({"obs_time": time.astype(str)}, TypeError),
+            ({"mod_time": time[:-1]}, ValueError),
+            ({"group": "week"}, ValueError),
+            ({"mod": np.ones((n_days, 2))}, ValueError),
+        ],
+        ids=[
+            "default",
+            "obs: wrong type",
+            "obs_time: wrong type",
+            "mod_time: wrong length",
+            "group: unknown",
+            "mod: wrong grid shape",
+        ],
+    )
+    def test_init(self, params, error):
+        params = {"obs": o, "mod": m, "obs_time": time, "mod_time": time, **params}
+        if error is None:
+            GroupedAdjustment(**params)
+        else:
+            with pytest.raises(error):
+                GroupedAdjustment(**params)
+
+    @pytest.mark.parametrize("method", ["qm", "dqm.rel", "qdm.abs"])
+    def test_adjust_month(self, method):
+        res = GroupedAdjustment(o, m, time, time).adjust(d, f_time, method=method)
+        month = group_keys(time, "month")
+        expected = np.empty_like(d)
+        for key in range(1, 13):
+            sel = month == key
+            expected[sel] = BiasAdjustment(o[sel], m[sel]).adjust(d[sel], method=method)
+        np.testing.assert_array_equal(res, expected)
+
+    @pytest.mark.parametrize("method", ["qm", "dqm.rel", "qdm.abs"])
+    def test_adjust_window(self, method):
+        obj = GroupedAdjustment(o, m, time, time, "doy±15")
+        res = obj.adjust(d, f_time, method=method)
+        doy = group_keys(time, "doy")
+        for key in [1, 200, 365]:
+            near = np.abs((doy - key + 182) % 365 - 182) <= 15
+            expected = BiasAdjustment(o[near], m[near]).adjust(d[near], method=method)
+            np.testing.assert_allclose(res[doy == key], expected[doy[near] == key])
+
+    def test_adjust_window_center(self):
+        """Only the days of each group are adjusted"""
+        obj = GroupedAdjustment(o, m, time, time, "doy±15")
+        with mock.patch.object(
+            BiasAdjustment, "adjust", autospec=True, side_effect=BiasAdjustment.adjust
+        ) as spy:
+            obj.adjust(d, f_time)
+        assert sum(len(call.args[1]) for call in spy.call_args_list) == n_days
+
+    def test_adjust_doy_leap_day(self):
+        # 27 years: day 366 alone would have 7 values
+        days = 27 * 365 + 7
+        t = np.arange("1981-01-01", days, dtype="datetime64[D]")
+        _o, _m = (np.resize(v, days) for v in [obs, modh])
+        res = GroupedAdjustment(_o, _m, t, t, "doy").adjust(_m, t)
+        assert np.isfinite(res).all()
+
+    def test_adjust_grid(self):
+        og, mg, dg = (np.stack([x, x[::-1]], axis=1) for x in [o, m, d])
+        obj = GroupedAdjustment(og.T, mg.T, time, time, "season", axis=1)
+        res = obj.adjust(dg.T, f_time)
+        assert res.shape == dg.T.shape
+        for i in range(2):
+            expected = GroupedAdjustment(og[:, i], mg[:, i], time, time, "season")
+            np.testing.assert_array_equal(res[i], expected.adjust(dg[:, i], f_time))
+
+    def test_reuse_fits(self):
+        obj = GroupedAdjustment(o, m, time, time, "season")
+        obj.adjust(d, f_time)
+        with mock.patch.object(
+            BiasAdjustment, "fit", autospec=True, side_effect=BiasAdjustment.fit
+        ) as spy:
+            obj.adjust(d[::-1], f_time)
+        assert all(len(ba._cache) == 1 for ba in obj._models.values())
+        assert spy.call_count == 4
+        assert obj.groups == [0, 1, 2, 3]
+
+    def test_missing_group(self):
+        summer = group_keys(time, "month") == 7
+        obj = GroupedAdjustment(o[summer], m[summer], time[summer], time[summer])
+        with pytest.raises(ValueError):
+            obj.adjust(d, f_time)
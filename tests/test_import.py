@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bias_adjustment
+
+
+def _modules_after(code: str) -> set:
+    """Modules loaded by a fresh interpreter after running `code`"""
+    res = subprocess.run(
+        [sys.executable, "-c", f"{code}\nimport sys\nprint(*sys.modules)"],
+        # the optional compiled kernels import numba, and numba scipy
+        env={**os.environ, "BIAS_ADJUSTMENT_NUMBA": "0"},
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return set(res.stdout.split())
+
+
+EMPIRICAL = """
+import numpy as np
+from bias_adjustment import BiasAdjustment
+rng = np.random.default_rng(1)
+obs, mod, data = rng.gamma(1.5, 10.0, (3, 1000, 4))
+BiasAdjustment(obs, mod).adjust(data, method={method!r}, dist_type="empirical")
+"""
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "import bias_adjustment",
+        EMPIRICAL.format(method="qm"),
+        EMPIRICAL.format(method="dqm.rel"),
+        EMPIRICAL.format(method="qdm.abs"),
+    ],
+    ids=["import", "qm: empirical", "dqm: empirical", "qdm: empirical"],
+)
+def test_no_scipy(code):
+    modules = _modules_after(code)
+    assert "scipy" not in modules
+    assert "importlib.metadata" not in modules
+
+
+def test_scipy_on_demand():
+    modules = _modules_after(
+        EMPIRICAL.format(method="qm").replace("empirical", "gamma")
+    )
+    assert "scipy.stats" in modules
+
+
+def test_version():
+    assert isinstance(bias_adjustment.__version__, str)
+    with pytest.raises(AttributeError):
+        _ = bias_adjustment.missing
@@ -0,0 +1,111 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from bias_adjustment import BiasAdjustment, kernels
+from bias_adjustment.distributions import HistogramSketch
+from bias_adjustment.distributions.batched import _hist_table
+from bias_adjustment.quantile_mapping import QuantileTransfer
+from tests.data import modf, modh, obs
+
+pytest.importorskip("numba")
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(kernels, "ENABLED", True)
+
+
+rng = np.random.default_rng(7)
+grid = [
+    np.stack([v, v * 1.5, v[::-1], np.full_like(v, np.nan)], axis=1)
+    for v in [obs, modh, modf]
+]
+
+
+def _both(func, monkeypatch):
+    """`func()` with the compiled kernels and with the NumPy paths"""
+    res = func()
+    monkeypatch.setattr(kernels, "ENABLED", False)
+    expected = func()
+    monkeypatch.setattr(kernels, "ENABLED", True)
+    return res, expected
+
+
+@pytest.mark.parametrize("bins", [5, 200, 1000])
+def test_hist_table(bins):
+    data = rng.gamma(2.0, 2.0, (3000, 6))
+    data[:, 1] = np.nan
+    data[::7, 2] = np.nan
+    data[:, 3] = 1.0
+    for res, expected in zip(kernels.hist_table(data, bins), _hist_table(data, bins)):
+        np.testing.assert_array_equal(res, expected)
+
+
+@pytest.mark.parametrize(
+    "data, kwargs",
+    [
+        ((obs, modh, modf), {}),
+        (grid, {}),
+        (grid, {"mask": np.array([True, False, True, True])}),
+        ((obs, modh, modf), {"tail": "linear"}),
+        ((obs, modh, modf), {"ignore_trace": True}),
+    ],
+    ids=["series", "grid", "grid: masked", "tail", "ignore trace"],
+)
+@pytest.mark.parametrize("dist_type", ["hist", "empirical"])
+def test_adjust(data, kwargs, dist_type, monkeypatch):
+    methods = ["qm", "dqm.rel", "dqm.abs"]
+    if "tail" not in kwargs:
+        methods += ["qdm.rel", "qdm.abs"]
+    ignore_trace = kwargs.pop("ignore_trace", False)
+
+    def adjust():
+        ba = BiasAdjustment(*data[:2], seed=1, **kwargs)
+        return ba.adjust(data[2], methods, dist_type, ignore_trace)
+
+    res, expected = _both(adjust, monkeypatch)
+    for method in methods:
+        np.testing.assert_array_equal(res[method], expected[method])
+
+
+def test_qdm_window(monkeypatch):
+    def adjust():
+        ba = BiasAdjustment(*grid[:2])
+        return ba.adjust(grid[2], "qdm.rel", window=3000, step=1000)
+
+    np.testing.assert_array_equal(*_both(adjust, monkeypatch))
+
+
+def test_sketch_transfer(monkeypatch):
+    o, m = (HistogramSketch.from_data(arr) for arr in grid[:2])
+    transfer = QuantileTransfer(o, m)
+    np.testing.assert_array_equal(
+        *_both(lambda: transfer.transform(grid[2]), monkeypatch)
+    )
+
+
+def test_disk_cache(tmp_path):
+    """A second process loads the compiled kernels instead of compiling them"""
+    code = (
+        "import numpy as np\n"
+        "from bias_adjustment import kernels\n"
+        "kernels.hist_table(np.ones((20, 2)), 5)"
+    )
+    env = {**os.environ, "NUMBA_CACHE_DIR": str(tmp_path), "NUMBA_DEBUG_CACHE": "1"}
+    runs = [
+        subprocess.run(
+            [sys.executable, "-c", code],
+            env=env,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        for _ in range(2)
+    ]
+    assert "data saved" in runs[0]
+    assert "data saved" not in runs[1]
+    assert "data loaded" in runs[1]
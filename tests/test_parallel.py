@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from bias_adjustment import BiasAdjustment
+from tests.data import modf, modh, obs
+
+n_cells = 5
+o = np.stack([np.roll(obs, i) * (1 + i / 10) for i in range(n_cells)], axis=1)
+m = np.stack([np.roll(modh, i) for i in range(n_cells)], axis=1)
+d = np.stack([np.roll(modf, i) for i in range(n_cells)], axis=1)
+
+
+@pytest.mark.parametrize(
+    "method, dist_type",
+    [("qm", "hist"), ("qdm.rel", "hist"), ("dqm.abs", "norm")],
+    ids=["method: qm", "method: qdm.rel", "dist_type: norm"],
+)
+def test_adjust_many(method, dist_type):
+    obj = BiasAdjustment(o, m)
+    expected = obj.adjust(d, method=method, dist_type=dist_type)
+    res = obj.adjust_many(
+        d, method=method, dist_type=dist_type, n_workers=2, chunk_size=2
+    )
+    np.testing.assert_allclose(res, expected)
+
+
+def test_adjust_many_axis():
+    obj = BiasAdjustment(o.T, m.T, axis=1)
+    res = obj.adjust_many(d.T, n_workers=1)
+    np.testing.assert_array_equal(res, obj.adjust(d.T))
+
+
+@pytest.mark.parametrize("seed", [1, None], ids=["seeded", "unseeded"])
+def test_adjust_many_ignore_trace(seed):
+    _o, _m, _d = (np.where(v < np.quantile(v, 0.2), 0.01, v) for v in [o, m, d])
+    obj = BiasAdjustment(_o, _m, seed=seed)
+    res = [
+        obj.adjust_many(_d, ignore_trace=True, n_workers=2, chunk_size=2)
+        for _ in range(2)
+    ]
+    # unseeded runs draw fresh trace values
+    assert np.array_equal(*res) == (seed is not None)
+
+
+@pytest.mark.parametrize(
+    "params, error",
+    [
+        ({"data": modf}, TypeError),
+        ({"data": d[:, :2]}, ValueError),
+        ({"data": d, "n_workers": 0}, ValueError),
+        ({"data": d, "n_workers": "2"}, TypeError),
+        ({"data": d, "chunk_size": 0}, ValueError),
+    ],
+    ids=[
+        "data: not gridded",
+        "data: grid shape mismatch",
+        "n_workers: should be >= 1",
+        "n_workers: wrong type",
+        "chunk_size: should be >= 1",
+    ],
+)
+def test_adjust_many_errors(params, error):
+    with pytest.raises(error):
+        BiasAdjustment(o, m).adjust_many(**params)
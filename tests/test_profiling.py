@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+import pytest
+
+from bias_adjustment import BiasAdjustment, kernels
+from bias_adjustment.profiling import Profile, _profiles, stage, timed
+from tests.data import modf, modh, obs
+
+
+@pytest.mark.parametrize(
+    "method, stages",
+    [
+        ("qm", ["validate", "generate_distribution", "fit.hist", "compute.qm"]),
+        ("dqm", ["compute.dqm", "cdf", "ppf"]),
+        ("qdm.abs", ["compute.qdm", "cdf", "ppf"]),
+    ],
+    ids=["method: qm", "method: dqm", "method: qdm.abs"],
+)
+def test_profile(method, stages, monkeypatch):
+    monkeypatch.setattr(kernels, "ENABLED", False)
+    with Profile() as prof:
+        BiasAdjustment(obs, modh).adjust(modf, method=method)
+    assert not _profiles
+    for name in stages:
+        assert name in prof.stages
+    assert prof.stages["generate_distribution"]["calls"] == (
+        3 if method.startswith("qdm") else 2
+    )
+    assert prof.stages["cdf"]["size"] == modf.size
+    summary = prof.summary()
+    times = [stats["time"] for stats in summary.values()]
+    assert times == sorted(times, reverse=True)
+
+
+@pytest.mark.parametrize("method", ["qm", "dqm", "qdm.abs"])
+def test_profile_kernels(method, monkeypatch):
+    pytest.importorskip("numba")
+    monkeypatch.setattr(kernels, "ENABLED", True)
+    with Profile() as prof:
+        BiasAdjustment(obs, modh).adjust(modf, method=method)
+    assert prof.stages["transfer"]["size"] == modf.size
+    assert "cdf" not in prof.stages
+
+
+def test_profile_inactive():
+    prof = Profile()
+    BiasAdjustment(obs, modh).adjust(modf)
+    assert prof.stages == {}
+    assert stage("cdf") is stage("ppf")
+
+
+def test_profile_nested(tmp_path):
+    with Profile() as outer:
+        BiasAdjustment(obs, modh).fit("norm")
+        with Profile() as inner:
+            BiasAdjustment(obs, modh).fit("norm")
+    assert outer.stages["fit.norm"]["calls"] == 4
+    assert inner.stages["fit.norm"]["calls"] == 2
+
+    path = tmp_path / "profile.json"
+    res = json.loads(outer.to_json(path))
+    assert res == json.loads(path.read_text())
+    assert res["fit.norm"]["size"] == 2 * (obs.size + modh.size)
+
+
+def test_timed():
+    @timed("scale.{factor}")
+    def scale(data, factor=2):
+        return data * factor
+
+    with Profile() as prof:
+        scale(np.ones(5))
+        scale(np.ones(3), factor=3)
+    assert prof.stages["scale.2"]["size"] == 5
+    assert prof.stages["scale.3"]["calls"] == 1
@@ -1,6 +1,13 @@
+import numpy as np
 import pytest
 
-from bias_adjustment.utils import rand_trace
+from bias_adjustment.utils import (
+    adapt_freq,
+    jitter_trace,
+    map_blocks,
+    rand_trace,
+    valid_cells,
+)
 
 
 def test_rand_trace():
@@ -9,3 +16,69 @@ def test_rand_trace():
     assert rand_trace(trace_val) < trace_val
     with pytest.raises(TypeError):
         rand_trace("0.8")
+
+
+def test_jitter_trace():
+    data = np.array([0.0, -1.0, 0.01, 0.02, 1.0, np.nan])
+    res = jitter_trace(data, 0.05, np.random.default_rng(0))
+    assert np.isnan(res[[0, 1, 5]]).all()
+    assert (res[2:4] > 0).all() and (res[2:4] < 0.05).all()
+    assert res[2] != res[3]
+    assert res[4] == 1.0
+    np.testing.assert_array_equal(res, jitter_trace(data, 0.05, 0))
+
+    out = data.copy()
+    assert jitter_trace(out, 0.05, 0, out=out) is out
+    np.testing.assert_array_equal(out, res)
+
+
+def test_adapt_freq():
+    rng = np.random.default_rng(0)
+    wet = rng.gamma(0.8, 5, (5000, 2))
+    obs = np.where(rng.random((5000, 2)) < 0.5, 0.0, wet)
+    mod = np.where(rng.random((5000, 2)) < [0.8, 0.3], 0.0, wet)
+    res = adapt_freq(obs, mod, 0)
+    p0_obs, p0_res = (obs <= 0).mean(axis=0), (res <= 0).mean(axis=0)
+    assert abs(p0_res[0] - p0_obs[0]) < 0.02
+    # fewer dry values than obs: unchanged
+    np.testing.assert_array_equal(res[:, 1], mod[:, 1])
+    # wet values are unchanged
+    np.testing.assert_array_equal(res[mod > 0], mod[mod > 0])
+    np.testing.assert_array_equal(
+        adapt_freq(obs[:, 0], mod[:, 0], 0), adapt_freq(obs[:, :1], mod[:, :1], 0)[:, 0]
+    )
+
+
+@pytest.mark.parametrize("axis", [0, 1], ids=["axis: 0", "axis: 1"])
+def test_map_blocks(axis):
+    data = np.arange(60.0).reshape(6, 10)
+    out = np.empty(data.shape, dtype=np.float32)
+    blocks = []
+
+    def func(block):
+        blocks.append(block.shape)
+        assert block.dtype == np.float64
+        return block * 2
+
+    assert map_blocks(func, data, out, axis=axis, block_size=12) is out
+    np.testing.assert_array_equal(out, data * 2)
+    n_cells = data.shape[1 - axis]
+    assert all(shape[1] == n_cells and shape[0] * n_cells <= 12 for shape in blocks)
+
+
+def test_valid_cells():
+    obs = np.ones((20, 2, 3))
+    mod = np.ones((20, 2, 3))
+    assert valid_cells(obs, mod) is None
+    obs[:, 0, 0] = np.nan
+    mod[:11, 1, 2] = np.nan
+    expected = [False, True, True, True, True, False]
+    np.testing.assert_array_equal(valid_cells(obs, mod), expected)
+    mask = np.ones((2, 3), dtype=bool)
+    mask[0, 1] = False
+    expected[1] = False
+    np.testing.assert_array_equal(valid_cells(obs, mod, mask=mask), expected)
+    np.testing.assert_array_equal(
+        valid_cells(obs.transpose(1, 0, 2), mod.transpose(1, 0, 2), axis=1, mask=mask),
+        expected,
+    )
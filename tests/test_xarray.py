@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from bias_adjustment import BiasAdjustment
+from tests.data import modf, modh, obs
+
+xr = pytest.importorskip("xarray")
+pytest.importorskip("dask")
+ba_xr = pytest.importorskip("bias_adjustment.xarray")
+
+n = 1000
+o = np.stack([obs[:n] * (1 + i / 10) for i in range(6)]).reshape(2, 3, n)
+m = np.stack([np.roll(modh[:n], i) for i in range(6)]).reshape(2, 3, n)
+d = np.stack([np.roll(modf[:n], i) for i in range(6)]).reshape(2, 3, n)
+
+
+def _da(values, start):
+    return xr.DataArray(
+        values,
+        dims=["lat", "lon", "time"],
+        coords={
+            "lat": [10.0, 11.0],
+            "lon": [120.0, 121.0, 122.0],
+            "time": np.arange(start, start + n),
+        },
+    )
+
+
+@pytest.mark.parametrize(
+    "method", ["qm", "dqm.rel", "qdm.abs"], ids=["qm", "dqm.rel", "qdm.abs"]
+)
+def test_adjust(method):
+    expected = BiasAdjustment(o, m, axis=-1).adjust(d, method=method)
+    res = ba_xr.adjust(_da(o, 0), _da(m, 0), _da(d, n), method=method)
+    assert res.dims == ("lat", "lon", "time")
+    np.testing.assert_allclose(res.values, expected)
+    np.testing.assert_array_equal(res["time"], np.arange(n, 2 * n))
+
+
+def test_adjust_lazy():
+    import dask
+
+    expected = BiasAdjustment(o, m, axis=-1).adjust(d)
+    data = _da(d, n).transpose("time", "lat", "lon").chunk({"time": 100})
+    res = ba_xr.adjust(_da(o, 0), _da(m, 0), data, chunks={"lon": 1})
+    assert res.dims == ("time", "lat", "lon")
+    assert res.chunks is not None
+    with dask.config.set(scheduler="synchronous"):
+        values = res.compute().values
+    np.testing.assert_allclose(values, np.moveaxis(expected, -1, 0))
+
+
+def test_adjust_seed():
+    # both lat chunks have the same inputs, but draw different trace values
+    o2, m2, d2 = (np.stack([v[0], v[0]]) for v in [o, m, d])
+    for arr in [o2, m2, d2]:
+        arr[arr < np.quantile(arr, 0.2)] = 0.01
+    res = ba_xr.adjust(
+        _da(o2, 0),
+        _da(m2, 0),
+        _da(d2, n),
+        ignore_trace=True,
+        chunks={"lat": 1},
+        seed=1,
+    ).values
+    assert not np.array_equal(res[0], res[1])
+    for i in range(2):
+        ba = BiasAdjustment(o2[i], m2[i], axis=-1, seed=[1, 3 * i])
+        np.testing.assert_array_equal(res[i], ba.adjust(d2[i], ignore_trace=True))
+
+
+@pytest.mark.parametrize(
+    "params, error",
+    [
+        ({"obs": o}, TypeError),
+        ({"dim": "t"}, ValueError),
+    ],
+    ids=["obs: wrong type", "dim: missing"],
+)
+def test_adjust_errors(params, error):
+    kwargs = {"obs": _da(o, 0), "mod": _da(m, 0), "data": _da(d, n), **params}
+    with pytest.raises(error):
+        ba_xr.adjust(**kwargs)